@@ -1,13 +1,23 @@
 #!/usr/bin/env python3
 """
 Script to analyze the distribution of components and UI types across all forms.
-Analyzes both manual_config.json and llm_generated_config.json from the public folder.
+Analyzes both manual_config.json and llm_generated_config.json from the public folder,
+or the config files given on the command line.
+
+Forms are streamed one at a time, from a top-level JSON object or from JSONL
+(one form, or one form_store {"id", "form"} record, per line), into counters
+and histograms, so memory stays flat however large the corpus grows. A form ID
+that appears twice in one stream is counted twice; form_lint.py reports those.
+
+    python check_distribution.py [public/manual_config.json ...] [.form_store/llm_generated_config/seg-*.jsonl]
 """
 
+import argparse
 import json
+import re
 from collections import defaultdict, Counter
 from pathlib import Path
-from typing import Dict, Any, List
+from typing import Dict, Any, Iterable, Iterator, List, Mapping, Optional, TextIO, Tuple, Union
 import os
 
 # Path to config files
@@ -25,25 +35,153 @@ LAYOUTS = ["single-column", "two-column", "split-screen", "wizard-style", "websi
 # Valid form types
 FORM_TYPES = ["single-page", "multipage"]
 
+# Characters read at a time when streaming a JSON object; a form larger than this grows the buffer
+READ_CHUNK_SIZE = 1 << 16
+
+_WS_RE = re.compile(r'[ \t\n\r]*')
+_NUMBER_CHARS = frozenset('0123456789.eE+-')
+
+
+def _iter_json_object(f: TextIO, chunk_size: int = READ_CHUNK_SIZE) -> Iterator[Tuple[str, Any]]:
+    """
+    (key, value) of each member of the top-level JSON object in `f`, decoding
+    one value at a time with json's raw_decode over a buffer that grows until
+    the value fits. Only the current value is held in memory. Errors raise
+    ValueError with json's message and position in the whole file.
+    """
+    decoder = json.JSONDecoder()
+    buf = ''
+    pos = 0
+    # Text already dropped from the front of buf: its length, newline count, and where its last line starts
+    dropped = 0
+    lines = 0
+    line_start = 0
+
+    def read_more() -> bool:
+        nonlocal buf, pos, dropped, lines, line_start
+        # Read at least as much as is buffered, so a large value takes O(log n) decode attempts
+        chunk = f.read(max(chunk_size, len(buf) - pos))
+        if not chunk:
+            return False
+        newline = buf.rfind('\n', 0, pos)
+        if newline >= 0:
+            lines += buf.count('\n', 0, pos)
+            line_start = dropped + newline + 1
+        dropped += pos
+        buf = buf[pos:] + chunk
+        pos = 0
+        return True
+
+    def error(msg: str, at: int) -> ValueError:
+        newline = buf.rfind('\n', 0, at)
+        start = dropped + newline + 1 if newline >= 0 else line_start
+        lineno = lines + buf.count('\n', 0, at) + 1
+        return ValueError(f"{msg}: line {lineno} column {dropped + at - start + 1} (char {dropped + at})")
+
+    def next_char() -> str:
+        # Skip whitespace; '' at the end of the file
+        nonlocal pos
+        pos = _WS_RE.match(buf, pos).end()
+        while pos == len(buf):
+            if not read_more():
+                return ''
+            pos = _WS_RE.match(buf, pos).end()
+        return buf[pos]
+
+    def decode() -> Any:
+        # raw_decode stops a number at the first character it cannot take, so "1" of a "1.5e3"
+        # cut after "1." or "1.5e" looks complete; such a value is decoded again once more is read
+        nonlocal pos
+        while True:
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError as e:
+                if not read_more():
+                    raise error(e.msg, e.pos) from None
+                continue
+            if (end < len(buf) and buf[end] not in _NUMBER_CHARS) or not read_more():
+                pos = end
+                return value
+
+    char = next_char()
+    if char != '{':
+        raise error("Expecting value" if char == '' else "Config must be a JSON object of forms keyed by ID", pos)
+    pos += 1
+    if next_char() == '}':
+        pos += 1
+    else:
+        while True:
+            if next_char() != '"':
+                raise error("Expecting property name enclosed in double quotes", pos)
+            key = decode()
+            if next_char() != ':':
+                raise error("Expecting ':' delimiter", pos)
+            pos += 1
+            next_char()
+            yield key, decode()
+            char = next_char()
+            if char == '}':
+                pos += 1
+                break
+            if char != ',':
+                raise error("Expecting ',' delimiter", pos)
+            pos += 1
+    if next_char() != '':
+        raise error("Extra data", pos)
+
 
-def load_json_file(file_path: Path) -> Dict[str, Any]:
-    """Load a JSON file and return its contents."""
+def _iter_jsonl(f: TextIO) -> Iterator[Tuple[str, Any]]:
+    """(form ID, form) per line: a form_store {"id", "form"} record or a bare form with an "id"."""
+    for lineno, text in enumerate(f, start=1):
+        if not text.strip():
+            continue
+        try:
+            record = json.loads(text)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"{e.msg}: line {lineno} column {e.colno}") from None
+        if isinstance(record, dict) and set(record) == {"id", "form"}:
+            yield record["id"], record["form"]
+        else:
+            yield (record.get("id") if isinstance(record, dict) else None), record
+
+
+def iter_forms(file_path: Path) -> Iterator[Tuple[str, Any]]:
+    """Stream (form ID, form) pairs from a JSON config or a .jsonl file, one form in memory at a time."""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        if file_path.suffix == '.jsonl':
+            yield from _iter_jsonl(f)
+        else:
+            yield from _iter_json_object(f)
+
+
+def analyze_file(file_path: Path, source_name: str) -> Optional[Dict[str, Any]]:
+    """Stream one config file through analyze_forms; None if it is missing or not valid JSON."""
     if not file_path.exists():
         print(f"⚠️  Warning: {file_path} not found. Skipping...")
-        return {}
-    
+        return None
+
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except json.JSONDecodeError as e:
+        return analyze_forms(iter_forms(file_path), source_name)
+    except ValueError as e:
         print(f"❌ Error parsing {file_path}: {e}")
-        return {}
+        return None
+
+
+def histogram_mean(histogram: Counter) -> float:
+    """Mean of a {value: count} histogram."""
+    return sum(value * count for value, count in histogram.items()) / sum(histogram.values())
 
 
-def analyze_forms(config: Dict[str, Any], source_name: str) -> Dict[str, Any]:
-    """Analyze a configuration dictionary and return statistics."""
+def analyze_forms(
+    config: Union[Mapping[str, Any], Iterable[Tuple[str, Any]]],
+    source_name: str,
+) -> Dict[str, Any]:
+    """
+    Analyze a configuration dictionary, or a stream of (form ID, form) pairs,
+    and return statistics. Memory does not grow with the number of forms.
+    """
     stats = {
-        'total_forms': len(config),
+        'total_forms': 0,
         'field_types': Counter(),
         'date_styles': Counter(),
         'range_styles': Counter(),
@@ -51,15 +189,17 @@ def analyze_forms(config: Dict[str, Any], source_name: str) -> Dict[str, Any]:
         'form_types': Counter(),
         'total_fields': 0,
         'total_pages': 0,
-        'fields_per_form': [],
-        'pages_per_form': [],
+        'fields_per_form': Counter(),  # histogram: field count -> forms
+        'pages_per_form': Counter(),  # histogram: page count -> forms
         'required_fields': 0,
         'optional_fields': 0,
         'fields_with_options': Counter(),  # Field types that have options
         'date_fields_with_restrictions': Counter(),  # before/after restrictions
     }
     
-    for form_id, form_data in config.items():
+    forms = config.items() if isinstance(config, Mapping) else config
+    for form_id, form_data in forms:
+        stats['total_forms'] += 1
         if not isinstance(form_data, dict):
             continue
         
@@ -75,7 +215,7 @@ def analyze_forms(config: Dict[str, Any], source_name: str) -> Dict[str, Any]:
         pages = form_data.get('pages', [])
         num_pages = len(pages)
         stats['total_pages'] += num_pages
-        stats['pages_per_form'].append(num_pages)
+        stats['pages_per_form'][num_pages] += 1
         
         # Analyze fields
         form_field_count = 0
@@ -119,7 +259,7 @@ def analyze_forms(config: Dict[str, Any], source_name: str) -> Dict[str, Any]:
                     else:
                         stats['range_styles']['not-set'] += 1
         
-        stats['fields_per_form'].append(form_field_count)
+        stats['fields_per_form'][form_field_count] += 1
     
     return stats
 
@@ -135,8 +275,8 @@ def print_statistics(stats: Dict[str, Any], source_name: str):
     print(f"   Total Pages: {stats['total_pages']}")
     print(f"   Total Fields: {stats['total_fields']}")
     if stats['total_forms'] > 0:
-        print(f"   Average Fields per Form: {sum(stats['fields_per_form']) / len(stats['fields_per_form']):.2f}")
-        print(f"   Average Pages per Form: {sum(stats['pages_per_form']) / len(stats['pages_per_form']):.2f}")
+        print(f"   Average Fields per Form: {histogram_mean(stats['fields_per_form']):.2f}")
+        print(f"   Average Pages per Form: {histogram_mean(stats['pages_per_form']):.2f}")
     print(f"   Required Fields: {stats['required_fields']}")
     print(f"   Optional Fields: {stats['optional_fields']}")
     
@@ -202,8 +342,8 @@ def merge_statistics(stats_list: List[Dict[str, Any]]) -> Dict[str, Any]:
         'form_types': Counter(),
         'total_fields': sum(s['total_fields'] for s in stats_list),
         'total_pages': sum(s['total_pages'] for s in stats_list),
-        'fields_per_form': [],
-        'pages_per_form': [],
+        'fields_per_form': Counter(),
+        'pages_per_form': Counter(),
         'required_fields': sum(s['required_fields'] for s in stats_list),
         'optional_fields': sum(s['optional_fields'] for s in stats_list),
         'fields_with_options': Counter(),
@@ -218,33 +358,38 @@ def merge_statistics(stats_list: List[Dict[str, Any]]) -> Dict[str, Any]:
         merged['form_types'].update(stats['form_types'])
         merged['fields_with_options'].update(stats['fields_with_options'])
         merged['date_fields_with_restrictions'].update(stats['date_fields_with_restrictions'])
-        merged['fields_per_form'].extend(stats['fields_per_form'])
-        merged['pages_per_form'].extend(stats['pages_per_form'])
+        merged['fields_per_form'].update(stats['fields_per_form'])
+        merged['pages_per_form'].update(stats['pages_per_form'])
     
     return merged
 
 
 def main():
     """Main function to run the distribution analysis."""
+    parser = argparse.ArgumentParser(description="Analyze the distribution of components and UI types across forms.")
+    parser.add_argument(
+        "configs",
+        nargs="*",
+        type=Path,
+        help="JSON configs or JSONL files to stream (default: the manual and LLM configs in public/)",
+    )
+    args = parser.parse_args()
+    sources = [(path, str(path)) for path in args.configs] or [
+        (MANUAL_CONFIG_PATH, "Manual Config"),
+        (LLM_CONFIG_PATH, "LLM Generated Config"),
+    ]
+
     print("🔍 Form Component Distribution Analyzer")
     print("=" * 80)
     
-    # Load configurations
-    manual_config = load_json_file(MANUAL_CONFIG_PATH)
-    llm_config = load_json_file(LLM_CONFIG_PATH)
-    
-    # Analyze each source
+    # Analyze each source, streaming its forms
     all_stats = []
     
-    if manual_config:
-        manual_stats = analyze_forms(manual_config, "Manual Config")
-        all_stats.append(manual_stats)
-        print_statistics(manual_stats, "Manual Config")
-    
-    if llm_config:
-        llm_stats = analyze_forms(llm_config, "LLM Generated Config")
-        all_stats.append(llm_stats)
-        print_statistics(llm_stats, "LLM Generated Config")
+    for path, source_name in sources:
+        stats = analyze_file(path, source_name)
+        if stats and stats['total_forms']:
+            all_stats.append(stats)
+            print_statistics(stats, source_name)
     
     # Print combined statistics
     if all_stats:
@@ -0,0 +1,154 @@
+"""
+Coverage-driven batch planning for generate_pages.py --coverage.
+
+The corpus counters from check_distribution.analyze_forms are compared with a
+target distribution of field types, layouts and industries. Each planned form
+gets the layout and industry furthest below target, plus a few required field
+types with the largest shortfall. Planned forms are counted as if they had
+already been generated, so one batch spreads over several gaps instead of
+asking for the same rare type five times.
+
+Target files are JSON with optional `field_types`, `layouts` and `industries`
+maps of target fractions; anything left out shares the remaining fraction
+evenly:
+
+    {"field_types": {"reactive-chunks": 0.05, "cvv": 0.04, "date-range": 0.05}}
+"""
+
+import json
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+DEFAULT_REQUIRED_TYPES_PER_FORM = 2
+DEFAULT_FIELDS_PER_FORM = 8.0
+
+
+def normalize_shares(weights: Optional[Dict[str, float]], keys: Sequence[str]) -> Dict[str, float]:
+    """
+    Shares for every key that sum to 1. Listed keys are fractions of the total;
+    unlisted keys split what is left evenly (nothing, if the listed fractions
+    already add up to 1 or more, in which case they are rescaled).
+    """
+    weights = {k: float(v) for k, v in (weights or {}).items() if k in keys}
+    unlisted = [k for k in keys if k not in weights]
+    remainder = max(0.0, 1.0 - sum(weights.values()))
+    for key in unlisted:
+        weights[key] = remainder / len(unlisted)
+    total = sum(weights.values()) or 1.0
+    return {key: weights[key] / total for key in keys}
+
+
+@dataclass
+class CoverageTarget:
+    field_types: Dict[str, float]
+    layouts: Dict[str, float]
+    industries: Dict[str, float]
+
+    @classmethod
+    def load(
+        cls,
+        path: Optional[str],
+        field_types: Sequence[str],
+        layouts: Sequence[str],
+        industries: Sequence[str],
+    ) -> "CoverageTarget":
+        """Read a target file, or use an even mix of everything when `path` is empty."""
+        raw: Dict[str, Any] = {}
+        if path:
+            with open(path, "r", encoding="utf-8") as f:
+                raw = json.load(f)
+        return cls(
+            field_types=normalize_shares(raw.get("field_types"), field_types),
+            layouts=normalize_shares(raw.get("layouts"), layouts),
+            industries=normalize_shares(raw.get("industries"), industries),
+        )
+
+
+def _largest_gaps(counts: Counter, shares: Dict[str, float], total: float) -> List[Tuple[str, float]]:
+    """(key, target count - current count) for every key, largest shortfall first; ties keep target order."""
+    order = {key: i for i, key in enumerate(shares)}
+    gaps = [(key, share * total - counts[key]) for key, share in shares.items()]
+    return sorted(gaps, key=lambda g: (-g[1], order[g[0]]))
+
+
+class CoveragePlanner:
+    """
+    Assigns industries, layouts and required field types to planned forms.
+
+    Works from the corpus counts at start-up plus the expected counts of every
+    form it has planned, so plans are deterministic and do not depend on how
+    many batches run at once.
+    """
+
+    def __init__(
+        self,
+        stats: Dict[str, Any],
+        target: CoverageTarget,
+        industry_counts: Optional[Dict[str, int]] = None,
+        required_types_per_form: int = DEFAULT_REQUIRED_TYPES_PER_FORM,
+    ):
+        self.target = target
+        self.required_types_per_form = required_types_per_form
+        self.field_counts: Counter = Counter({k: float(v) for k, v in stats["field_types"].items()})
+        self.layout_counts: Counter = Counter(stats["layouts"])
+        self.industry_counts: Counter = Counter(industry_counts or {})
+        self.total_forms = stats["total_forms"]
+        self.total_fields = float(stats["total_fields"])
+        self.fields_per_form = (
+            self.total_fields / self.total_forms if self.total_forms else DEFAULT_FIELDS_PER_FORM
+        )
+        # Mix of the fields that are not pinned by required types, from the corpus as it is
+        self._base_mix = {k: v / self.total_fields for k, v in self.field_counts.items()} if self.total_fields else {}
+
+    def assign(self, form_ids: Sequence[str]) -> Tuple[List[str], List[str], List[List[str]]]:
+        """Industries, layouts and required field types for each form ID, in order."""
+        industries: List[str] = []
+        layouts: List[str] = []
+        required_types: List[List[str]] = []
+        for _ in form_ids:
+            forms_after = self.total_forms + 1
+            fields_after = self.total_fields + self.fields_per_form
+
+            layout = _largest_gaps(self.layout_counts, self.target.layouts, forms_after)[0][0]
+            industry = _largest_gaps(self.industry_counts, self.target.industries, forms_after)[0][0]
+            types = [
+                key for key, gap in _largest_gaps(self.field_counts, self.target.field_types, fields_after)
+                if gap > 0
+            ][:self.required_types_per_form]
+
+            self.layout_counts[layout] += 1
+            self.industry_counts[industry] += 1
+            for field_type in types:
+                self.field_counts[field_type] += 1
+            free_fields = max(0.0, self.fields_per_form - len(types))
+            for field_type, share in self._base_mix.items():
+                self.field_counts[field_type] += free_fields * share
+            self.total_forms = forms_after
+            self.total_fields = fields_after
+
+            layouts.append(layout)
+            industries.append(industry)
+            required_types.append(types)
+        return industries, layouts, required_types
+
+    def gap_report(self, limit: int = 8) -> List[Tuple[str, str, float]]:
+        """The largest current shortfalls as (category, key, missing count)."""
+        gaps = [
+            ("field type", key, gap)
+            for key, gap in _largest_gaps(self.field_counts, self.target.field_types, self.total_fields)
+        ] + [
+            ("layout", key, gap)
+            for key, gap in _largest_gaps(self.layout_counts, self.target.layouts, self.total_forms)
+        ]
+        return sorted((g for g in gaps if g[2] >= 0.5), key=lambda g: -g[2])[:limit]
+
+
+def missing_required_types(form: Dict[str, Any], required_types: Sequence[str]) -> List[str]:
+    """Required field types that do not appear among the form's page fields."""
+    present = {
+        field.get("type")
+        for page in form.get("pages", [])
+        for field in page.get("fields", [])
+    }
+    return [field_type for field_type in required_types if field_type not in present]
@@ -0,0 +1,416 @@
+#!/usr/bin/env python3
+"""
+Local leak and fidelity checks for training instructions and inputToLLM.
+
+A task's instruction must mention every groundTruth value that is not masked
+and must not mention any value in its maskedFields. The inputToLLM must
+mention every value. Values are expanded into the surface forms a writer
+might use, per field type: 5551234567 / (555) 123-4567, 03-15-2024 / March
+15, 2024, 1500 / $1,500.00, 14:30 / 2:30 pm, a date range's two ends.
+Texts and values are split into the same lower-case word tokens, the forms
+of all of one form's values go into one Aho-Corasick automaton over tokens,
+and each text is scanned once.
+
+The training tasks are read from the task dataset (task_dataset.py), or from
+a config that still embeds them.
+
+    python fidelity_check.py [public/manual_config.json public/llm_generated_config.json] [--tasks-dir DIR] [--json]
+"""
+
+import argparse
+import json
+import os
+import re
+import unicodedata
+from collections import deque
+from dataclasses import asdict, dataclass
+from datetime import date
+from decimal import Decimal, InvalidOperation
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Sequence, Set, Tuple
+
+from form_schema import parse_mm_dd_yyyy
+from task_dataset import DEFAULT_TASKS_DIR, TaskDataset
+
+DEFAULT_CONFIG_FILES = ["public/manual_config.json", "public/llm_generated_config.json"]
+
+MONTHS = ["january", "february", "march", "april", "may", "june", "july", "august", "september", "october",
+          "november", "december"]
+NUMBER_WORDS = ["zero", "one", "two", "three", "four", "five", "six", "seven", "eight", "nine", "ten"]
+STREET_ABBREVIATIONS = {"street": "st", "avenue": "ave", "road": "rd", "boulevard": "blvd", "drive": "dr",
+                        "lane": "ln", "court": "ct", "place": "pl"}
+
+# Values a writer is expected to paraphrase: only checked for leaks
+PARAPHRASED_TYPES = frozenset({"textarea"})
+# Values with no reliable surface form in text
+UNCHECKED_TYPES = frozenset({"checkbox", "switch"})
+# Surface forms shorter than this ("4", "ok") are too common to count as a leak
+MIN_LEAK_LENGTH = 3
+
+# A token is a run of letters/digits, joined across ".", ":" and "@" ("2:30", "555.123.4567", "a@b.com")
+_TOKEN_RE = re.compile(r"[^\W_]+(?:[.:@][^\W_]+)*")
+_TIME_RE = re.compile(r"^(\d{1,2}):(\d{2})\s*([ap]\.?m\.?)?$", re.IGNORECASE)
+_EXPIRATION_RE = re.compile(r"^(\d{1,2})/(\d{2}|\d{4})$")
+_QUANTITY_RE = re.compile(r"^(\d+) ([a-z]+?)s$", re.IGNORECASE)
+
+
+def tokenize(text: Any) -> Tuple[str, ...]:
+    """NFKC, lower-cased word tokens; thousands separators are dropped, other punctuation splits words."""
+    text = unicodedata.normalize("NFKC", str(text)).lower().replace(",", "")
+    return tuple(_TOKEN_RE.findall(text))
+
+
+# ============== VALUE VARIANTS ==============
+
+
+def _date_variants(value: Any) -> List[str]:
+    parsed = parse_mm_dd_yyyy(value)
+    if parsed is None:
+        return [str(value)]
+    return _calendar_variants(parsed) + [str(value)]
+
+
+def _calendar_variants(d: date) -> List[str]:
+    month = MONTHS[d.month - 1]
+    day_forms = sorted({str(d.day), f"{d.day:02d}", _ordinal(d.day)})
+    variants = [
+        f"{d.month:02d}-{d.day:02d}-{d.year}",
+        f"{d.month}-{d.day}-{d.year}",
+        f"{d.year}-{d.month:02d}-{d.day:02d}",
+    ]
+    for name in (month, month[:3]):
+        for day in day_forms:
+            variants += [f"{name} {day} {d.year}", f"{day} {name} {d.year}", f"{day} of {name} {d.year}"]
+    return variants
+
+
+def _ordinal(n: int) -> str:
+    suffix = "th" if 11 <= n % 100 <= 13 else {1: "st", 2: "nd", 3: "rd"}.get(n % 10, "th")
+    return f"{n}{suffix}"
+
+
+def _number_variants(value: Any) -> List[str]:
+    try:
+        number = Decimal(str(value).replace(",", "").replace("$", "").strip())
+    except InvalidOperation:
+        return [str(value)]
+    variants = [f"{number:f}"]
+    if number == number.to_integral_value():
+        whole = int(number)
+        variants += [str(whole), f"{whole}.00"]
+        if 0 <= whole < len(NUMBER_WORDS):
+            variants.append(NUMBER_WORDS[whole])
+    else:
+        variants += [f"{number.normalize():f}", f"{number:.2f}"]
+    return variants
+
+
+def _phone_variants(value: Any) -> List[str]:
+    digits = re.sub(r"\D", "", str(value))
+    if len(digits) != 10:
+        return [str(value)]
+    a, b, c = digits[:3], digits[3:6], digits[6:]
+    return [digits, f"{a} {b} {c}", f"{a}.{b}.{c}", f"{a} {b}{c}"]
+
+
+def _time_variants(value: Any) -> List[str]:
+    m = _TIME_RE.match(str(value).strip())
+    if not m:
+        return [str(value)]
+    hour, minute, meridiem = int(m.group(1)), m.group(2), (m.group(3) or "").replace(".", "").lower()
+    if meridiem:
+        hour = hour % 12 + (12 if meridiem == "pm" else 0)
+    twelve = hour % 12 or 12
+    suffix = "pm" if hour >= 12 else "am"
+    variants = [f"{hour:02d}:{minute}", f"{hour}:{minute}"]
+    for clock in ([f"{twelve}:{minute}"] + ([str(twelve)] if minute == "00" else [])):
+        variants += [f"{clock} {suffix}", f"{clock}{suffix}", f"{clock} {suffix[0]}.m."]
+    return variants
+
+
+def _expiration_variants(value: Any) -> List[str]:
+    m = _EXPIRATION_RE.match(str(value).strip())
+    if not m:
+        return [str(value)]
+    month = int(m.group(1))
+    year = int(m.group(2)) % 100
+    variants = [f"{month:02d}/{year:02d}", f"{month}/{year:02d}", f"{month:02d}/20{year:02d}", f"{month}/20{year:02d}"]
+    if 1 <= month <= 12:
+        name = MONTHS[month - 1]
+        variants += [f"{name} 20{year:02d}", f"{name[:3]} 20{year:02d}"]
+    return variants
+
+
+def _card_variants(value: Any) -> List[str]:
+    digits = re.sub(r"\D", "", str(value))
+    if "*" in str(value) and len(digits) == 4:
+        # A stored masked number ("************1234") is written as "ending in 1234"
+        return [digits]
+    if len(digits) != 16:
+        return [str(value)]
+    return [digits, " ".join(digits[i:i + 4] for i in range(0, 16, 4))]
+
+
+def _text_variants(value: Any) -> List[str]:
+    text = str(value)
+    # "15 years" is often written "a 15-year term"
+    m = _QUANTITY_RE.match(text.strip())
+    return [text, f"{m.group(1)} {m.group(2)}"] if m else [text]
+
+
+def _url_variants(value: Any) -> List[str]:
+    url = str(value)
+    bare = re.sub(r"^https?://", "", url, flags=re.IGNORECASE)
+    return [url, bare, re.sub(r"^www\.", "", bare, flags=re.IGNORECASE)]
+
+
+def _address_variants(value: Any) -> List[str]:
+    # The street line identifies the address; city/state/zip are often rephrased
+    street = str(value).split(",")[0].strip()
+    words = street.lower().split()
+    variants = [street]
+    if words and words[-1] in STREET_ABBREVIATIONS:
+        variants.append(" ".join(words[:-1] + [STREET_ABBREVIATIONS[words[-1]]]))
+    return variants
+
+
+VARIANT_RULES = {
+    "date": _date_variants,
+    "number": _number_variants,
+    "currency": _number_variants,
+    "slider": _number_variants,
+    "star-rating": _number_variants,
+    "phone": _phone_variants,
+    "time": _time_variants,
+    "expiration-date": _expiration_variants,
+    "credit-card": _card_variants,
+    "url": _url_variants,
+    "home-address": _address_variants,
+    "select": _text_variants,
+    "radio": _text_variants,
+    "text": _text_variants,
+}
+
+
+def value_parts(value: Any, field_type: Optional[str], chunk_types: Optional[Dict[str, str]] = None) -> List[List[Tuple[str, ...]]]:
+    """
+    The parts of a groundTruth value, each a list of tokenized surface forms.
+    A value is mentioned when every part is found; a date range has two parts,
+    a multiselect one per option, reactive chunks one per sub-value.
+    """
+    if value is None or value == "" or isinstance(value, bool) or field_type in UNCHECKED_TYPES:
+        return []
+    if field_type == "date-range" and isinstance(value, dict):
+        return [part for key in ("from", "to") for part in value_parts(value.get(key), "date")]
+    if isinstance(value, list):
+        return [part for item in value for part in value_parts(item, field_type, chunk_types)]
+    if isinstance(value, dict):
+        chunk_types = chunk_types or {}
+        return [
+            part
+            for key, item in value.items()
+            if chunk_types.get(key) not in PARAPHRASED_TYPES
+            for part in value_parts(item, chunk_types.get(key, "text"))
+        ]
+    rule = VARIANT_RULES.get(field_type or "")
+    raw_variants = rule(value) if rule else [str(value)]
+    variants = sorted({tokenize(v) for v in raw_variants} - {()})
+    return [variants] if variants else []
+
+
+# ============== MATCHING ==============
+
+
+class PatternMatcher:
+    """
+    Aho-Corasick automaton over token sequences. `find` scans a tokenized text
+    once and returns the keys of every pattern that occurs in it. Matching whole
+    tokens means "15" never matches inside "2015".
+    """
+
+    def __init__(self, patterns: Iterable[Tuple[Sequence[str], Hashable]]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Hashable]] = [[]]
+        for pattern, key in patterns:
+            node = 0
+            for token in pattern:
+                nxt = self._goto[node].get(token)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][token] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                node = nxt
+            self._out[node].append(key)
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for token, nxt in self._goto[node].items():
+                queue.append(nxt)
+                if node:
+                    fail = self._fail[node]
+                    while fail and token not in self._goto[fail]:
+                        fail = self._fail[fail]
+                    self._fail[nxt] = self._goto[fail].get(token, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def find(self, tokens: Sequence[str]) -> Set[Hashable]:
+        goto, fail, out = self._goto, self._fail, self._out
+        found: Set[Hashable] = set()
+        node = 0
+        for token in tokens:
+            while node and token not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(token, 0)
+            if out[node]:
+                found.update(out[node])
+        return found
+
+
+@dataclass(frozen=True)
+class FidelityIssue:
+    """A groundTruth value missing from a text that should mention it, or present in one that must not."""
+    form_id: str
+    task_id: str  # "inputToLLM" for the form's own input text
+    field_id: str
+    kind: str  # "missing" or "leak"
+    value: Any
+
+    def __str__(self) -> str:
+        return f"{self.form_id}:{self.task_id}:{self.field_id}: {self.kind}: {json.dumps(self.value, ensure_ascii=False)}"
+
+
+def _field_types(form: Dict[str, Any]) -> Tuple[Dict[str, str], Dict[str, Dict[str, str]]]:
+    types: Dict[str, str] = {}
+    chunk_types: Dict[str, Dict[str, str]] = {}
+    for page in form.get("pages", []):
+        for field in page.get("fields", []):
+            types[field.get("id")] = field.get("type")
+            if field.get("chunkFields"):
+                chunk_types[field.get("id")] = {c.get("id"): c.get("type") for c in field["chunkFields"]}
+    return types, chunk_types
+
+
+class FormMatcher:
+    """All of one form's groundTruth values in a single automaton, reused for every text about the form."""
+
+    def __init__(self, form: Dict[str, Any]):
+        self.form_id = str(form.get("id", ""))
+        self.ground_truth: Dict[str, Any] = form.get("groundTruth") or {}
+        types, chunk_types = _field_types(form)
+        self.parts: Dict[str, int] = {}
+        self.required: Set[str] = set()
+        self.leak_keys: Dict[str, Set[int]] = {}
+        self.variants: Dict[Tuple[str, int], Set[Tuple[str, ...]]] = {}
+        patterns: List[Tuple[Tuple[str, ...], Tuple[str, int]]] = []
+        for field_id, value in self.ground_truth.items():
+            field_type = types.get(field_id)
+            parts = value_parts(value, field_type, chunk_types.get(field_id))
+            if not parts:
+                continue
+            self.parts[field_id] = len(parts)
+            if field_type not in PARAPHRASED_TYPES:
+                self.required.add(field_id)
+            self.leak_keys[field_id] = {
+                index for index, variants in enumerate(parts)
+                if max(len(" ".join(variant)) for variant in variants) >= MIN_LEAK_LENGTH
+            }
+            for index, variants in enumerate(parts):
+                self.variants[(field_id, index)] = set(variants)
+                patterns.extend((variant, (field_id, index)) for variant in variants)
+        self.matcher = PatternMatcher(patterns)
+
+    def check(self, task_id: str, text: Any, masked: Sequence[str] = ()) -> List[FidelityIssue]:
+        """Issues for one text: unmasked values it leaves out and masked values it mentions."""
+        found = self.matcher.find(tokenize(text or ""))
+        masked_set = set(masked)
+        # A masked value that equals a mentioned unmasked one (loan amount = property value) is not a leak
+        mentioned = set().union(*(self.variants[key] for key in found if key[0] not in masked_set))
+        issues = []
+        for field_id, count in self.parts.items():
+            if field_id in masked_set:
+                if any(
+                    (field_id, index) in found and self.variants[(field_id, index)].isdisjoint(mentioned)
+                    for index in self.leak_keys[field_id]
+                ):
+                    issues.append(FidelityIssue(self.form_id, task_id, field_id, "leak", self.ground_truth[field_id]))
+            elif field_id in self.required and not all((field_id, index) in found for index in range(count)):
+                issues.append(FidelityIssue(self.form_id, task_id, field_id, "missing", self.ground_truth[field_id]))
+        return issues
+
+
+def check_instructions(
+    form: Dict[str, Any],
+    instructions: Sequence[str],
+    masked_fields_per_task: Sequence[Sequence[str]],
+    matcher: Optional[FormMatcher] = None,
+) -> Dict[str, List[FidelityIssue]]:
+    """Failing tasks only, as task ID ("task_1"...) -> issues, for instructions not yet saved."""
+    matcher = matcher or FormMatcher(form)
+    failing = {}
+    for i, (instruction, masked) in enumerate(zip(instructions, masked_fields_per_task)):
+        issues = matcher.check(f"task_{i + 1}", instruction, masked)
+        if issues:
+            failing[f"task_{i + 1}"] = issues
+    return failing
+
+
+def check_form(form: Dict[str, Any], tasks: Optional[List[Dict[str, Any]]] = None) -> Dict[str, List[FidelityIssue]]:
+    """
+    Failing texts of a saved form: "inputToLLM" and each task ID, mapped to
+    their issues. `tasks` defaults to the form's embedded trainingTasks.
+    """
+    matcher = FormMatcher(form)
+    failing = {}
+    issues = matcher.check("inputToLLM", form.get("inputToLLM"))
+    if issues:
+        failing["inputToLLM"] = issues
+    if tasks is None:
+        tasks = form.get("trainingTasks") or []
+    for task in tasks:
+        issues = matcher.check(task.get("id", ""), task.get("instruction"), task.get("maskedFields") or [])
+        if issues:
+            failing[task.get("id", "")] = issues
+    return failing
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check instructions and inputToLLM against groundTruth and masks.")
+    parser.add_argument("configs", nargs="*", default=DEFAULT_CONFIG_FILES, help="config JSON files")
+    parser.add_argument("--tasks-dir", default=DEFAULT_TASKS_DIR, help=f"task dataset directory (default: {DEFAULT_TASKS_DIR})")
+    parser.add_argument("--json", action="store_true", help="print one JSON object per issue")
+    args = parser.parse_args()
+
+    dataset = TaskDataset(args.tasks_dir)
+
+    texts = 0
+    failing_texts = 0
+    issues: List[FidelityIssue] = []
+    for path in args.configs:
+        if not os.path.exists(path):
+            print(f"⚠ {path} not found, skipping")
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            config = json.load(f)
+        for form_id, form in config.items():
+            stored = dataset.get(form_id)
+            tasks = stored.tasks if stored is not None else form.get("trainingTasks") or []
+            texts += 1 + len(tasks)
+            failing = check_form(form, tasks)
+            failing_texts += len(failing)
+            issues.extend(issue for task_issues in failing.values() for issue in task_issues)
+
+    if args.json:
+        for issue in issues:
+            print(json.dumps(asdict(issue), ensure_ascii=False))
+        return
+    for issue in issues:
+        print(issue)
+    leaks = sum(1 for issue in issues if issue.kind == "leak")
+    print(f"\nChecked {texts} texts: {failing_texts} failing ({len(issues) - leaks} missing values, {leaks} leaks)")
+
+
+if __name__ == "__main__":
+    main()
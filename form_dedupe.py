@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Near-duplicate detection for form definitions with MinHash + LSH.
+
+A form is reduced to a set of features built from its field types, labels and
+options. MinHash signatures of those sets are bucketed by band (locality-
+sensitive hashing), so a new form is only compared with the few indexed forms
+that share a bucket instead of the whole corpus. Candidates are confirmed
+with the exact Jaccard similarity of the feature sets.
+
+generate_pages.py checks every validated form against the corpus (--dedupe).
+This script reports near-duplicate clusters in existing configs:
+
+    python form_dedupe.py [public/manual_config.json public/llm_generated_config.json] [--threshold 0.8] [--json]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import struct
+import threading
+from collections import defaultdict
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+DEFAULT_THRESHOLD = 0.8
+DEFAULT_NUM_PERM = 128
+DEFAULT_BANDS = 32
+DEFAULT_CONFIG_FILES = ["public/manual_config.json", "public/llm_generated_config.json"]
+
+_MAX_HASH = (1 << 32) - 1
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def _normalize(text: Any) -> str:
+    return " ".join(_WORD_RE.findall(str(text).lower()))
+
+
+def _iter_fields(form: Dict[str, Any]) -> Iterable[Dict[str, Any]]:
+    for page in form.get("pages", []):
+        for field in page.get("fields", []):
+            yield field
+            yield from field.get("chunkFields") or []
+
+
+def form_features(form: Dict[str, Any]) -> FrozenSet[str]:
+    """
+    Features of a form's structure: one per (type, label) pair, one per label
+    word (so "Full Name" and "Name" still overlap) and one per option value.
+    Titles, IDs and groundTruth values are left out on purpose.
+    """
+    features: Set[str] = set()
+    for field in _iter_fields(form):
+        field_type = field.get("type", "")
+        label = _normalize(field.get("label", ""))
+        features.add(f"f:{field_type}:{label}")
+        features.update(f"w:{word}" for word in label.split())
+        features.update(f"o:{_normalize(option)}" for option in field.get("options") or [])
+    return frozenset(features)
+
+
+def jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class MinHasher:
+    """
+    MinHash signatures with `num_perm` independent 32-bit hash functions.
+
+    Each feature's `num_perm` hash values come from keyed BLAKE2b digests and
+    are memoized, since the same labels and words recur across many forms.
+    """
+
+    def __init__(self, num_perm: int = DEFAULT_NUM_PERM, seed: int = 1):
+        if num_perm % 16:
+            raise ValueError("num_perm must be a multiple of 16")
+        self.num_perm = num_perm
+        self._keys = [hashlib.sha256(f"{seed}:{i}".encode()).digest()[:16] for i in range(num_perm // 16)]
+        self._unpack = struct.Struct(f"<{num_perm}I").unpack
+        self._feature_hashes = lru_cache(maxsize=1 << 16)(self._hash_feature)
+
+    def _hash_feature(self, feature: str) -> Tuple[int, ...]:
+        data = feature.encode("utf-8")
+        return self._unpack(b"".join(hashlib.blake2b(data, digest_size=64, key=key).digest() for key in self._keys))
+
+    def signature(self, features: Iterable[str]) -> Tuple[int, ...]:
+        vectors = [self._feature_hashes(feature) for feature in features]
+        if not vectors:
+            return (_MAX_HASH,) * self.num_perm
+        return tuple(map(min, zip(*vectors)))
+
+
+class DedupeIndex:
+    """
+    LSH index of form feature sets. Safe to share between threads.
+
+    With the defaults (128 permutations in 32 bands of 4 rows), pairs at
+    Jaccard 0.8 share a bucket with >99.9% probability, pairs at 0.6 with ~99%
+    and pairs at 0.3 with ~23%, so lookups touch only similar forms.
+    """
+
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD, num_perm: int = DEFAULT_NUM_PERM, bands: int = DEFAULT_BANDS):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.hasher = MinHasher(num_perm)
+        self._features: Dict[str, FrozenSet[str]] = {}
+        self._buckets: Dict[Tuple[int, Tuple[int, ...]], List[str]] = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._features)
+
+    def _band_keys(self, signature: Tuple[int, ...]) -> List[Tuple[int, Tuple[int, ...]]]:
+        return [(band, signature[band * self.rows:(band + 1) * self.rows]) for band in range(self.bands)]
+
+    def _query(self, features: FrozenSet[str], keys: List[Tuple[int, Tuple[int, ...]]]) -> List[Tuple[str, float]]:
+        # Caller holds self._lock
+        candidates = {form_id for key in keys for form_id in self._buckets.get(key, ())}
+        matches = [(form_id, jaccard(features, self._features[form_id])) for form_id in candidates]
+        return sorted(
+            ((form_id, score) for form_id, score in matches if score >= self.threshold),
+            key=lambda m: (-m[1], m[0]),
+        )
+
+    def _add(self, form_id: str, features: FrozenSet[str], keys: List[Tuple[int, Tuple[int, ...]]]) -> None:
+        # Caller holds self._lock
+        if form_id in self._features:
+            return
+        self._features[form_id] = features
+        for key in keys:
+            self._buckets[key].append(form_id)
+
+    def add(self, form_id: str, form: Dict[str, Any]) -> None:
+        features = form_features(form)
+        keys = self._band_keys(self.hasher.signature(features))
+        with self._lock:
+            self._add(form_id, features, keys)
+
+    def query(self, form: Dict[str, Any], exclude: Optional[str] = None) -> List[Tuple[str, float]]:
+        """Indexed forms at or above the threshold, most similar first."""
+        features = form_features(form)
+        keys = self._band_keys(self.hasher.signature(features))
+        with self._lock:
+            return [m for m in self._query(features, keys) if m[0] != exclude]
+
+    def check(self, form_id: str, form: Dict[str, Any], add_duplicate: bool = True) -> Optional[Tuple[str, float]]:
+        """
+        Return the closest indexed near-duplicate of `form` (None if there is
+        none) and index the form, unless it is a duplicate and `add_duplicate`
+        is False. Lookup and insert happen atomically.
+        """
+        features = form_features(form)
+        keys = self._band_keys(self.hasher.signature(features))
+        with self._lock:
+            matches = [m for m in self._query(features, keys) if m[0] != form_id]
+            if not matches or add_duplicate:
+                self._add(form_id, features, keys)
+            return matches[0] if matches else None
+
+
+def duplicate_clusters(forms: Dict[str, Dict[str, Any]], threshold: float = DEFAULT_THRESHOLD) -> List[List[Tuple[str, str]]]:
+    """
+    Group forms into clusters of near duplicates (connected components of
+    pairs at or above `threshold`). Each cluster is a list of (form_id,
+    closest_match_id), largest clusters first.
+    """
+    index = DedupeIndex(threshold)
+    parent: Dict[str, str] = {}
+    closest: Dict[str, str] = {}
+
+    def find(x: str) -> str:
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for form_id, form in forms.items():
+        parent[form_id] = form_id
+        matches = index.query(form)
+        for other, _score in matches:
+            parent[find(form_id)] = find(other)
+        if matches:
+            closest[form_id] = matches[0][0]
+            closest.setdefault(matches[0][0], form_id)
+        index.add(form_id, form)
+
+    groups: Dict[str, List[Tuple[str, str]]] = defaultdict(list)
+    for form_id in closest:
+        groups[find(form_id)].append((form_id, closest[form_id]))
+    return sorted(groups.values(), key=lambda group: (-len(group), group[0][0]))
+
+
+def load_configs(paths: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Merge config files; IDs that appear in more than one file are prefixed with the file name."""
+    forms: Dict[str, Dict[str, Any]] = {}
+    for path in paths:
+        if not os.path.exists(path):
+            print(f"⚠ {path} not found, skipping")
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            config = json.load(f)
+        prefix = os.path.splitext(os.path.basename(path))[0]
+        for form_id, form in config.items():
+            forms[f"{prefix}:{form_id}" if form_id in forms else form_id] = form
+    return forms
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report near-duplicate forms in config files.")
+    parser.add_argument("configs", nargs="*", default=DEFAULT_CONFIG_FILES, help="config JSON files")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help=f"Jaccard threshold (default: {DEFAULT_THRESHOLD})")
+    parser.add_argument("--json", action="store_true", help="print clusters as JSON")
+    args = parser.parse_args()
+
+    forms = load_configs(args.configs)
+    clusters = duplicate_clusters(forms, args.threshold)
+
+    report = [
+        [
+            {
+                "id": form_id,
+                "title": forms[form_id].get("title"),
+                "closest": closest_id,
+                "similarity": round(jaccard(form_features(forms[form_id]), form_features(forms[closest_id])), 3),
+            }
+            for form_id, closest_id in cluster
+        ]
+        for cluster in clusters
+    ]
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+        return
+
+    duplicates = sum(len(cluster) - 1 for cluster in clusters)
+    print(f"Checked {len(forms)} forms at Jaccard ≥ {args.threshold}")
+    print(f"  {len(clusters)} near-duplicate clusters, {duplicates} redundant forms")
+    for i, cluster in enumerate(report, 1):
+        print(f"\nCLUSTER {i} ({len(cluster)} forms)")
+        print("-" * 60)
+        for entry in cluster:
+            print(f"  {entry['id']:>8s}  {entry['title']!s:40.40s}  ~{entry['closest']} ({entry['similarity']:.2f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Validate whole form config files against the schema in form_schema.py.
+
+Every form is checked with ConfigForm (FormDefinition plus the fields the
+configs add, such as trainingTasks) straight from its raw JSON bytes, and
+large files are spread across a process pool. Each problem is printed as one
+line with the file, form ID and JSON path, and the exit status is 1 if there
+were any, so the lint can gate commits:
+
+    python form_lint.py [public/manual_config.json public/llm_generated_config.json] [--workers N] [--json]
+
+    public/manual_config.json:12:pages[0].fields[3].type: literal_error: Input should be 'text', 'textarea', ...
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import form_schema
+from form_schema import validate_form_dict
+
+DEFAULT_CONFIG_FILES = ["public/manual_config.json", "public/llm_generated_config.json"]
+DEFAULT_CHUNK_SIZE = 1000
+
+# A top-level key in a config written with indent=2 (json.dump / write_json_atomic)
+_TOP_KEY_RE = re.compile(rb'\n  ("(?:[^"\\\n]|\\.)*")\s*:\s*')
+
+RawForm = Union[bytes, str]
+
+
+@dataclass(frozen=True)
+class LintError:
+    """One problem, addressed by file, form ID and a JSON-style path inside the form."""
+    file: str
+    form_id: str
+    path: str
+    code: str
+    message: str
+
+    def __str__(self) -> str:
+        return f"{self.file}:{self.form_id}:{self.path}: {self.code}: {self.message}"
+
+
+def _indented_forms(data: bytes) -> Optional[List[Tuple[str, RawForm]]]:
+    """
+    Split an indent=2 config on its top-level key lines without parsing the
+    forms. Returns None if the file is not laid out that way.
+    """
+    if not data.lstrip().startswith(b'{\n  "'):
+        return None
+    keys = list(_TOP_KEY_RE.finditer(data))
+    ends = [m.start() for m in keys[1:]] + [data.rstrip().rfind(b"}")]
+    forms = []
+    for m, next_start in zip(keys, ends):
+        end = data.rfind(b"}", m.end(), next_start) + 1
+        if data[m.end():m.end() + 1] != b"{" or end == 0 or data[end:next_start].strip() not in (b",", b""):
+            return None
+        forms.append((json.loads(m.group(1)), data[m.end():end]))
+    return forms
+
+
+def _decoded_forms(data: bytes) -> List[Tuple[str, RawForm]]:
+    """Split any JSON object into (key, raw value) pairs; raises json.JSONDecodeError on bad JSON."""
+    text = data.decode("utf-8")
+    decoder = json.JSONDecoder()
+    ws = re.compile(r"\s*")
+    pos = ws.match(text, 0).end()
+    if text[pos:pos + 1] != "{":
+        raise json.JSONDecodeError("Config must be a JSON object of forms keyed by ID", text, pos)
+    pos = ws.match(text, pos + 1).end()
+    forms: List[Tuple[str, RawForm]] = []
+    if text[pos:pos + 1] == "}":
+        return forms
+    while True:
+        key, pos = decoder.raw_decode(text, pos)
+        if not isinstance(key, str):
+            raise json.JSONDecodeError("Expecting property name", text, pos)
+        pos = ws.match(text, pos).end()
+        if text[pos:pos + 1] != ":":
+            raise json.JSONDecodeError("Expecting ':' delimiter", text, pos)
+        start = ws.match(text, pos + 1).end()
+        _value, pos = decoder.raw_decode(text, start)
+        forms.append((key, text[start:pos]))
+        pos = ws.match(text, pos).end()
+        if text[pos:pos + 1] == "}":
+            return forms
+        if text[pos:pos + 1] != ",":
+            raise json.JSONDecodeError("Expecting ',' delimiter", text, pos)
+        pos = ws.match(text, pos + 1).end()
+
+
+def split_config(data: bytes, exact: bool = False) -> Tuple[List[Tuple[str, RawForm]], bool]:
+    """
+    (form_id, raw form JSON) for every top-level member, and whether the split
+    came from a full JSON scan (`exact`) rather than the indent=2 fast path.
+    """
+    if not exact:
+        forms = _indented_forms(data)
+        if forms is not None:
+            return forms, False
+    return _decoded_forms(data), True
+
+
+def _format_loc(loc: Sequence[Union[str, int]]) -> str:
+    path = ""
+    for part in loc:
+        path += f"[{part}]" if isinstance(part, int) else (f".{part}" if path else str(part))
+    return path or "$"
+
+
+def lint_form(file: str, form_id: str, raw: RawForm) -> List[LintError]:
+    """Validate one raw form against ConfigForm."""
+    try:
+        form = form_schema.ConfigForm.model_validate_json(raw)
+    except form_schema.ValidationError as e:
+        errors = []
+        for err in e.errors(include_url=False):
+            if not err["loc"] and err["type"] == "value_error":
+                # groundTruth rules run on the whole form; redo them for per-value paths
+                issues = validate_form_dict(json.loads(raw))
+                if issues:
+                    errors.extend(LintError(file, form_id, i.path, i.code, i.message) for i in issues)
+                    continue
+            errors.append(LintError(file, form_id, _format_loc(err["loc"]), err["type"], err["msg"]))
+        return errors
+    if form.id != form_id:
+        return [LintError(file, form_id, "id", "id-mismatch", f"Form is stored under key {form_id!r} but has id {form.id!r}")]
+    return []
+
+
+def _lint_chunk(file: str, forms: List[Tuple[str, RawForm]]) -> List[LintError]:
+    return [error for form_id, raw in forms for error in lint_form(file, form_id, raw)]
+
+
+def _load_forms(path: str, exact: bool = False) -> Tuple[List[Tuple[str, RawForm]], bool, List[LintError]]:
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        forms, exact = split_config(data, exact)
+    except (OSError, UnicodeDecodeError) as e:
+        return [], True, [LintError(path, "", "$", "unreadable", str(e))]
+    except json.JSONDecodeError as e:
+        return [], True, [LintError(path, "", "$", "json_invalid", f"{e.msg} (line {e.lineno}, column {e.colno})")]
+    return forms, exact, []
+
+
+def lint_files(
+    paths: Sequence[str],
+    workers: int = 1,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> Tuple[int, List[LintError]]:
+    """
+    Lint every form in `paths`; returns (forms checked, errors) with errors in
+    file and form order. With `workers` > 1, chunks of `chunk_size` forms are
+    validated on a process pool. IDs defined twice, in one file or across
+    files, are reported as well.
+    """
+    loaded = {path: _load_forms(path) for path in paths}
+    chunks = [
+        (path, forms[i:i + chunk_size])
+        for path, (forms, _exact, _errors) in loaded.items()
+        for i in range(0, len(forms), chunk_size)
+    ]
+    if workers <= 1 or len(chunks) <= 1:
+        results = [_lint_chunk(path, forms) for path, forms in chunks]
+    else:
+        # Import the Pydantic models once here, so forked workers inherit them
+        form_schema.ConfigForm
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_lint_chunk, *zip(*chunks)))
+
+    by_file: Dict[str, List[LintError]] = {path: list(errors) for path, (_f, _e, errors) in loaded.items()}
+    for (path, _forms), errors in zip(chunks, results):
+        by_file[path].extend(errors)
+
+    # The fast split only misreads a hand-formatted file; that shows up as invalid JSON, so rescan exactly
+    for path, (forms, exact, _errors) in loaded.items():
+        if not exact and any(error.code == "json_invalid" for error in by_file[path]):
+            forms, _exact, errors = _load_forms(path, exact=True)
+            loaded[path] = (forms, True, errors)
+            by_file[path] = errors + _lint_chunk(path, forms)
+
+    first_seen: Dict[str, str] = {}
+    total = 0
+    for path, (forms, _exact, _errors) in loaded.items():
+        total += len(forms)
+        for form_id, _raw in forms:
+            if form_id in first_seen:
+                where = "earlier in this file" if first_seen[form_id] == path else f"in {first_seen[form_id]}"
+                by_file[path].append(LintError(path, form_id, "$", "duplicate-id", f"Form ID is also defined {where}"))
+            else:
+                first_seen[form_id] = path
+    return total, [error for path in paths for error in by_file[path]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate form config files against the form schema.")
+    parser.add_argument("configs", nargs="*", default=DEFAULT_CONFIG_FILES, help="config JSON files")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="processes (default: CPU count)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help=f"forms per task (default: {DEFAULT_CHUNK_SIZE})")
+    parser.add_argument("--json", action="store_true", help="print one JSON object per error")
+    args = parser.parse_args()
+
+    paths = [path for path in args.configs if os.path.exists(path)]
+    for path in sorted(set(args.configs) - set(paths)):
+        print(f"⚠ {path} not found, skipping", file=sys.stderr)
+
+    total, errors = lint_files(paths, workers=args.workers, chunk_size=args.chunk_size)
+    for error in errors:
+        print(json.dumps(asdict(error), ensure_ascii=False) if args.json else error)
+
+    bad_forms = len({(error.file, error.form_id) for error in errors})
+    status = "✓" if not errors else "✗"
+    print(f"{status} Checked {total} forms in {len(paths)} files: {len(errors)} errors in {bad_forms} forms", file=sys.stderr)
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == "__main__":
+    main()
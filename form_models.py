@@ -0,0 +1,171 @@
+"""
+Pydantic models of the form schema, for the LLM response format and full
+validation. form_schema re-exports them on first access; import them from
+there.
+"""
+
+from typing import Any, Dict, List, Optional, Union
+
+from pydantic import BaseModel, Field, ValidationError, ValidationInfo, model_validator  # noqa: F401 (ValidationError is re-exported)
+
+from form_schema import (
+    DEFAULT_BATCH_SIZE,
+    FieldType,
+    FormType,
+    LayoutType,
+    ValidationIssue,
+    check_field_definition,
+    check_ground_truth,
+)
+
+
+def _raise_issues(issues: List[ValidationIssue]) -> None:
+    if issues:
+        raise ValueError("; ".join(issue.message for issue in issues))
+
+
+class ChunkField(BaseModel):
+    id: str
+    type: FieldType
+    label: str
+    required: bool = True
+    placeholder: Optional[str] = None
+    options: Optional[List[str]] = None
+    min: Optional[float] = None
+    max: Optional[float] = None
+    step: Optional[float] = None
+    defaultValue: Optional[Union[float, str]] = None
+    currency: Optional[str] = None
+    maxStars: Optional[int] = None
+    maxLength: Optional[int] = None
+    allowed: Optional[str] = None  # "before" / "after"
+
+    model_config = {"extra": "forbid"}
+
+
+class FormField(BaseModel):
+    id: str
+    type: FieldType
+    label: str
+    required: bool
+    placeholder: Optional[str] = None
+    options: Optional[List[str]] = None
+    min: Optional[float] = None
+    max: Optional[float] = None
+    step: Optional[float] = None
+    defaultValue: Optional[Union[float, str]] = None
+    currency: Optional[str] = None
+    maxStars: Optional[int] = None
+    maxLength: Optional[int] = None
+    allowed: Optional[str] = None
+    dateStyle: Optional[str] = None   # assigned post-LLM
+    rangeStyle: Optional[str] = None  # assigned post-LLM
+    chunkFields: Optional[List[ChunkField]] = None
+
+    model_config = {"extra": "forbid"}
+
+    @model_validator(mode="after")
+    def validate_country_state_address(self):
+        _raise_issues(check_field_definition("", self.id, self.type, self.options, self.defaultValue))
+        return self
+
+
+class Page(BaseModel):
+    pageNumber: int
+    fields: List[FormField]
+
+
+class NavigationItem(BaseModel):
+    label: str
+    href: str
+    active: Optional[bool] = None
+
+
+class SidebarLink(BaseModel):
+    label: str
+    href: str
+
+
+class SidebarContent(BaseModel):
+    title: str
+    content: str
+    links: Optional[List[SidebarLink]] = None
+
+
+class FooterLink(BaseModel):
+    label: str
+    href: str
+
+
+class FooterLinkGroup(BaseModel):
+    title: str
+    links: List[FooterLink]
+
+
+class WebsiteContext(BaseModel):
+    companyName: str
+    logoUrl: Optional[str] = Field(
+        default=None,
+        description="DO NOT generate. Leave null; UI uses placeholder logo."
+    )
+    themeColor: str
+    navigationItems: List[NavigationItem]
+    heroTitle: str
+    heroSubtitle: str
+    sidebarContent: Optional[SidebarContent] = None
+    footerLinks: List[FooterLinkGroup]
+
+
+class FormDefinition(BaseModel):
+    id: str
+    title: str
+    description: str
+    type: FormType
+    layout: LayoutType
+    inputToLLM: str
+    pages: List[Page]
+    websiteContext: Optional[WebsiteContext] = None
+    groundTruth: Dict[str, Any]
+
+    model_config = {"extra": "forbid"}
+
+    @model_validator(mode="after")
+    def validate_ground_truth_values(self, info: ValidationInfo):
+        # Pass context={"date_window": DateWindow(...)} to also enforce the date window
+        window = (info.context or {}).get("date_window")
+        field_types = {field.id: field.type for page in self.pages for field in page.fields}
+        _raise_issues(check_ground_truth(self.id, field_types, self.groundTruth, window))
+        return self
+
+
+class TrainingTask(BaseModel):
+    id: str
+    instruction: str
+    masked: bool
+    maskedFields: List[str]
+
+    model_config = {"extra": "forbid"}
+
+
+class ConfigForm(FormDefinition):
+    """
+    A form as saved in the public configs: `layout` may be left out (manual
+    forms render single-column). trainingTasks now live in the task dataset
+    (task_dataset.py); older configs that still embed them remain valid.
+    """
+    layout: LayoutType = "single-column"
+    trainingTasks: Optional[List[TrainingTask]] = None
+    trainingTasksFingerprint: Optional[str] = None  # inputs the trainingTasks were generated from
+
+
+class FormBatch(BaseModel):
+    forms: List[FormDefinition]
+
+    model_config = {"extra": "forbid"}
+
+    @model_validator(mode="after")
+    def validate_batch_size(self, info: ValidationInfo):
+        expected = (info.context or {}).get("batch_size", DEFAULT_BATCH_SIZE)
+        if len(self.forms) != expected:
+            raise ValueError(f"Batch must contain exactly {expected} forms, got {len(self.forms)}")
+        return self
@@ -0,0 +1,331 @@
+"""
+Form schema, constants and validation rules shared by the generation scripts
+and the offline tools.
+
+Importing this module has no side effects: no .env loading, no OpenAI import
+and no credentials, so linters, analyzers and planners can use the models and
+value rules directly. The Pydantic models live in form_models.py and are only
+imported on first access (`from form_schema import FormDefinition` still
+works), so the constants and validate_form_dict() load without Pydantic.
+"""
+
+import re
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, List, Literal, Optional
+
+# ============== CONSTANTS ==============
+
+FieldType = Literal[
+    "text",
+    "textarea",
+    "phone",
+    "email",
+    "url",
+    "checkbox",
+    "switch",
+    "select",
+    "radio",
+    "multiselect",
+    "searchable-multiselect",
+    "date",
+    "time",
+    "date-range",
+    "number",
+    "slider",
+    "currency",
+    "star-rating",
+    "home-address",
+    "country",
+    "state",
+    "zip",
+    "credit-card",
+    "expiration-date",
+    "cvv",
+    "reactive-chunks",
+]
+
+DEFAULT_BATCH_SIZE = 5
+
+FormType = Literal["single-page", "multipage"]
+LayoutType = Literal["single-column", "two-column", "split-screen", "wizard-style", "website-style"]
+
+VALID_COUNTRIES_LIST = [
+    "United States",
+    "Canada",
+    "United Kingdom",
+    "Australia",
+    "Germany",
+    "France",
+    "Japan",
+    "China",
+    "India",
+    "Brazil",
+    "Mexico",
+    "Spain",
+    "Italy",
+    "South Korea",
+    "Netherlands",
+    "Sweden",
+]
+
+VALID_STATES_LIST = [
+    "Alabama", "Alaska", "Arizona", "Arkansas", "California", "Colorado", "Connecticut", "Delaware",
+    "Florida", "Georgia", "Hawaii", "Idaho", "Illinois", "Indiana", "Iowa", "Kansas",
+    "Kentucky", "Louisiana", "Maine", "Maryland", "Massachusetts", "Michigan", "Minnesota", "Mississippi",
+    "Missouri", "Montana", "Nebraska", "Nevada", "New Hampshire", "New Jersey", "New Mexico", "New York",
+    "North Carolina", "North Dakota", "Ohio", "Oklahoma", "Oregon", "Pennsylvania", "Rhode Island", "South Carolina",
+    "South Dakota", "Tennessee", "Texas", "Utah", "Vermont", "Virginia", "Washington", "West Virginia",
+    "Wisconsin", "Wyoming",
+]
+
+VALID_ADDRESSES_LIST = [
+    "123 Main Street, New York, NY 10001",
+    "123 Main St, Boston, MA 02101",
+    "1234 Main Street, Los Angeles, CA 90001",
+    "1234 Main St, Chicago, IL 60601",
+    "12 Main Avenue, New York, NY 10002",
+    "12 Main Ave, San Francisco, CA 94102",
+    "123 Oak Street, Seattle, WA 98101",
+    "123 Oak St, Portland, OR 97201",
+    "1234 Oak Street, Denver, CO 80201",
+    "1234 Oak Ave, Phoenix, AZ 85001",
+    "456 Park Avenue, New York, NY 10022",
+    "456 Park Ave, Miami, FL 33101",
+    "4567 Park Avenue, Houston, TX 77001",
+    "4567 Park St, Atlanta, GA 30301",
+    "789 Elm Street, Philadelphia, PA 19101",
+    "789 Elm St, Washington, DC 20001",
+    "7890 Elm Street, Dallas, TX 75201",
+    "7890 Elm Ave, San Diego, CA 92101",
+    "321 Pine Street, Austin, TX 78701",
+    "321 Pine St, Nashville, TN 37201",
+    "3210 Pine Avenue, Las Vegas, NV 89101",
+    "3210 Pine St, Minneapolis, MN 55401",
+    "555 Broadway, New York, NY 10012",
+    "555 Broadway St, San Antonio, TX 78201",
+    "5555 Broadway Avenue, Columbus, OH 43201",
+]
+
+# ============== VALIDATION RULES ==============
+#
+# Value rules are compiled once per field type (frozensets for enum-like types,
+# precompiled patterns for formatted strings) and looked up from a registry, so
+# validating a form is a single pass over its fields and groundTruth.
+
+VALID_COUNTRIES = frozenset(VALID_COUNTRIES_LIST)
+VALID_STATES = frozenset(VALID_STATES_LIST)
+VALID_ADDRESSES = frozenset(VALID_ADDRESSES_LIST)
+
+PHONE_RE = re.compile(r"^\d{10}$")
+ZIP_RE = re.compile(r"^\d{5}(-\d{4})?$")
+CVV_RE = re.compile(r"^\d{3,4}$")
+EXPIRATION_DATE_RE = re.compile(r"^(0[1-9]|1[0-2])/\d{2}$")
+DATE_RE = re.compile(r"^(\d{2})-(\d{2})-(\d{4})$")
+
+
+@dataclass(frozen=True)
+class DateWindow:
+    """Inclusive range that groundTruth dates must fall in."""
+    earliest: date
+    latest: date
+
+    @classmethod
+    def around(cls, today: datetime, days: int = 730) -> "DateWindow":
+        return cls((today - timedelta(days=days)).date(), (today + timedelta(days=days)).date())
+
+    def __str__(self) -> str:
+        return f"{self.earliest.strftime('%m-%d-%Y')}..{self.latest.strftime('%m-%d-%Y')}"
+
+
+@dataclass(frozen=True)
+class ValidationIssue:
+    """One rule violation, addressed by form ID and a JSON-style path."""
+    form_id: str
+    path: str
+    field_type: str
+    code: str
+    message: str
+
+
+# A rule takes a value (and the optional date window) and returns (code, message) or None
+ValueRule = Callable[[Any, Optional[DateWindow]], Optional[tuple[str, str]]]
+
+
+def _member_rule(allowed: frozenset, kind: str) -> ValueRule:
+    def check(value: Any, window: Optional[DateWindow]) -> Optional[tuple[str, str]]:
+        if isinstance(value, str):
+            if value not in allowed:
+                return f"invalid-{kind}", f"Invalid {kind} {value!r}"
+        elif isinstance(value, list):
+            invalid = [v for v in value if v not in allowed]
+            if invalid:
+                return f"invalid-{kind}", f"Invalid {kind} values {invalid!r}"
+        return None
+    return check
+
+
+def _pattern_rule(pattern: re.Pattern, kind: str, expected: str) -> ValueRule:
+    def check(value: Any, window: Optional[DateWindow]) -> Optional[tuple[str, str]]:
+        if value is None or value == "":
+            return None
+        if isinstance(value, bool) or not pattern.match(str(value)):
+            return "bad-format", f"Invalid {kind} {value!r} (expected {expected})"
+        return None
+    return check
+
+
+def parse_mm_dd_yyyy(value: Any) -> Optional[date]:
+    """Parse an 'MM-DD-YYYY' string, or return None if it is not a real date in that format."""
+    if not isinstance(value, str):
+        return None
+    m = DATE_RE.match(value)
+    if not m:
+        return None
+    try:
+        return date(int(m.group(3)), int(m.group(1)), int(m.group(2)))
+    except ValueError:
+        return None
+
+
+def _check_date(value: Any, window: Optional[DateWindow]) -> Optional[tuple[str, str]]:
+    if value is None or value == "":
+        return None
+    parsed = parse_mm_dd_yyyy(value)
+    if parsed is None:
+        return "bad-format", f"Invalid date {value!r} (expected MM-DD-YYYY)"
+    if window is not None and not (window.earliest <= parsed <= window.latest):
+        return "out-of-window", f"Date {value!r} outside {window}"
+    return None
+
+
+def _check_date_range(value: Any, window: Optional[DateWindow]) -> Optional[tuple[str, str]]:
+    if value is None or value == "":
+        return None
+    if not isinstance(value, dict) or set(value) != {"from", "to"}:
+        return "bad-format", f"Invalid date range {value!r} (expected {{'from': 'MM-DD-YYYY', 'to': 'MM-DD-YYYY'}})"
+    for key in ("from", "to"):
+        problem = _check_date(value[key], window)
+        if problem is not None:
+            return problem[0], f"{problem[1]} in '{key}'"
+    start, end = parse_mm_dd_yyyy(value["from"]), parse_mm_dd_yyyy(value["to"])
+    if start and end and start > end:
+        return "reversed-range", f"Date range {value!r} ends before it starts"
+    return None
+
+
+# groundTruth value rules, keyed by field type
+VALUE_RULES: Dict[str, ValueRule] = {
+    "country": _member_rule(VALID_COUNTRIES, "country"),
+    "state": _member_rule(VALID_STATES, "state"),
+    "home-address": _member_rule(VALID_ADDRESSES, "home-address"),
+    "phone": _pattern_rule(PHONE_RE, "phone", "10 digits"),
+    "zip": _pattern_rule(ZIP_RE, "zip", "12345 or 12345-6789"),
+    "cvv": _pattern_rule(CVV_RE, "cvv", "3-4 digits"),
+    "expiration-date": _pattern_rule(EXPIRATION_DATE_RE, "expiration-date", "MM/YY"),
+    "date": _check_date,
+    "date-range": _check_date_range,
+}
+
+# Field types whose options and string defaultValue must also pass the value rule
+OPTION_RULE_TYPES = frozenset({"country", "state", "home-address"})
+
+
+def check_field_definition(
+    form_id: str,
+    path: str,
+    field_type: str,
+    options: Optional[List[Any]],
+    default_value: Any,
+) -> List[ValidationIssue]:
+    """Options/defaultValue checks for one field definition."""
+    if field_type not in OPTION_RULE_TYPES:
+        return []
+    rule = VALUE_RULES[field_type]
+    issues: List[ValidationIssue] = []
+    if options:
+        problem = rule(options, None)
+        if problem is not None:
+            issues.append(ValidationIssue(form_id, f"{path}.options", field_type, problem[0], f"{problem[1]} in options"))
+    if isinstance(default_value, str):
+        problem = rule(default_value, None)
+        if problem is not None:
+            issues.append(
+                ValidationIssue(form_id, f"{path}.defaultValue", field_type, problem[0], f"{problem[1]} as default")
+            )
+    return issues
+
+
+def check_ground_truth(
+    form_id: str,
+    field_types: Dict[str, str],
+    ground_truth: Dict[str, Any],
+    window: Optional[DateWindow] = None,
+) -> List[ValidationIssue]:
+    """Check every groundTruth value against the rule for its field's type."""
+    issues: List[ValidationIssue] = []
+    for field_id, value in ground_truth.items():
+        ftype = field_types.get(field_id)
+        rule = VALUE_RULES.get(ftype) if ftype else None
+        if rule is None:
+            continue
+        problem = rule(value, window)
+        if problem is not None:
+            issues.append(
+                ValidationIssue(
+                    form_id,
+                    f"groundTruth.{field_id}",
+                    ftype,
+                    problem[0],
+                    f"{problem[1]} in groundTruth[{field_id}]",
+                )
+            )
+    return issues
+
+
+def validate_form_dict(form: Dict[str, Any], window: Optional[DateWindow] = None) -> List[ValidationIssue]:
+    """
+    Fast rule check of a raw form dict, without building Pydantic models.
+
+    Covers the same value rules as FormField / FormDefinition in one pass over
+    the form's fields and groundTruth; structural checks stay with Pydantic.
+    """
+    form_id = str(form.get("id", ""))
+    field_types: Dict[str, str] = {}
+    issues: List[ValidationIssue] = []
+    for p_idx, page in enumerate(form.get("pages") or []):
+        for f_idx, field in enumerate(page.get("fields") or []):
+            ftype = field.get("type")
+            field_types[field.get("id")] = ftype
+            if ftype in OPTION_RULE_TYPES:
+                issues.extend(
+                    check_field_definition(
+                        form_id,
+                        f"pages[{p_idx}].fields[{f_idx}]",
+                        ftype,
+                        field.get("options"),
+                        field.get("defaultValue"),
+                    )
+                )
+    issues.extend(check_ground_truth(form_id, field_types, form.get("groundTruth") or {}, window))
+    return issues
+
+
+# ============== PYDANTIC MODELS ==============
+
+# Defined in form_models.py; importing Pydantic and building them takes far longer than the rest of this module
+_MODEL_NAMES = frozenset({
+    "ChunkField", "FormField", "Page", "NavigationItem", "SidebarLink", "SidebarContent", "FooterLink",
+    "FooterLinkGroup", "WebsiteContext", "FormDefinition", "TrainingTask", "ConfigForm", "FormBatch",
+    "ValidationError",
+})
+
+
+def __getattr__(name: str) -> Any:
+    if name not in _MODEL_NAMES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    import form_models
+
+    value = getattr(form_models, name)
+    globals()[name] = value
+    return value
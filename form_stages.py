@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Post-processing stages for generated forms.
+
+A stage is a function `stage(forms, existing) -> forms` over the forms new to
+a config, in form-ID order; `existing` are the forms already in it. Stages
+run when forms are compacted into the config (form_store.compact_stores), so
+their result depends only on the set of forms, never on the order batches
+finished in, whether a run was resumed or split across workers.
+
+    python form_stages.py public/llm_generated_config.json [--write]
+"""
+
+import argparse
+import copy
+import json
+from collections import Counter
+from typing import Any, Callable, Dict, List, Mapping, Optional, Sequence, Tuple
+
+DATE_STYLES = ["default", "text-input", "dropdown"]
+RANGE_STYLES = ["single-calendar", "dual-calendar"]
+
+Stage = Callable[[Dict[str, Dict[str, Any]], Optional[Mapping[str, Dict[str, Any]]]], Dict[str, Dict[str, Any]]]
+
+
+def form_id_key(form_id: str) -> Any:
+    """Sort key putting numeric IDs in numeric order, before any others."""
+    return (0, int(form_id), "") if form_id.isdigit() else (1, 0, form_id)
+
+
+def _least_used(styles: List[str], counts: Counter) -> str:
+    # min() keeps the first of equal counts, so a tie goes to the earlier style
+    return min(styles, key=lambda style: counts[style])
+
+
+def assign_picker_styles(
+    forms: Dict[str, Dict[str, Any]],
+    existing: Optional[Mapping[str, Dict[str, Any]]] = None,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Set dateStyle / rangeStyle on every date and date-range field of `forms`.
+
+    Forms are visited in ID order and each field gets the style used least
+    so far, counting the styles of `existing`; ties go to the earlier style
+    in DATE_STYLES / RANGE_STYLES. From an empty or evenly split corpus that
+    is a round-robin over the corpus's fields in form-ID order, so every
+    style stays within one field of the others and adding forms never
+    restyles the forms already in the config.
+    """
+    date_counts, range_counts = style_counts(existing or {})
+    for form_id in sorted(forms, key=form_id_key):
+        for page in forms[form_id].get("pages", []):
+            for field in page.get("fields", []):
+                if field.get("type") == "date":
+                    field["dateStyle"] = _least_used(DATE_STYLES, date_counts)
+                    date_counts[field["dateStyle"]] += 1
+                elif field.get("type") == "date-range":
+                    field["rangeStyle"] = _least_used(RANGE_STYLES, range_counts)
+                    range_counts[field["rangeStyle"]] += 1
+    return forms
+
+
+STAGES: List[Stage] = [assign_picker_styles]
+
+
+def apply_stages(
+    forms: Dict[str, Dict[str, Any]],
+    existing: Optional[Mapping[str, Dict[str, Any]]] = None,
+    stages: Optional[Sequence[Stage]] = None,
+) -> Dict[str, Dict[str, Any]]:
+    """Run `stages` (default: STAGES) over the forms new to a config, in order."""
+    for stage in STAGES if stages is None else stages:
+        forms = stage(forms, existing)
+    return forms
+
+
+def without_stages(form: Dict[str, Any]) -> Dict[str, Any]:
+    """A copy of `form` without the keys the stages set, to compare a stored form with its compacted copy."""
+    pages = [
+        {**page, "fields": [
+            {key: value for key, value in field.items() if key not in ("dateStyle", "rangeStyle")}
+            for field in page.get("fields", [])
+        ]}
+        for page in form.get("pages", [])
+    ]
+    return {**form, "pages": pages}
+
+
+def style_counts(forms: Mapping[str, Dict[str, Any]]) -> Tuple[Counter, Counter]:
+    date_styles: Counter = Counter()
+    range_styles: Counter = Counter()
+    for form in forms.values():
+        for page in form.get("pages", []):
+            for field in page.get("fields", []):
+                if field.get("type") == "date":
+                    date_styles[field.get("dateStyle", "not-set")] += 1
+                elif field.get("type") == "date-range":
+                    range_styles[field.get("rangeStyle", "not-set")] += 1
+    return date_styles, range_styles
+
+
+def _print_styles(title: str, forms: Dict[str, Dict[str, Any]]) -> None:
+    date_styles, range_styles = style_counts(forms)
+    print(f"\n{title}")
+    print("-" * 60)
+    for style, count in sorted(date_styles.items()):
+        print(f"  dateStyle  {style:18s}: {count:4d}")
+    for style, count in sorted(range_styles.items()):
+        print(f"  rangeStyle {style:18s}: {count:4d}")
+
+
+def main():
+    # form_store runs the stages on compaction, so it is imported here rather than at the top
+    from form_store import write_json_atomic
+
+    parser = argparse.ArgumentParser(description="Re-run the post-processing stages over a whole form config.")
+    parser.add_argument("config", help="form config JSON, e.g. public/llm_generated_config.json")
+    parser.add_argument("--write", action="store_true", help="atomically rewrite the config with the result")
+    args = parser.parse_args()
+
+    with open(args.config, "r", encoding="utf-8") as f:
+        forms = json.load(f)
+
+    _print_styles("BEFORE", forms)
+    result = apply_stages(copy.deepcopy(forms))
+    _print_styles("AFTER", result)
+
+    if args.write:
+        write_json_atomic(args.config, result)
+        print(f"\n✓ Wrote {len(result)} forms to {args.config}")
+    else:
+        print("\nDry run; pass --write to save the result")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+"""
+Append-only segment store for generated forms.
+
+generate_pages.py appends each finished batch as one immutable JSONL segment
+instead of rewriting public/llm_generated_config.json, so a save costs
+O(batch) and a crash can never corrupt forms that were already committed.
+`compact` folds the store into the merged JSON the frontend loads, running the
+post-processing stages (form_stages.py) over the forms it adds.
+
+Layout of a store directory:
+    seg-<writer>-<seq>.jsonl   committed segments, one {"id", "form"} record per line
+    index.jsonl                one line per committed segment: {"segment", "entries": {id: [offset, length]}}
+    shards/<worker>/           per-worker stores written by `generate_pages.py --worker` (see id_leases.py)
+
+    python form_store.py stats   [--store DIR]
+    python form_store.py compact [--store DIR] [--output public/llm_generated_config.json] [--keep]
+"""
+
+import argparse
+import json
+import os
+import re
+import tempfile
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from form_stages import apply_stages, form_id_key, without_stages
+
+DEFAULT_STORE_DIR = ".form_store/llm_generated_config"
+DEFAULT_OUTPUT_FILE = "public/llm_generated_config.json"
+
+INDEX_FILE = "index.jsonl"
+SHARDS_DIR = "shards"
+WRITER_RE = re.compile(r"^[A-Za-z0-9_.]+$")
+SEGMENT_RE = re.compile(r"^seg-(?P<writer>[A-Za-z0-9_.]+)-(?P<seq>\d+)\.jsonl$")
+
+
+def _fsync_dir(path: str) -> None:
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return  # e.g. Windows, where directories cannot be opened
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def write_json_atomic(path: str, data: Any, indent: Optional[int] = 2) -> None:
+    """Write JSON to a temp file in the same directory, fsync it, then rename over `path`."""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".json")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=indent, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    _fsync_dir(directory)
+
+
+class FormStore:
+    """
+    Append-only, segment-per-commit store of form definitions.
+
+    Later commits win when the same form ID appears in several segments. The
+    id -> (segment, offset, length) index lets single forms be read back
+    without scanning the store.
+    """
+
+    def __init__(self, root: str = DEFAULT_STORE_DIR, writer: str = "main"):
+        if not WRITER_RE.match(writer):
+            raise ValueError(f"Invalid writer name: {writer!r}")
+        self.root = root
+        self.writer = writer
+        self._index: Dict[str, Tuple[str, int, int]] = {}
+        self._segments: List[str] = []
+        self._segment_set: Set[str] = set()
+        self._seq = 0  # this writer's highest segment number, found once in _load()
+        os.makedirs(root, exist_ok=True)
+        self._load()
+
+    # ---------- loading / recovery ----------
+
+    def _segment_files(self) -> List[str]:
+        return sorted(name for name in os.listdir(self.root) if SEGMENT_RE.match(name))
+
+    def _load(self) -> None:
+        index_path = os.path.join(self.root, INDEX_FILE)
+        if os.path.exists(index_path):
+            with open(index_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # torn final line from a crash; the segment is rescanned below
+                    self._apply_index_entry(entry)
+
+        # Drop this writer's uncommitted temp segments and index any segment the index missed
+        for name in os.listdir(self.root):
+            if name.startswith(f"seg-{self.writer}-") and name.endswith(".tmp"):
+                os.remove(os.path.join(self.root, name))
+        for name in self._segment_files():
+            if name not in self._segment_set:
+                self._append_index_entry(name, self._scan_segment(name))
+            match = SEGMENT_RE.match(name)
+            if match.group("writer") == self.writer:
+                self._seq = max(self._seq, int(match.group("seq")))
+
+    def _apply_index_entry(self, entry: Dict[str, Any]) -> None:
+        segment = entry["segment"]
+        if not os.path.exists(os.path.join(self.root, segment)):
+            return
+        if segment not in self._segment_set:
+            self._segments.append(segment)
+            self._segment_set.add(segment)
+        for form_id, (offset, length) in entry["entries"].items():
+            self._index[form_id] = (segment, offset, length)
+
+    def _scan_segment(self, segment: str) -> Dict[str, List[int]]:
+        entries: Dict[str, List[int]] = {}
+        offset = 0
+        with open(os.path.join(self.root, segment), "rb") as f:
+            for line in f:
+                record = json.loads(line)
+                entries[record["id"]] = [offset, len(line)]
+                offset += len(line)
+        return entries
+
+    def _append_index_entry(self, segment: str, entries: Dict[str, List[int]]) -> None:
+        line = json.dumps({"segment": segment, "entries": entries}, ensure_ascii=False) + "\n"
+        with open(os.path.join(self.root, INDEX_FILE), "a", encoding="utf-8") as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        self._apply_index_entry({"segment": segment, "entries": entries})
+
+    # ---------- writing ----------
+
+    def _next_segment_name(self) -> str:
+        # Only this writer names its segments, so the counter needs no directory listing
+        self._seq += 1
+        return f"seg-{self.writer}-{self._seq:06d}.jsonl"
+
+    def append(self, forms: Dict[str, Dict[str, Any]]) -> Optional[str]:
+        """Atomically commit `forms` as one new segment. Returns the segment name."""
+        if not forms:
+            return None
+
+        segment = self._next_segment_name()
+        entries: Dict[str, List[int]] = {}
+        tmp_path = os.path.join(self.root, segment + ".tmp")
+        offset = 0
+        with open(tmp_path, "wb") as f:
+            for form_id, form in forms.items():
+                line = (json.dumps({"id": form_id, "form": form}, ensure_ascii=False) + "\n").encode("utf-8")
+                f.write(line)
+                entries[form_id] = [offset, len(line)]
+                offset += len(line)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, os.path.join(self.root, segment))
+        _fsync_dir(self.root)
+
+        self._append_index_entry(segment, entries)
+        return segment
+
+    # ---------- reading ----------
+
+    def __contains__(self, form_id: str) -> bool:
+        return form_id in self._index
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def ids(self) -> List[str]:
+        return list(self._index)
+
+    def segments(self) -> List[str]:
+        return list(self._segments)
+
+    def get(self, form_id: str) -> Dict[str, Any]:
+        segment, offset, length = self._index[form_id]
+        with open(os.path.join(self.root, segment), "rb") as f:
+            f.seek(offset)
+            return json.loads(f.read(length))["form"]
+
+    def iter_forms(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Yield the latest version of every form, reading each segment sequentially."""
+        for segment in self._segments:
+            with open(os.path.join(self.root, segment), "rb") as f:
+                for line in f:
+                    record = json.loads(line)
+                    if self._index.get(record["id"], (None,))[0] == segment:
+                        yield record["id"], record["form"]
+
+    # ---------- compaction ----------
+
+    def clear(self) -> None:
+        """Remove every committed segment and the index."""
+        for name in self._segment_files():
+            os.remove(os.path.join(self.root, name))
+        index_path = os.path.join(self.root, INDEX_FILE)
+        if os.path.exists(index_path):
+            os.remove(index_path)
+        self._index.clear()
+        self._segments.clear()
+        self._segment_set.clear()
+
+    def compact(self, output_file: str = DEFAULT_OUTPUT_FILE, keep: bool = False) -> int:
+        """
+        Merge the store into `output_file` (existing forms first, store forms
+        overriding), write it atomically, then clear the store unless `keep`.
+        Returns the number of forms in the merged file.
+        """
+        return compact_stores([self], output_file, keep=keep)
+
+
+def compact_stores(stores: Iterable[FormStore], output_file: str = DEFAULT_OUTPUT_FILE, keep: bool = False) -> int:
+    """
+    Merge several stores into `output_file` with one atomic write; later stores
+    win on duplicate IDs. Forms new to `output_file` go through the
+    post-processing stages and are added in ID order, whatever order their
+    segments were committed in. A form already in `output_file` is never
+    replaced by a different one: the conflict is reported, the stored form is
+    left out, and no store is cleared so it can be inspected. Otherwise each
+    store is cleared afterwards unless `keep`.
+    """
+    stores = list(stores)
+    merged: Dict[str, Any] = {}
+    if os.path.exists(output_file):
+        with open(output_file, "r", encoding="utf-8") as f:
+            merged = json.load(f)
+    existing = set(merged)
+    conflicts: List[str] = []
+    added: Dict[str, Any] = {}
+    for store in stores:
+        for form_id, form in store.iter_forms():
+            if form_id in existing:
+                # Stored forms have not been through the stages yet
+                if without_stages(merged[form_id]) != without_stages(form):
+                    conflicts.append(form_id)
+                continue
+            added[form_id] = form
+    added = apply_stages(added, merged)
+    for form_id in sorted(added, key=form_id_key):
+        merged[form_id] = added[form_id]
+
+    write_json_atomic(output_file, merged)
+    if conflicts:
+        print(f"⚠ Forms {', '.join(sorted(set(conflicts)))} already exist in {output_file} with different content; "
+              f"kept those and left the stores uncleared")
+    elif not keep:
+        for store in stores:
+            store.clear()
+    return len(merged)
+
+
+def shard_dir(root: str, worker: str) -> str:
+    """Directory of `worker`'s shard inside the store at `root`."""
+    if not WRITER_RE.match(worker):
+        raise ValueError(f"Invalid worker name: {worker!r}")
+    return os.path.join(root, SHARDS_DIR, worker)
+
+
+def shard_workers(root: str) -> List[str]:
+    """Names of the workers that have a shard in the store at `root`."""
+    shards = os.path.join(root, SHARDS_DIR)
+    if not os.path.isdir(shards):
+        return []
+    return sorted(name for name in os.listdir(shards) if WRITER_RE.match(name))
+
+
+def stored_ids(root: str) -> Set[str]:
+    """
+    Form IDs committed to the store at `root`, read without opening it as a
+    writer (so another process's temp segments are left alone).
+    """
+    ids: Set[str] = set()
+    if not os.path.isdir(root):
+        return ids
+    indexed: Set[str] = set()
+    index_path = os.path.join(root, INDEX_FILE)
+    if os.path.exists(index_path):
+        with open(index_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                indexed.add(entry["segment"])
+                ids.update(entry["entries"])
+    for name in os.listdir(root):
+        if SEGMENT_RE.match(name) and name not in indexed:
+            try:
+                with open(os.path.join(root, name), "rb") as f:
+                    ids.update(json.loads(line)["id"] for line in f)
+            except FileNotFoundError:
+                continue  # removed by a concurrent compaction
+    return ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or compact the append-only form store.")
+    parser.add_argument("command", choices=["stats", "compact"])
+    parser.add_argument("--store", default=DEFAULT_STORE_DIR, help=f"store directory (default: {DEFAULT_STORE_DIR})")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT_FILE, help=f"merged JSON file (default: {DEFAULT_OUTPUT_FILE})")
+    parser.add_argument("--keep", action="store_true", help="keep the store's segments after compacting")
+    args = parser.parse_args()
+
+    store = FormStore(args.store)
+    if args.command == "stats":
+        print(f"Store: {args.store}")
+        print(f"  Segments: {len(store.segments())}")
+        print(f"  Forms:    {len(store)}")
+        return
+
+    pending = len(store)
+    total = store.compact(args.output, keep=args.keep)
+    print(f"✓ Compacted {pending} stored forms into {args.output} ({total} forms total)")
+
+
+if __name__ == "__main__":
+    main()
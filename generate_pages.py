@@ -1,23 +1,58 @@
+import argparse
 import json
 import os
 import random
-import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime, timedelta
-from typing import Dict, Any, List, Optional, Literal, Union
-
-from dotenv import load_dotenv
-from openai import OpenAI
-from pydantic import BaseModel, Field, model_validator
-
-# ============== ENV + CLIENT SETUP ==============
-
-load_dotenv()
-
-api_key = os.getenv("OPENAI_API_KEY")
-if not api_key:
-    raise ValueError("OPENAI_API_KEY not found. Put OPENAI_API_KEY=your-key in .env")
-
-client = OpenAI(api_key=api_key)
+from typing import Dict, Any, Callable, Container, Deque, Iterable, Iterator, List, Optional, Set, get_args
+
+from pydantic import ValidationError
+
+from check_distribution import analyze_forms, merge_statistics
+from coverage_planner import CoveragePlanner, CoverageTarget, missing_required_types
+from form_schema import (
+    DEFAULT_BATCH_SIZE,
+    DateWindow,
+    FieldType,
+    FormBatch,
+    FormDefinition,
+    VALID_ADDRESSES_LIST,
+    VALID_COUNTRIES_LIST,
+    VALID_STATES_LIST,
+)
+from fidelity_check import FormMatcher
+from form_dedupe import DEFAULT_THRESHOLD as DEFAULT_DEDUPE_THRESHOLD, DedupeIndex
+from form_store import DEFAULT_STORE_DIR, FormStore, WRITER_RE, shard_dir, shard_workers, stored_ids
+from id_leases import DEFAULT_LEASE_TTL, LeaseHeartbeat, LeaseTable, lease_file_for
+from json_stream import JsonArrayStream
+from llm_batch import BatchRequestWriter, BatchResults, add_batch_arguments, batch_results_from_args
+from llm_metrics import MetricsRecorder, add_metrics_arguments, metrics_from_args
+from llm_cache import (
+    CompletionResult,
+    ResponseCache,
+    StreamCancelled,
+    add_cache_arguments,
+    cache_from_args,
+    cached_completion,
+    exit_on_replay_misses,
+    streamed_completion,
+)
+from work_queue import DEFAULT_QUEUE_FILE, FAILED, WorkItem, WorkQueue
+
+# ============== CLIENT SETUP ==============
+#
+# The OpenAI client is created by llm_cache.get_client() on the first LLM call
+# that misses the cache; the schema and validators live in form_schema.py.
+
+# Optional LLM response cache and call metrics, configured from the CLI in main()
+response_cache: Optional[ResponseCache] = None
+# Responses read from a Batch API results file (--batch-ingest) instead of calling the API
+batch_results: Optional[BatchResults] = None
+metrics: Optional[MetricsRecorder] = None
 
 # ============== CONSTANTS ==============
 
@@ -61,273 +96,6 @@ INDUSTRIES = [
     "Wholesale seller post form",
 ]
 
-FieldType = Literal[
-    "text",
-    "textarea",
-    "phone",
-    "email",
-    "url",
-    "checkbox",
-    "switch",
-    "select",
-    "radio",
-    "multiselect",
-    "searchable-multiselect",
-    "date",
-    "time",
-    "date-range",
-    "number",
-    "slider",
-    "currency",
-    "star-rating",
-    "home-address",
-    "country",
-    "state",
-    "zip",
-    "credit-card",
-    "expiration-date",
-    "cvv",
-    "reactive-chunks",
-]
-
-FormType = Literal["single-page", "multipage"]
-LayoutType = Literal["single-column", "two-column", "split-screen", "wizard-style", "website-style"]
-
-VALID_COUNTRIES_LIST = [
-    "United States",
-    "Canada",
-    "United Kingdom",
-    "Australia",
-    "Germany",
-    "France",
-    "Japan",
-    "China",
-    "India",
-    "Brazil",
-    "Mexico",
-    "Spain",
-    "Italy",
-    "South Korea",
-    "Netherlands",
-    "Sweden",
-]
-
-VALID_STATES_LIST = [
-    "Alabama", "Alaska", "Arizona", "Arkansas", "California", "Colorado", "Connecticut", "Delaware",
-    "Florida", "Georgia", "Hawaii", "Idaho", "Illinois", "Indiana", "Iowa", "Kansas",
-    "Kentucky", "Louisiana", "Maine", "Maryland", "Massachusetts", "Michigan", "Minnesota", "Mississippi",
-    "Missouri", "Montana", "Nebraska", "Nevada", "New Hampshire", "New Jersey", "New Mexico", "New York",
-    "North Carolina", "North Dakota", "Ohio", "Oklahoma", "Oregon", "Pennsylvania", "Rhode Island", "South Carolina",
-    "South Dakota", "Tennessee", "Texas", "Utah", "Vermont", "Virginia", "Washington", "West Virginia",
-    "Wisconsin", "Wyoming",
-]
-
-VALID_ADDRESSES_LIST = [
-    "123 Main Street, New York, NY 10001",
-    "123 Main St, Boston, MA 02101",
-    "1234 Main Street, Los Angeles, CA 90001",
-    "1234 Main St, Chicago, IL 60601",
-    "12 Main Avenue, New York, NY 10002",
-    "12 Main Ave, San Francisco, CA 94102",
-    "123 Oak Street, Seattle, WA 98101",
-    "123 Oak St, Portland, OR 97201",
-    "1234 Oak Street, Denver, CO 80201",
-    "1234 Oak Ave, Phoenix, AZ 85001",
-    "456 Park Avenue, New York, NY 10022",
-    "456 Park Ave, Miami, FL 33101",
-    "4567 Park Avenue, Houston, TX 77001",
-    "4567 Park St, Atlanta, GA 30301",
-    "789 Elm Street, Philadelphia, PA 19101",
-    "789 Elm St, Washington, DC 20001",
-    "7890 Elm Street, Dallas, TX 75201",
-    "7890 Elm Ave, San Diego, CA 92101",
-    "321 Pine Street, Austin, TX 78701",
-    "321 Pine St, Nashville, TN 37201",
-    "3210 Pine Avenue, Las Vegas, NV 89101",
-    "3210 Pine St, Minneapolis, MN 55401",
-    "555 Broadway, New York, NY 10012",
-    "555 Broadway St, San Antonio, TX 78201",
-    "5555 Broadway Avenue, Columbus, OH 43201",
-]
-
-# ============== PYDANTIC MODELS ==============
-
-
-class ChunkField(BaseModel):
-    id: str
-    type: FieldType
-    label: str
-    required: bool = True
-    placeholder: Optional[str] = None
-    options: Optional[List[str]] = None
-    min: Optional[float] = None
-    max: Optional[float] = None
-    step: Optional[float] = None
-    defaultValue: Optional[Union[float, str]] = None
-    currency: Optional[str] = None
-    maxStars: Optional[int] = None
-    maxLength: Optional[int] = None
-    allowed: Optional[str] = None  # "before" / "after"
-
-    model_config = {"extra": "forbid"}
-
-
-class FormField(BaseModel):
-    id: str
-    type: FieldType
-    label: str
-    required: bool
-    placeholder: Optional[str] = None
-    options: Optional[List[str]] = None
-    min: Optional[float] = None
-    max: Optional[float] = None
-    step: Optional[float] = None
-    defaultValue: Optional[Union[float, str]] = None
-    currency: Optional[str] = None
-    maxStars: Optional[int] = None
-    maxLength: Optional[int] = None
-    allowed: Optional[str] = None
-    dateStyle: Optional[str] = None   # assigned post-LLM
-    rangeStyle: Optional[str] = None  # assigned post-LLM
-    chunkFields: Optional[List[ChunkField]] = None
-
-    model_config = {"extra": "forbid"}
-
-    @model_validator(mode="after")
-    def validate_country_state_address(self):
-        if self.type == "country":
-            if self.options:
-                invalid = [o for o in self.options if o not in VALID_COUNTRIES_LIST]
-                if invalid:
-                    raise ValueError(f"Invalid countries in options: {invalid}")
-            if isinstance(self.defaultValue, str) and self.defaultValue not in VALID_COUNTRIES_LIST:
-                raise ValueError(f"Invalid default country: {self.defaultValue}")
-
-        if self.type == "state":
-            if self.options:
-                invalid = [o for o in self.options if o not in VALID_STATES_LIST]
-                if invalid:
-                    raise ValueError(f"Invalid states in options: {invalid}")
-            if isinstance(self.defaultValue, str) and self.defaultValue not in VALID_STATES_LIST:
-                raise ValueError(f"Invalid default state: {self.defaultValue}")
-
-        if self.type == "home-address":
-            if isinstance(self.defaultValue, str) and self.defaultValue not in VALID_ADDRESSES_LIST:
-                raise ValueError(f"Invalid home-address default: {self.defaultValue}")
-
-        return self
-
-
-class Page(BaseModel):
-    pageNumber: int
-    fields: List[FormField]
-
-
-class NavigationItem(BaseModel):
-    label: str
-    href: str
-    active: Optional[bool] = None
-
-
-class SidebarLink(BaseModel):
-    label: str
-    href: str
-
-
-class SidebarContent(BaseModel):
-    title: str
-    content: str
-    links: Optional[List[SidebarLink]] = None
-
-
-class FooterLink(BaseModel):
-    label: str
-    href: str
-
-
-class FooterLinkGroup(BaseModel):
-    title: str
-    links: List[FooterLink]
-
-
-class WebsiteContext(BaseModel):
-    companyName: str
-    logoUrl: Optional[str] = Field(
-        default=None,
-        description="DO NOT generate. Leave null; UI uses placeholder logo."
-    )
-    themeColor: str
-    navigationItems: List[NavigationItem]
-    heroTitle: str
-    heroSubtitle: str
-    sidebarContent: Optional[SidebarContent] = None
-    footerLinks: List[FooterLinkGroup]
-
-
-class FormDefinition(BaseModel):
-    id: str
-    title: str
-    description: str
-    type: FormType
-    layout: LayoutType
-    inputToLLM: str
-    pages: List[Page]
-    websiteContext: Optional[WebsiteContext] = None
-    groundTruth: Dict[str, Any]
-
-    model_config = {"extra": "forbid"}
-
-    @model_validator(mode="after")
-    def validate_ground_truth_country_state_address(self):
-        field_type_map: Dict[str, FieldType] = {}
-        for page in self.pages:
-            for field in page.fields:
-                field_type_map[field.id] = field.type
-
-        for field_id, value in self.groundTruth.items():
-            ftype = field_type_map.get(field_id)
-            if ftype == "country":
-                if isinstance(value, str):
-                    if value not in VALID_COUNTRIES_LIST:
-                        raise ValueError(f"Invalid country in groundTruth[{field_id}]: {value}")
-                elif isinstance(value, list):
-                    invalid = [v for v in value if v not in VALID_COUNTRIES_LIST]
-                    if invalid:
-                        raise ValueError(f"Invalid countries in groundTruth[{field_id}]: {invalid}")
-
-            if ftype == "state":
-                if isinstance(value, str):
-                    if value not in VALID_STATES_LIST:
-                        raise ValueError(f"Invalid state in groundTruth[{field_id}]: {value}")
-                elif isinstance(value, list):
-                    invalid = [v for v in value if v not in VALID_STATES_LIST]
-                    if invalid:
-                        raise ValueError(f"Invalid states in groundTruth[{field_id}]: {invalid}")
-
-            if ftype == "home-address":
-                if isinstance(value, str):
-                    if value not in VALID_ADDRESSES_LIST:
-                        raise ValueError(f"Invalid home-address in groundTruth[{field_id}]: {value}")
-                elif isinstance(value, list):
-                    invalid = [v for v in value if v not in VALID_ADDRESSES_LIST]
-                    if invalid:
-                        raise ValueError(f"Invalid home-address values in groundTruth[{field_id}]: {invalid}")
-
-        return self
-
-
-class FormBatch(BaseModel):
-    forms: List[FormDefinition]
-
-    model_config = {"extra": "forbid"}
-
-    @model_validator(mode="after")
-    def validate_batch_size(self):
-        if len(self.forms) != 5:
-            raise ValueError(f"Batch must contain exactly 5 forms, got {len(self.forms)}")
-        return self
-
-
 # ============== FEW-SHOT EXAMPLES (SHORTENED) ==============
 
 FEW_SHOT_EXAMPLES = [
@@ -399,27 +167,6 @@ FEW_SHOT_EXAMPLES = [
 # ============== HELPERS ==============
 
 
-def assign_date_styles_round_robin(
-    form_dict: Dict[str, Any],
-    date_field_counter: int,
-    range_field_counter: int,
-) -> tuple[Dict[str, Any], int, int]:
-    """Assign dateStyle/rangeStyle in round-robin across all forms."""
-    date_styles = ["default", "text-input", "dropdown"]
-    range_styles = ["single-calendar", "dual-calendar"]
-
-    for page in form_dict.get("pages", []):
-        for field in page.get("fields", []):
-            if field.get("type") == "date":
-                field["dateStyle"] = date_styles[date_field_counter % len(date_styles)]
-                date_field_counter += 1
-            elif field.get("type") == "date-range":
-                field["rangeStyle"] = range_styles[range_field_counter % len(range_styles)]
-                range_field_counter += 1
-
-    return form_dict, date_field_counter, range_field_counter
-
-
 def build_system_prompt(today: datetime, min_date: datetime, max_date: datetime) -> str:
     today_str = today.strftime("%m-%d-%Y")
     min_str = min_date.strftime("%m-%d-%Y")
@@ -498,26 +245,30 @@ def build_user_prompt(
     today: datetime,
     min_date: datetime,
     max_date: datetime,
+    required_types: Optional[List[List[str]]] = None,
 ) -> str:
     today_str = today.strftime("%m-%d-%Y")
     min_str = min_date.strftime("%m-%d-%Y")
     max_str = max_date.strftime("%m-%d-%Y")
 
+    num_forms = len(form_ids)
     form_specs = []
-    for i in range(5):
-        form_specs.append(
-            f"""FORM {i+1}:
+    for i in range(num_forms):
+        spec = f"""FORM {i+1}:
 - Form ID: "{form_ids[i]}" (use this exact string)
 - Industry: {industries[i]}
 - Layout: "{layouts[i]}" (use this exact layout string)
 - Make the fields and copy realistic for this industry."""
-        )
+        if required_types and required_types[i]:
+            types = ", ".join(f'"{t}"' for t in required_types[i])
+            spec += f"\n- MUST include at least one field of each of these types: {types} (follow the field type rules)."
+        form_specs.append(spec)
     form_specs_str = "\n\n".join(form_specs)
 
     return f"""
-Generate EXACTLY 5 complete form definitions.
+Generate EXACTLY {num_forms} complete form definitions.
 
-For EACH of the 5 forms:
+For EACH of the {num_forms} forms:
 
 1. Use the Pydantic-derived JSON schema you see as the target structure (FormBatch → forms[]).
 2. Generate properties in this order:
@@ -555,27 +306,65 @@ Return ONLY JSON that matches the provided JSON schema.
 # ============== LLM CALL ==============
 
 
-def generate_form_batch(
+def build_retry_prompt(rejected: Dict[str, str]) -> str:
+    """Follow-up note listing why each re-requested form was rejected last time."""
+    lines = [f'- Form "{form_id}": {error}' for form_id, error in rejected.items()]
+    return (
+        "A previous attempt at these forms was rejected:\n"
+        + "\n".join(lines)
+        + "\nFix these problems in the new forms, following the rules in the system prompt exactly."
+    )
+
+
+def summarize_validation_error(e: Exception, limit: int = 3) -> str:
+    if isinstance(e, ValidationError):
+        parts = []
+        for err in e.errors()[:limit]:
+            loc = ".".join(str(p) for p in err.get("loc", ()))
+            parts.append(f"{loc}: {err.get('msg')}" if loc else str(err.get("msg")))
+        if e.error_count() > limit:
+            parts.append(f"(+{e.error_count() - limit} more)")
+        return "; ".join(parts)
+    return str(e)
+
+
+def form_batch_id(form_ids: List[str]) -> str:
+    """Batch API custom_id for a request covering `form_ids`, e.g. "forms-27-28-29"."""
+    return "forms-" + "-".join(form_ids)
+
+
+def parse_form_batch_id(custom_id: str) -> Optional[List[str]]:
+    """The form IDs in a form_batch_id, or None if `custom_id` is not one."""
+    prefix, _, rest = custom_id.partition("-")
+    if prefix != "forms" or not rest:
+        return None
+    return rest.split("-")
+
+
+def build_form_request(
     form_ids: List[str],
     industries: List[str],
     layouts: List[str],
-) -> List[Dict[str, Any]]:
-    if len(form_ids) != 5 or len(industries) != 5 or len(layouts) != 5:
-        raise ValueError("generate_form_batch expects exactly 5 form_ids, industries, and layouts")
-
-    today = datetime.now()
+    today: datetime,
+    rejected: Optional[Dict[str, str]] = None,
+    max_output_tokens: Optional[int] = None,
+    required_types: Optional[List[List[str]]] = None,
+) -> Dict[str, Any]:
+    """The chat completion request for one batch of forms."""
     min_date = today - timedelta(days=730)
     max_date = today + timedelta(days=730)
 
     system_prompt = build_system_prompt(today, min_date, max_date)
-    user_prompt = build_user_prompt(form_ids, industries, layouts, today, min_date, max_date)
+    user_prompt = build_user_prompt(form_ids, industries, layouts, today, min_date, max_date, required_types)
+    if rejected:
+        user_prompt += "\n" + build_retry_prompt(rejected)
 
     schema = FormBatch.model_json_schema()
     schema["additionalProperties"] = False  # batch object itself
 
-    response = client.beta.chat.completions.parse(
-        model="gpt-4o",
-        messages=[
+    request = {
+        "model": "gpt-4o",
+        "messages": [
             {"role": "system", "content": system_prompt},
             {
                 "role": "user",
@@ -584,49 +373,838 @@ def generate_form_batch(
             },
             {"role": "user", "content": user_prompt},
         ],
-        response_format={
+        "response_format": {
             "type": "json_schema",
             "json_schema": {"name": "form_batch", "strict": False, "schema": schema},
         },
-        temperature=0.7,
-    )
+        "temperature": 0.7,
+    }
+    if max_output_tokens is not None:
+        request["max_tokens"] = max_output_tokens
+    return request
+
 
-    content = response.choices[0].message.content
-    if isinstance(content, str):
-        parsed = json.loads(content)
+def request_forms(
+    form_ids: List[str],
+    industries: List[str],
+    layouts: List[str],
+    today: datetime,
+    rejected: Optional[Dict[str, str]] = None,
+    on_raw_form: Optional[Callable[[int, Any], None]] = None,
+    max_output_tokens: Optional[int] = None,
+    required_types: Optional[List[List[str]]] = None,
+) -> tuple[List[Any], CompletionResult]:
+    """
+    One LLM call for the given forms; returns the raw `forms` list and the completion.
+    A response truncated at `max_output_tokens` still yields every form it completed.
+
+    With `on_raw_form` the response is streamed and `on_raw_form(position, raw_form)`
+    runs as soon as each form's closing brace arrives. It may raise
+    StreamCancelled to stop the stream; the forms received so far are returned.
+
+    With --batch-ingest the response comes from the results file entry for
+    exactly these form IDs instead.
+    """
+    request = build_form_request(form_ids, industries, layouts, today, rejected, max_output_tokens, required_types)
+
+    if on_raw_form is not None:
+        stream = JsonArrayStream("forms")
+        forms: List[Any] = []
+
+        def on_delta(text: str) -> None:
+            for raw_form in stream.feed(text):
+                forms.append(raw_form)
+                on_raw_form(len(forms) - 1, raw_form)
+
+        completion = streamed_completion(request, response_cache, on_delta)
+        return forms, completion
+
+    if batch_results is not None:
+        completion = batch_results.completion(form_batch_id(form_ids))
     else:
-        parsed = content
+        completion = cached_completion(request, response_cache)
+    if completion.finish_reason == "length":
+        return JsonArrayStream("forms").feed(completion.content), completion
+    parsed = json.loads(completion.content)
+
+    forms = parsed.get("forms") if isinstance(parsed, dict) else None
+    if not isinstance(forms, list):
+        raise ValueError("Response JSON has no 'forms' array")
+    return forms, completion
+
+
+def validate_form(
+    raw_form: Any,
+    form_id: str,
+    layout: str,
+    window: Optional[DateWindow] = None,
+) -> Dict[str, Any]:
+    """Validate one raw form from a batch response, forcing the requested ID and layout."""
+    form = FormDefinition.model_validate(raw_form, context={"date_window": window})
+    form.id = form_id
+    form.layout = layout
+    return form.model_dump(exclude_none=False)
+
+
+@dataclass
+class AttemptRecord:
+    """What one LLM call inside generate_form_batch produced."""
+    attempt: int
+    form_ids: List[str]
+    accepted_ids: List[str]
+    rejected: Dict[str, str]
+    returned: int
+    latency: float
+    completion: Optional[CompletionResult]
+    error: Optional[str] = None
+
+
+def _report_attempt(record: AttemptRecord, on_attempt: Optional[Callable[[AttemptRecord], None]]) -> None:
+    if metrics is not None:
+        completion = record.completion
+        metrics.record_call(
+            "form_batch",
+            record.form_ids,
+            record.latency,
+            usage=completion.usage if completion else None,
+            accepted_ids=record.accepted_ids,
+            rejected_ids=list(record.rejected),
+            attempt=record.attempt,
+            finish_reason=completion.finish_reason if completion else None,
+            response_cache_hit=completion.cached if completion else False,
+            error=record.error,
+        )
+    if on_attempt is not None:
+        on_attempt(record)
+
 
-    batch = FormBatch(**parsed)
+def generate_form_batch(
+    form_ids: List[str],
+    industries: List[str],
+    layouts: List[str],
+    max_retries: int = 1,
+    stream: bool = False,
+    max_stream_rejects: int = 2,
+    strict_dates: bool = False,
+    max_output_tokens: Optional[int] = None,
+    required_types: Optional[List[List[str]]] = None,
+    check_form: Optional[Callable[[Dict[str, Any]], Optional[str]]] = None,
+    on_form: Optional[Callable[[Dict[str, Any]], None]] = None,
+    on_attempt: Optional[Callable[[AttemptRecord], None]] = None,
+    first_response: Optional[Future] = None,
+    today: Optional[datetime] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Generate one batch of forms, validating each form on its own.
+
+    Valid forms are kept; rejected ones (and any the model left out) are sent
+    again in a smaller follow-up request, up to `max_retries` times. Returns
+    the accepted forms in requested order, so the result may be shorter than
+    `form_ids` if some forms never validated.
+
+    `on_form` is called with each accepted form as soon as it validates. With
+    `stream=True` that happens while the response is still arriving, and the
+    stream is cancelled once more than `max_stream_rejects` forms of one
+    request have been rejected; the rest are re-requested like any rejects.
+
+    `today` is the date the prompt gives the model (default: now). With
+    `strict_dates`, groundTruth dates outside today ± 730 days (the window
+    the prompt asks for) are rejected too. `required_types[i]` lists field
+    types form i is asked to include (not enforced). `check_form` runs on each form that
+    passed validation and returns a rejection reason, or None to accept it
+    (e.g. the near-duplicate check). `on_attempt` receives an
+    AttemptRecord after every LLM call, including retries.
+
+    `first_response` is a Future for the first call's (raw forms, completion,
+    latency), already sent from a worker thread by run_batches. Only that
+    network call runs on the worker: its forms are validated and checked here,
+    on the calling thread, after the whole response has arrived.
+    """
+    if not form_ids or not (len(form_ids) == len(industries) == len(layouts)):
+        raise ValueError("generate_form_batch expects matching, non-empty form_ids, industries, and layouts")
+
+    today = today or datetime.now()
+    window = DateWindow.around(today) if strict_dates else None
+    started = time.monotonic()
+    accepted: Dict[str, Dict[str, Any]] = {}
+    pending = list(range(len(form_ids)))
+    rejected: Dict[str, str] = {}
+    retry_calls = 0
+    retry_prompt_tokens = 0
+    retry_completion_tokens = 0
+
+    for attempt in range(max_retries + 1):
+        if attempt > 0:
+            print(f"  ↻ Retrying {len(pending)} rejected form(s): {', '.join(form_ids[i] for i in pending)}")
+
+        attempt_rejected: Dict[str, str] = {}
+        attempt_ids = [form_ids[i] for i in pending]
+        attempt_started = time.monotonic()
+        # A prefetched response has fully arrived; only live calls are validated while streaming
+        prefetched = attempt == 0 and first_response is not None
+        streaming = stream and not prefetched
+
+        def handle(pos: int, raw_form: Any) -> None:
+            if pos >= len(pending):
+                return  # model returned more forms than requested
+            i = pending[pos]
+            form_id = form_ids[i]
+            try:
+                form = validate_form(raw_form, form_id, layouts[i], window)
+                reason = check_form(form) if check_form is not None else None
+            except ValidationError as e:
+                reason = summarize_validation_error(e)
+            if reason is not None:
+                attempt_rejected[form_id] = reason
+                print(f"  ✗ Form {form_id} rejected: {reason}")
+                if streaming and len(attempt_rejected) > max_stream_rejects:
+                    print(f"  ✗ {len(attempt_rejected)} forms rejected, cancelling stream")
+                    raise StreamCancelled()
+                return
+            accepted[form_id] = form
+            if streaming:
+                print(f"  ⇢ Form {form_id} validated after {time.monotonic() - started:.1f}s")
+            if on_form is not None:
+                on_form(accepted[form_id])
 
-    # Force IDs/layouts to match requested ones in order
-    results = []
-    for i, form in enumerate(batch.forms):
-        form.id = form_ids[i]
-        form.layout = layouts[i]
-        results.append(form.model_dump(exclude_none=False))
+        try:
+            if prefetched:
+                raw_forms, completion, latency = first_response.result()
+            else:
+                raw_forms, completion = request_forms(
+                    attempt_ids,
+                    [industries[i] for i in pending],
+                    [layouts[i] for i in pending],
+                    today,
+                    rejected=rejected if attempt > 0 else None,
+                    on_raw_form=handle if streaming else None,
+                    max_output_tokens=max_output_tokens,
+                    required_types=[required_types[i] for i in pending] if required_types else None,
+                )
+                latency = time.monotonic() - attempt_started
+        except ValueError as e:
+            _report_attempt(
+                AttemptRecord(
+                    attempt=attempt,
+                    form_ids=attempt_ids,
+                    accepted_ids=[fid for fid in attempt_ids if fid in accepted],
+                    rejected={fid: str(e) for fid in attempt_ids if fid not in accepted},
+                    returned=0,
+                    latency=time.monotonic() - attempt_started,
+                    completion=None,
+                    error=str(e),
+                ),
+                on_attempt,
+            )
+            if attempt == max_retries:
+                raise
+            pending = [i for i in pending if form_ids[i] not in accepted]
+            rejected = {form_ids[i]: f"unparseable batch response ({e})" for i in pending}
+            continue
 
-    return results
+        if not streaming:
+            for pos, raw_form in enumerate(raw_forms):
+                handle(pos, raw_form)
+
+        if attempt > 0:
+            usage = completion.usage or {}
+            retry_calls += 1
+            retry_prompt_tokens += usage.get("prompt_tokens", 0)
+            retry_completion_tokens += usage.get("completion_tokens", 0)
+
+        missing_reason = {
+            "cancelled": "cancelled before form arrived",
+            "length": "response truncated before form was complete",
+        }.get(completion.finish_reason, "form missing from response")
+        for pos in range(len(raw_forms), len(pending)):
+            form_id = form_ids[pending[pos]]
+            attempt_rejected[form_id] = missing_reason
+            print(f"  ✗ Form {form_id} rejected: {missing_reason}")
+
+        _report_attempt(
+            AttemptRecord(
+                attempt=attempt,
+                form_ids=attempt_ids,
+                accepted_ids=[fid for fid in attempt_ids if fid in accepted],
+                rejected=dict(attempt_rejected),
+                returned=len(raw_forms),
+                latency=latency,
+                completion=completion,
+            ),
+            on_attempt,
+        )
+
+        rejected = attempt_rejected
+        pending = [i for i in pending if form_ids[i] not in accepted]
+        if not pending:
+            break
+
+    if retry_calls:
+        print(
+            f"  Retry cost: {retry_calls} call(s), "
+            f"{retry_prompt_tokens} prompt + {retry_completion_tokens} completion tokens"
+        )
+    if pending:
+        print(f"  ✗ Giving up on form(s) {', '.join(form_ids[i] for i in pending)} after {max_retries} retries")
+
+    return [accepted[form_id] for form_id in form_ids if form_id in accepted]
+
+
+# ============== BATCH PLANNING + EXECUTION ==============
+
+LAYOUTS_CYCLE = ["single-column", "two-column", "split-screen", "wizard-style", "website-style"]
+
+
+@dataclass
+class BatchPlan:
+    """Form IDs, industries and layouts for one LLM call, fixed before the call is made."""
+    batch_idx: int
+    form_ids: List[str]
+    industries: List[str]
+    layouts: List[str]
+    lease_id: Optional[str] = None  # set when the IDs were claimed from a shared lease table
+    required_types: Optional[List[List[str]]] = None  # field types each form must include (--coverage)
+
+
+def plan_batch(
+    batch_idx: int,
+    seed: int,
+    first_form_number: int,
+    size: int,
+    existing_llm: Container[str],
+    llm_output_file: str,
+) -> BatchPlan:
+    # Seed per batch so industry shuffle is reproducible
+    random.seed(seed)
+    shuffled_industries = INDUSTRIES.copy()
+    random.shuffle(shuffled_industries)
+
+    plan = BatchPlan(batch_idx=batch_idx, form_ids=[], industries=[], layouts=[])
+    for i in range(size):
+        form_number = first_form_number + i
+        form_id = str(form_number)
+        if form_id in existing_llm:
+            print(f"⚠ Form {form_id} already exists in {llm_output_file}, skipping...")
+            continue
+
+        plan.form_ids.append(form_id)
+        plan.industries.append(shuffled_industries[i % len(shuffled_industries)])
+        plan.layouts.append(LAYOUTS_CYCLE[(form_number - 1) % len(LAYOUTS_CYCLE)])
+    return plan
+
+
+def plan_batches(
+    num_batches: int,
+    start_id: int,
+    existing_llm: Dict[str, Any],
+    llm_output_file: str,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> List[BatchPlan]:
+    """
+    Plan every batch up front so IDs, industries and layouts do not depend on
+    how many batches run at once or in which order they finish.
+    """
+    return [
+        plan_batch(
+            batch_idx,
+            start_id + batch_idx,
+            start_id + batch_idx * batch_size,
+            batch_size,
+            existing_llm,
+            llm_output_file,
+        )
+        for batch_idx in range(num_batches)
+    ]
+
+
+class AdaptiveBatchSizer:
+    """
+    Chooses how many forms to put in the next request.
+
+    Additive increase / multiplicative decrease: one form more after a clean
+    response, one fewer after validation failures, half after a response that
+    was truncated at the output-token limit. The size is also capped by how many
+    forms fit in `max_output_tokens`, using a running average of completion
+    tokens per returned form. Thread-safe, since workers report concurrently.
+    """
+
+    def __init__(
+        self,
+        initial_size: int,
+        min_size: int = 1,
+        max_size: int = 10,
+        max_output_tokens: int = 8000,
+        tokens_per_form: float = 1000.0,
+    ):
+        self.size = initial_size
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_output_tokens = max_output_tokens
+        self.tokens_per_form = tokens_per_form
+        self._lock = threading.Lock()
+
+    def next_size(self) -> int:
+        with self._lock:
+            # Keep ~10% headroom below the output budget
+            fits = int(self.max_output_tokens * 0.9 // max(self.tokens_per_form, 1.0))
+            return max(self.min_size, min(self.size, self.max_size, fits))
+
+    def record(self, record: AttemptRecord) -> None:
+        with self._lock:
+            usage = (record.completion.usage or {}) if record.completion else {}
+            completion_tokens = usage.get("completion_tokens")
+            if completion_tokens and record.returned:
+                observed = completion_tokens / record.returned
+                self.tokens_per_form = 0.7 * self.tokens_per_form + 0.3 * observed
+
+            finish_reason = record.completion.finish_reason if record.completion else None
+            before = self.size
+            if finish_reason == "length":
+                self.size = max(self.min_size, self.size // 2)
+            elif record.rejected or record.error:
+                self.size = max(self.min_size, self.size - 1)
+            elif len(record.form_ids) >= self.size:
+                # Only grow when a full-size request came back clean
+                self.size = min(self.max_size, self.size + 1)
+            if self.size != before:
+                print(f"  ⇅ Batch size {before} → {self.size} (≈{self.tokens_per_form:.0f} tokens/form)")
+
+
+def plan_adaptive_batches(
+    total_forms: int,
+    start_id: int,
+    existing_llm: Dict[str, Any],
+    llm_output_file: str,
+    sizer: AdaptiveBatchSizer,
+) -> Iterator[BatchPlan]:
+    """Plan batches lazily, asking `sizer` for each batch's size just before it is sent."""
+    next_number = start_id
+    end_number = start_id + total_forms
+    batch_idx = 0
+    while next_number < end_number:
+        size = min(sizer.next_size(), end_number - next_number)
+        yield plan_batch(batch_idx, start_id + batch_idx, next_number, size, existing_llm, llm_output_file)
+        next_number += size
+        batch_idx += 1
+
+
+def plan_leased_batches(
+    total_forms: int,
+    floor: int,
+    leases: LeaseTable,
+    worker: str,
+    store_root: str,
+    llm_output_file: str,
+    next_size: Callable[[], int],
+    existing: Container[str] = (),
+) -> Iterator[BatchPlan]:
+    """
+    Plan batches from ID ranges claimed in a shared lease table, so several
+    workers never generate the same ID. A range reclaimed from a dead worker
+    (or retried after failures) keeps the industries and layouts it was first
+    planned with, minus any form some shard has already committed. IDs in
+    `existing` (the manual and LLM configs) are never planned, since the
+    configs can have gaps below `floor`.
+    """
+    claimed = 0
+    batch_idx = 0
+    while claimed < total_forms:
+        lease = leases.claim(worker, min(next_size(), total_forms - claimed), floor)
+        remaining: Set[str] = {form_id for form_id in lease.ids if form_id not in existing}
+        if len(remaining) < len(lease.ids):
+            print(f"⚠ Forms {', '.join(i for i in lease.ids if i not in remaining)} already exist, skipping...")
+        if lease.reclaimed:
+            committed = stored_ids(store_root).union(
+                *(stored_ids(shard_dir(store_root, name)) for name in shard_workers(store_root))
+            )
+            remaining -= committed
+            print(f"↺ Reclaimed forms {', '.join(lease.ids)} (attempt {lease.attempts})")
+        if not remaining:
+            leases.complete(worker, lease.lease_id)
+            continue
+
+        # Seeded by the range start, so any worker re-plans a range identically
+        full = plan_batch(batch_idx, lease.start, lease.start, lease.size, (), llm_output_file)
+        plan = BatchPlan(batch_idx=batch_idx, form_ids=[], industries=[], layouts=[], lease_id=lease.lease_id)
+        for form_id, industry, layout in zip(full.form_ids, full.industries, full.layouts):
+            if form_id in remaining:
+                plan.form_ids.append(form_id)
+                plan.industries.append(industry)
+                plan.layouts.append(layout)
+        yield plan
+        claimed += len(plan.form_ids)
+        batch_idx += 1
+
+
+def queue_items(plan: BatchPlan) -> List[WorkItem]:
+    """The work queue rows for a plan; the batch is identified by its first form number."""
+    batch_start = int(plan.form_ids[0]) if plan.form_ids else 0
+    required_types = plan.required_types or [None] * len(plan.form_ids)
+    return [
+        WorkItem(form_id, int(form_id), batch_start, industry, layout, required_types=types)
+        for form_id, industry, layout, types in zip(plan.form_ids, plan.industries, plan.layouts, required_types)
+    ]
+
+
+def plan_from_queue(items: List[WorkItem], existing_llm: Dict[str, Any]) -> List[BatchPlan]:
+    """
+    Rebuild batches from unfinished work queue items, keeping each form's
+    original batch, industry and layout. Items whose form already exists are
+    left out.
+    """
+    grouped: Dict[int, BatchPlan] = {}
+    for item in items:
+        if item.form_id in existing_llm:
+            continue
+        plan = grouped.get(item.batch_start)
+        if plan is None:
+            plan = grouped[item.batch_start] = BatchPlan(
+                batch_idx=len(grouped), form_ids=[], industries=[], layouts=[], required_types=[]
+            )
+        plan.form_ids.append(item.form_id)
+        plan.industries.append(item.industry)
+        plan.layouts.append(item.layout)
+        plan.required_types.append(item.required_types or [])
+    return list(grouped.values())
+
+
+def plan_from_batch_results(custom_ids: Iterable[str], items: List[WorkItem]) -> List[BatchPlan]:
+    """
+    One batch per --batch-ingest result, in form ID order. Each result must
+    cover forms that are all still unfinished in the queue; the plan is taken
+    from there. Results whose forms were ingested before are skipped.
+    """
+    by_id = {item.form_id: item for item in items}
+    batches = []
+    for custom_id in custom_ids:
+        form_ids = parse_form_batch_id(custom_id)
+        if form_ids is None or not all(form_id.isdigit() for form_id in form_ids):
+            print(f"⚠ Skipping batch result {custom_id}: not a form batch")
+        elif not any(form_id in by_id for form_id in form_ids):
+            print(f"⚠ Skipping batch result {custom_id}: already ingested")
+        elif not all(form_id in by_id for form_id in form_ids):
+            print(
+                f"⚠ Skipping batch result {custom_id}: some of its forms were already ingested; "
+                "export the rest again with --batch-export FILE --resume"
+            )
+        else:
+            batches.append(form_ids)
+
+    plans = []
+    for batch_idx, form_ids in enumerate(sorted(batches, key=lambda ids: int(ids[0]))):
+        plan_items = [by_id[form_id] for form_id in form_ids]
+        plans.append(BatchPlan(
+            batch_idx=batch_idx,
+            form_ids=form_ids,
+            industries=[item.industry for item in plan_items],
+            layouts=[item.layout for item in plan_items],
+            required_types=[item.required_types or [] for item in plan_items],
+        ))
+    return plans
+
+
+def _request_planned_batch(plan: BatchPlan, batch_options: Dict[str, Any]) -> tuple[List[Any], CompletionResult, float]:
+    """
+    The network half of a planned batch, run on a worker thread: the first
+    call's (raw forms, completion, latency). Streamed with --stream, but
+    nothing is validated here.
+    """
+    print(f"→ Requesting batch {plan.batch_idx + 1}: forms {', '.join(plan.form_ids)}")
+    started = time.monotonic()
+    raw_forms, completion = request_forms(
+        plan.form_ids,
+        plan.industries,
+        plan.layouts,
+        batch_options.get("today") or datetime.now(),
+        on_raw_form=(lambda pos, raw_form: None) if batch_options.get("stream") else None,
+        max_output_tokens=batch_options.get("max_output_tokens"),
+        required_types=plan.required_types,
+    )
+    return raw_forms, completion, time.monotonic() - started
+
+
+def _generate_planned_batch(
+    plan: BatchPlan,
+    on_form: Optional[Callable[[BatchPlan, Dict[str, Any]], None]],
+    batch_options: Dict[str, Any],
+    first_response: Optional[Future] = None,
+) -> Optional[List[Dict[str, Any]]]:
+    """Run one planned batch; returns None (after logging) if the LLM call fails."""
+    if not plan.form_ids:
+        return []
+    if first_response is None:
+        print(f"→ Requesting batch {plan.batch_idx + 1}: forms {', '.join(plan.form_ids)}")
+    try:
+        return generate_form_batch(
+            plan.form_ids,
+            plan.industries,
+            plan.layouts,
+            required_types=plan.required_types,
+            on_form=(lambda form: on_form(plan, form)) if on_form is not None else None,
+            first_response=first_response,
+            **batch_options,
+        )
+    except Exception as e:
+        print(f"✗ Failed to generate batch {plan.batch_idx + 1}: {e}")
+        return None
+
+
+def run_batches(
+    plans: Iterable[BatchPlan],
+    concurrency: int,
+    on_form: Optional[Callable[[BatchPlan, Dict[str, Any]], None]] = None,
+    **batch_options: Any,
+) -> Iterator[tuple[BatchPlan, Optional[List[Dict[str, Any]]]]]:
+    """
+    Yield (plan, forms) for each plan, in plan order. With concurrency > 1
+    each batch's first LLM call is sent from a thread pool, ahead of its turn;
+    everything else (validation, `check_form`, `on_form`, `on_attempt` and any
+    retry calls) runs on the calling thread, one batch at a time in plan
+    order. Which of two similar forms a check keeps therefore never depends on
+    which call returns first, and the output is the same as a serial run.
+
+    Plans are pulled from `plans` only as batches are handed back (at most two
+    per worker are in flight), so a lazy planner sees the outcome of earlier
+    batches. Remaining keyword arguments are passed to generate_form_batch.
+    """
+    if concurrency <= 1:
+        for plan in plans:
+            yield plan, _generate_planned_batch(plan, on_form, batch_options)
+        return
+
+    plan_iter = iter(plans)
+    in_flight: Deque[tuple[BatchPlan, Optional[Future]]] = deque()
+    pool = ThreadPoolExecutor(max_workers=concurrency)
+
+    def submit_next() -> None:
+        plan = next(plan_iter, None)
+        if plan is not None:
+            future = pool.submit(_request_planned_batch, plan, batch_options) if plan.form_ids else None
+            in_flight.append((plan, future))
+
+    try:
+        for _ in range(2 * concurrency):
+            submit_next()
+        while in_flight:
+            plan, future = in_flight.popleft()
+            forms = _generate_planned_batch(plan, on_form, batch_options, first_response=future)
+            submit_next()
+            yield plan, forms
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
 
 
 # ============== MAIN SCRIPT ==============
 
 
+def parse_day(value: str) -> datetime:
+    """argparse type for --today."""
+    try:
+        return datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected a date as YYYY-MM-DD, got {value!r}")
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Generate new LLM form configurations in batches.",
+        usage="python generate_pages.py [num_batches] [--batch-size N | --adaptive] [--concurrency N]",
+    )
+    parser.add_argument("num_batches", nargs="?", type=int, default=1, help="number of batches (default: 1)")
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+        help=f"forms per LLM request (default: {DEFAULT_BATCH_SIZE}); the starting size with --adaptive",
+    )
+    parser.add_argument(
+        "--adaptive",
+        action="store_true",
+        help="grow the batch size after clean responses and shrink it after truncations or rejects; "
+        "generates num_batches × batch-size forms in total",
+    )
+    parser.add_argument(
+        "--max-batch-size",
+        type=int,
+        default=10,
+        help="upper bound for --adaptive (default: 10)",
+    )
+    parser.add_argument(
+        "--max-output-tokens",
+        type=int,
+        default=8000,
+        help="per-request output token budget for --adaptive (default: 8000)",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=1,
+        help="number of batches to request in parallel (default: 1, i.e. serial)",
+    )
+    parser.add_argument(
+        "--max-retries",
+        type=int,
+        default=1,
+        help="follow-up requests for forms that fail validation (default: 1)",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="stream each batch and validate forms as they arrive; when serial, forms are also saved one by one",
+    )
+    parser.add_argument(
+        "--stream-max-rejects",
+        type=int,
+        default=2,
+        help="with --stream, cancel a response once more than this many of its forms are rejected (default: 2)",
+    )
+    parser.add_argument(
+        "--today",
+        type=parse_day,
+        default=None,
+        metavar="YYYY-MM-DD",
+        help="date the prompt gives the model as today (default: the actual date); pass the date of a cached run "
+        "to replay it with --replay-only",
+    )
+    parser.add_argument(
+        "--strict-dates",
+        action="store_true",
+        help="reject forms whose groundTruth dates fall outside today ± 730 days",
+    )
+    parser.add_argument(
+        "--coverage",
+        nargs="?",
+        const="",
+        default=None,
+        metavar="TARGET_JSON",
+        help="choose each form's industry, layout and required field types to close the biggest gaps between the "
+        "corpus and a target mix (default target: an even mix of every field type, layout and industry)",
+    )
+    parser.add_argument(
+        "--dedupe",
+        choices=["off", "flag", "reject"],
+        default="flag",
+        help="check each validated form against the corpus for near duplicates (same field types, labels and "
+        "options): 'flag' reports them, 'reject' re-requests them like invalid forms (default: flag)",
+    )
+    parser.add_argument(
+        "--fidelity",
+        choices=["off", "flag", "reject"],
+        default="flag",
+        help="check that each validated form's inputToLLM mentions every groundTruth value (see fidelity_check.py): "
+        "'flag' reports forms that leave values out, 'reject' re-requests them like invalid forms (default: flag)",
+    )
+    parser.add_argument(
+        "--dedupe-threshold",
+        type=float,
+        default=DEFAULT_DEDUPE_THRESHOLD,
+        help=f"Jaccard similarity at which forms count as near duplicates (default: {DEFAULT_DEDUPE_THRESHOLD})",
+    )
+    parser.add_argument(
+        "--store",
+        default=DEFAULT_STORE_DIR,
+        help=f"append-only store that each finished batch is committed to (default: {DEFAULT_STORE_DIR})",
+    )
+    parser.add_argument(
+        "--no-compact",
+        action="store_true",
+        help="leave new forms in the store; merge later with 'python form_store.py compact'",
+    )
+    parser.add_argument(
+        "--queue",
+        default=None,
+        help="durable plan of every form ID with its industry, layout and status "
+        f"(default: {DEFAULT_QUEUE_FILE}, or .form_store/plan-<worker>.sqlite with --worker)",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="regenerate the pending, interrupted and failed forms in the queue with their original plan "
+        "instead of planning new batches",
+    )
+    workers = parser.add_argument_group("shared-store workers")
+    workers.add_argument(
+        "--worker",
+        default=None,
+        help="run as a named worker (letters, digits, '_' and '.'): claim form IDs from the lease table next to "
+        "--store and commit to <store>/shards/<worker>; merge with 'python id_leases.py merge'",
+    )
+    workers.add_argument("--leases", default=None, help="lease table (default: leases.json next to --store)")
+    workers.add_argument(
+        "--lease-ttl",
+        type=float,
+        default=DEFAULT_LEASE_TTL,
+        help=f"seconds before an unrenewed lease can be reclaimed by another worker (default: {DEFAULT_LEASE_TTL:.0f})",
+    )
+    add_batch_arguments(parser)
+    add_cache_arguments(parser)
+    add_metrics_arguments(parser)
+    args = parser.parse_args(argv)
+    if args.num_batches < 1:
+        parser.error("num_batches must be >= 1")
+    if args.batch_size < 1:
+        parser.error("--batch-size must be >= 1")
+    if args.adaptive and args.max_batch_size < args.batch_size:
+        parser.error("--max-batch-size must be >= --batch-size")
+    if args.concurrency < 1:
+        parser.error("--concurrency must be >= 1")
+    if args.max_retries < 0:
+        parser.error("--max-retries must be >= 0")
+    if args.worker is not None:
+        if not WRITER_RE.match(args.worker):
+            parser.error("--worker may only contain letters, digits, '_' and '.'")
+        if args.resume:
+            parser.error("--resume is for single-process runs; workers reclaim expired and failed leases on their own")
+        if args.coverage is not None:
+            parser.error("--coverage plans from this machine's view of the corpus and cannot be combined with --worker")
+        if args.lease_ttl <= 0:
+            parser.error("--lease-ttl must be > 0")
+    if args.batch_export or args.batch_ingest:
+        if args.worker is not None:
+            parser.error("--batch-export/--batch-ingest use the local queue and cannot be combined with --worker")
+        if args.stream:
+            parser.error("--stream needs live API calls")
+    if args.batch_export and args.adaptive:
+        parser.error("--adaptive sizes batches from earlier responses and cannot plan a whole batch file up front")
+    if args.batch_ingest and (args.resume or args.coverage is not None):
+        parser.error("--batch-ingest takes its plan from the queue written by --batch-export")
+    if args.today is None:
+        # Fixed once, so a run that crosses midnight sends one prompt date
+        args.today = datetime.now()
+    if args.queue is None:
+        args.queue = (
+            os.path.join(os.path.dirname(DEFAULT_QUEUE_FILE), f"plan-{args.worker}.sqlite")
+            if args.worker is not None else DEFAULT_QUEUE_FILE
+        )
+    return args
+
+
 def main():
-    # CLI: python generate_pages.py [num_batches]
-    num_batches = 1
-    if len(sys.argv) > 1:
-        try:
-            num_batches = int(sys.argv[1])
-            if num_batches < 1:
-                raise ValueError
-        except ValueError:
-            print("Usage: python generate_pages.py [num_batches]")
-            sys.exit(1)
-
-    total_forms = num_batches * 5
+    global response_cache, metrics, batch_results
+
+    # CLI: python generate_pages.py [num_batches] [--batch-size N | --adaptive] [--concurrency N]
+    args = parse_args()
+    num_batches = args.num_batches
+    response_cache = cache_from_args(args)
+    metrics = metrics_from_args(args, "generate_pages")
+
+    total_forms = num_batches * args.batch_size
     print("=" * 60)
-    print(f"GENERATING {total_forms} NEW FORMS ({num_batches} batches × 5 forms)")
+    if args.batch_ingest:
+        print(f"INGESTING BATCH RESULTS FROM {args.batch_ingest}")
+    elif args.resume:
+        print(f"RESUMING UNFINISHED FORMS FROM {args.queue}")
+    elif args.adaptive:
+        print(f"GENERATING {total_forms} NEW FORMS (adaptive batch size, starting at {args.batch_size})")
+    else:
+        print(f"GENERATING {total_forms} NEW FORMS ({num_batches} batches × {args.batch_size} forms)")
+    if args.concurrency > 1:
+        print(f"Concurrency: {args.concurrency} batches in flight")
+    if args.worker is not None:
+        print(f"Worker: {args.worker} (IDs leased from {args.leases or lease_file_for(args.store)})")
+    if response_cache is not None:
+        # The prompt date is part of every cache key
+        print(f"Prompt date: {args.today:%Y-%m-%d} (replay these requests later with --today {args.today:%Y-%m-%d})")
     print("=" * 60)
 
     manual_config_file = "public/manual_config.json"
@@ -650,82 +1228,280 @@ def main():
         except Exception as e:
             print(f"Warning: Could not load existing LLM config: {e}")
 
+    # Forms committed to the store (or this worker's shard) by an earlier run that was not compacted
+    store_dir = shard_dir(args.store, args.worker) if args.worker is not None else args.store
+    store = FormStore(store_dir, writer=args.worker or "main")
+    if len(store):
+        existing_llm.update(store.iter_forms())
+        print(f"Loaded {len(store)} uncompacted forms from {store_dir}")
+
+    queue = WorkQueue(args.queue)
+    unfinished = queue.unfinished()
+
     manual_count = len(manual_config)
     existing_llm_count = len(existing_llm)
-    start_id = manual_count + existing_llm_count + 1
+    # Never reuse an ID the queue has already planned, even if that form failed
+    start_id = max(manual_count + existing_llm_count + 1, queue.max_form_number() + 1)
+
+    sizer: Optional[AdaptiveBatchSizer] = None
+    if args.adaptive:
+        sizer = AdaptiveBatchSizer(
+            args.batch_size,
+            max_size=args.max_batch_size,
+            max_output_tokens=args.max_output_tokens,
+        )
 
-    layouts_cycle = ["single-column", "two-column", "split-screen", "wizard-style", "website-style"]
+    leases: Optional[LeaseTable] = None
+    heartbeat: Optional[LeaseHeartbeat] = None
+    plans: Iterable[BatchPlan]
+    if args.worker is not None:
+        leases = LeaseTable(args.leases or lease_file_for(args.store), ttl=args.lease_ttl)
+        heartbeat = LeaseHeartbeat(leases, args.worker).start()
+        # Fresh leases start above every existing ID; the counts behind start_id ignore gaps in the configs
+        existing_ids = set(manual_config) | set(existing_llm)
+        floor = max([start_id] + [int(form_id) + 1 for form_id in existing_ids if form_id.isdigit()])
+        plans = plan_leased_batches(
+            total_forms,
+            floor,
+            leases,
+            args.worker,
+            args.store,
+            llm_output_file,
+            sizer.next_size if sizer is not None else (lambda: args.batch_size),
+            existing_ids,
+        )
+    elif args.resume or args.batch_ingest:
+        # Forms committed just before a crash may not have been marked done yet
+        queue.mark_done(item.form_id for item in unfinished if item.form_id in existing_llm)
+        unfinished = [item for item in unfinished if item.form_id not in existing_llm]
+        if args.batch_ingest:
+            batch_results = batch_results_from_args(args)
+            plans = plan_from_batch_results(batch_results.results, unfinished)
+        else:
+            plans = plan_from_queue(unfinished, existing_llm)
+        total_forms = sum(len(plan.form_ids) for plan in plans)
+        print(f"{'Ingesting' if args.batch_ingest else 'Resuming'} {total_forms} unfinished forms in {len(plans)} batches")
+    elif sizer is not None:
+        plans = plan_adaptive_batches(total_forms, start_id, existing_llm, llm_output_file, sizer)
+    else:
+        plans = plan_batches(num_batches, start_id, existing_llm, llm_output_file, args.batch_size)
+
+    planner: Optional[CoveragePlanner] = None
+    if args.coverage is not None and not args.resume:
+        stats = merge_statistics([
+            analyze_forms(manual_config, "Manual Config"),
+            analyze_forms(existing_llm, "LLM Generated Config"),
+        ])
+        target = CoverageTarget.load(args.coverage, get_args(FieldType), LAYOUTS_CYCLE, INDUSTRIES)
+        planner = CoveragePlanner(stats, target, queue.industry_counts())
+        print("Largest gaps to the coverage target:")
+        for category, key, gap in planner.gap_report():
+            print(f"  {category:10s} {key:25s}: {gap:5.1f} missing")
+
+        def with_coverage(plans: Iterable[BatchPlan]) -> Iterator[BatchPlan]:
+            for plan in plans:
+                plan.industries, plan.layouts, plan.required_types = planner.assign(plan.form_ids)
+                yield plan
+
+        plans = list(with_coverage(plans)) if isinstance(plans, list) else with_coverage(plans)
+
+    if isinstance(plans, list):
+        # Record the whole plan before the first LLM call
+        queue.add_items(item for plan in plans for item in queue_items(plan))
+
+    if args.batch_export:
+        # The queue keeps the plan (pending) until --batch-ingest reads the results
+        exported = 0
+        with BatchRequestWriter(args.batch_export) as writer:
+            for plan in plans:
+                if plan.form_ids:
+                    exported += len(plan.form_ids)
+                    writer.add(
+                        form_batch_id(plan.form_ids),
+                        build_form_request(
+                            plan.form_ids, plan.industries, plan.layouts, args.today, required_types=plan.required_types
+                        ),
+                    )
+        print(f"\n✓ Wrote {writer.count} batch requests for {exported} forms to {args.batch_export}")
+        print("  Submit it to the Batch API, then ingest the results file with:")
+        print(f"  python generate_pages.py --batch-ingest RESULTS.jsonl --queue {args.queue}")
+        queue.close()
+        return
+
+    if unfinished and not args.resume and not args.batch_ingest and args.worker is None:
+        print(f"⚠ {len(unfinished)} unfinished forms in {args.queue}; run with --resume to regenerate them")
+
+    def claim(plans: Iterable[BatchPlan]) -> Iterator[BatchPlan]:
+        """Record each plan (adaptive plans are made lazily) and mark it in progress as it is sent."""
+        for plan in plans:
+            queue.add_items(queue_items(plan))
+            queue.mark_in_progress(plan.form_ids)
+            yield plan
+
+    # Last rejection reason per form, kept for the queue's failed items
+    last_rejects: Dict[str, str] = {}
+
+    def on_attempt(record: AttemptRecord) -> None:
+        last_rejects.update(record.rejected)
+        if sizer is not None:
+            sizer.record(record)
+
+    # Near-duplicate index over the existing corpus. Generated forms join it as they are checked on the main
+    # thread, in plan order, so of two similar forms the earlier one in the plan is kept on every run.
+    dedupe: Optional[DedupeIndex] = None
+    near_duplicates: Dict[str, str] = {}
+    if args.dedupe != "off":
+        dedupe = DedupeIndex(args.dedupe_threshold)
+        for form_id, form in manual_config.items():
+            dedupe.add(f"manual:{form_id}", form)
+        for form_id, form in existing_llm.items():
+            dedupe.add(form_id, form)
+
+    def check_duplicate(form: Dict[str, Any]) -> Optional[str]:
+        match = dedupe.check(form["id"], form, add_duplicate=args.dedupe == "flag")
+        if match is None:
+            return None
+        other, similarity = match
+        if args.dedupe == "reject":
+            return f"near-duplicate of form {other} ({similarity:.0%} similar); generate a different kind of form"
+        near_duplicates[form["id"]] = other
+        print(f"  ⚠ Form {form['id']} is a near-duplicate of form {other} ({similarity:.0%} similar)")
+        return None
+
+    # inputToLLM must carry every groundTruth value, or the form cannot be filled from it
+    unfaithful_inputs: Dict[str, List[str]] = {}
+
+    def check_input_fidelity(form: Dict[str, Any]) -> Optional[str]:
+        issues = FormMatcher(form).check("inputToLLM", form.get("inputToLLM"))
+        if not issues:
+            return None
+        missing = [issue.field_id for issue in issues]
+        if args.fidelity == "reject":
+            return f"inputToLLM does not mention the groundTruth values of {', '.join(missing)}; state each value exactly"
+        unfaithful_inputs[form["id"]] = missing
+        print(f"  ⚠ Form {form['id']} inputToLLM leaves out {', '.join(missing)}")
+        return None
+
+    form_checks = []
+    if args.fidelity != "off":
+        form_checks.append(check_input_fidelity)
+    if dedupe is not None:
+        form_checks.append(check_duplicate)
+
+    def check_generated_form(form: Dict[str, Any]) -> Optional[str]:
+        for check in form_checks:
+            reason = check(form)
+            if reason is not None:
+                return reason
+        return None
 
     generated_forms: Dict[str, Any] = {}
-    date_field_counter = 0
-    range_field_counter = 0
-
-    for batch_idx in range(num_batches):
-        print("\n" + "=" * 60)
-        print(f"BATCH {batch_idx + 1}/{num_batches}")
-        print("=" * 60)
-
-        # Batch planning
-        batch_form_ids: List[str] = []
-        batch_industries: List[str] = []
-        batch_layouts: List[str] = []
-
-        # Seed per batch so industry shuffle is reproducible
-        random.seed(start_id + batch_idx)
-        shuffled_industries = INDUSTRIES.copy()
-        random.shuffle(shuffled_industries)
-
-        for i in range(5):
-            form_number = start_id + batch_idx * 5 + i
-            form_id = str(form_number)
-            if form_id in existing_llm:
-                print(f"⚠ Form {form_id} already exists in {llm_output_file}, skipping...")
-                continue
-
-            industry = shuffled_industries[i % len(shuffled_industries)]
-            layout = layouts_cycle[(form_number - 1) % len(layouts_cycle)]
-
-            batch_form_ids.append(form_id)
-            batch_industries.append(industry)
-            batch_layouts.append(layout)
-
-        if not batch_form_ids:
-            print("No new forms needed in this batch.")
-            continue
-
-        print(f"Generating forms: {', '.join(batch_form_ids)}")
-        print(f"Industries : {', '.join(batch_industries)}")
-
-        try:
-            batch_forms = generate_form_batch(batch_form_ids, batch_industries, batch_layouts)
-        except Exception as e:
-            print(f"✗ Failed to generate batch {batch_idx + 1}: {e}")
-            continue
-
-        for i, form in enumerate(batch_forms):
-            form_id = batch_form_ids[i]
-            form, date_field_counter, range_field_counter = assign_date_styles_round_robin(
-                form, date_field_counter, range_field_counter
-            )
+    requested_types = 0
+    delivered_types = 0
+
+    def commit_forms(plan: BatchPlan, forms: List[Dict[str, Any]]) -> None:
+        """Commit forms to the store as one segment; compaction post-processes them (form_stages.py)."""
+        nonlocal requested_types, delivered_types
+        # Another worker may have reclaimed the range after our lease expired
+        if leases is not None and not leases.holds(args.worker, plan.lease_id):
+            print(f"  ✗ Lease {plan.lease_id} was reclaimed by another worker; discarding {len(forms)} forms")
+            queue.mark_failed({form["id"]: "lease lost" for form in forms})
+            return
+
+        industry_by_id = dict(zip(plan.form_ids, plan.industries))
+        types_by_id = dict(zip(plan.form_ids, plan.required_types or []))
+        for form in forms:
+            form_id = form["id"]
             generated_forms[form_id] = form
 
             print(f"\n  Form ID: {form_id}")
-            print(f"    Industry: {batch_industries[i]}")
-            print(f"    Layout:   {batch_layouts[i]}")
+            print(f"    Industry: {industry_by_id[form_id]}")
+            print(f"    Layout:   {form.get('layout', 'N/A')}")
             print(f"    Title:    {form.get('title', 'N/A')}")
             print(f"    Type:     {form.get('type', 'N/A')}")
             print(f"    Pages:    {len(form.get('pages', []))}")
-
-        # Save after each batch
-        all_forms_so_far = {**existing_llm, **generated_forms}
+            if types_by_id.get(form_id):
+                missing = missing_required_types(form, types_by_id[form_id])
+                requested_types += len(types_by_id[form_id])
+                delivered_types += len(types_by_id[form_id]) - len(missing)
+                print(f"    Requested types: {', '.join(types_by_id[form_id])}"
+                      + (f" (missing {', '.join(missing)})" if missing else ""))
+
+        # Commit each batch (or streamed form) as its own store segment: O(batch) per save
         try:
-            os.makedirs(os.path.dirname(llm_output_file), exist_ok=True)
-            with open(llm_output_file, "w", encoding="utf-8") as f:
-                json.dump(all_forms_so_far, f, indent=2, ensure_ascii=False)
-            print(f"\n  ✓ Saved {len(batch_forms)} forms to {llm_output_file}")
-            print(f"  Total forms in file now: {len(all_forms_so_far)}")
+            segment = store.append({form["id"]: form for form in forms})
+            queue.mark_done(form["id"] for form in forms)
+            print(f"\n  ✓ Saved {len(forms)} forms to {args.store}/{segment}")
+            print(f"  Total forms so far: {len(existing_llm) + len(generated_forms)}")
         except Exception as e:
             print(f"  ✗ Error saving forms: {e}")
+            queue.mark_failed({form["id"]: f"save failed: {e}" for form in forms})
+
+    # Streaming + serial: commit each form the moment it validates
+    stream_commit = args.stream and args.concurrency == 1
+    batches = run_batches(
+        claim(plans),
+        args.concurrency,
+        on_form=(lambda plan, form: commit_forms(plan, [form])) if stream_commit else None,
+        # A batch results file answers each request once; rejects are retried with --resume
+        max_retries=0 if args.batch_ingest else args.max_retries,
+        stream=args.stream,
+        max_stream_rejects=args.stream_max_rejects,
+        strict_dates=args.strict_dates,
+        max_output_tokens=args.max_output_tokens if args.adaptive else None,
+        check_form=check_generated_form if form_checks else None,
+        on_attempt=on_attempt,
+        today=args.today,
+    )
+
+    for plan, batch_forms in batches:
+        print("\n" + "=" * 60)
+        print(f"BATCH {plan.batch_idx + 1}" + ("" if args.adaptive or args.resume or args.batch_ingest else f"/{num_batches}"))
+        print("=" * 60)
+
+        if not plan.form_ids:
+            print("No new forms needed in this batch.")
+            continue
+
+        print(f"Generating forms: {', '.join(plan.form_ids)}")
+        print(f"Industries : {', '.join(plan.industries)}")
+
+        returned_ids = {form["id"] for form in batch_forms or []}
+        failed = {
+            form_id: last_rejects.get(form_id, "batch request failed") if batch_forms is not None
+            else "batch request failed"
+            for form_id in plan.form_ids
+            if form_id not in returned_ids
+        }
+        queue.mark_failed(failed)
+
+        if batch_forms:
+            if stream_commit:
+                print(f"  {len(batch_forms)}/{len(plan.form_ids)} forms streamed and saved")
+            else:
+                commit_forms(plan, batch_forms)
+        if leases is not None:
+            leases.complete(args.worker, plan.lease_id, failed)
+
+    if heartbeat is not None:
+        heartbeat.stop()
+
+    if args.worker is not None:
+        # Workers never rewrite the shared JSON; one merge runs after all of them finish
+        print(f"\n{len(store)} forms in shard {store_dir}")
+        print(f"  Merge all shards with: python id_leases.py merge --store {args.store}")
+    elif args.no_compact:
+        print(f"\nSkipping compaction; {len(store)} forms remain in {args.store}")
+    elif len(store):
+        try:
+            total = store.compact(llm_output_file)
+            print(f"\n✓ Compacted store into {llm_output_file} ({total} forms)")
+            # Picker styles are set on compaction, so the stats below read them from the config
+            with open(llm_output_file, "r", encoding="utf-8") as f:
+                compacted = json.load(f)
+            generated_forms = {form_id: compacted.get(form_id, form) for form_id, form in generated_forms.items()}
+        except Exception as e:
+            print(f"\n✗ Error compacting store into {llm_output_file}: {e}")
 
     # Final stats
     all_forms = {**existing_llm, **generated_forms}
@@ -767,9 +1543,40 @@ def main():
         for style, count in range_style_counts.items():
             print(f"  {style:20s}: {count:4d}")
 
-    print("\nUsage: python generate_pages.py [num_batches]")
+    if requested_types:
+        print(f"\nCoverage: {delivered_types}/{requested_types} requested field types delivered")
+
+    if near_duplicates:
+        print(f"\n⚠ {len(near_duplicates)} near-duplicate forms kept (--dedupe flag):")
+        for form_id, other in near_duplicates.items():
+            print(f"  {form_id} ~ {other}")
+
+    if unfaithful_inputs:
+        print(f"\n⚠ {len(unfaithful_inputs)} forms kept whose inputToLLM leaves out groundTruth values (--fidelity flag):")
+        for form_id, missing in unfaithful_inputs.items():
+            print(f"  {form_id}: {', '.join(missing)}")
+
+    if response_cache is not None:
+        response_cache.print_stats()
+
+    failed = [item for item in queue.unfinished() if item.status == FAILED]
+    if failed:
+        print(f"\n⚠ {len(failed)} forms failed: {', '.join(item.form_id for item in failed)}")
+        if args.worker is None:
+            print("  Regenerate them with: python generate_pages.py --resume")
+        else:
+            print("  Their leases stay in the table, so the next worker claim retries them")
+    queue.close()
+
+    print("\nUsage: python generate_pages.py [num_batches] [--batch-size N | --adaptive] [--concurrency N]")
     print("Example: python generate_pages.py 4   # generates 20 forms (4×5)")
+    print("Example: python generate_pages.py 8 --concurrency 4   # 40 forms, 4 batches in flight")
+    print("Example: python generate_pages.py 10 --adaptive   # 50 forms, batch size tuned per response")
+    print("Example: python generate_pages.py --resume   # finish forms an interrupted run left pending or failed")
+    print("Example: python generate_pages.py 20 --worker build1.0 --store /shared/.form_store/llm_generated_config")
+    print("Example: python generate_pages.py 40 --batch-export batch.jsonl   # then --batch-ingest results.jsonl")
     print("=" * 60)
+    exit_on_replay_misses(response_cache)
 
 
 if __name__ == "__main__":
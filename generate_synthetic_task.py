@@ -1,20 +1,47 @@
+import argparse
 import json
 import os
-import random
-from typing import Dict, Any, List
-
-from dotenv import load_dotenv
-from openai import OpenAI
-from pydantic import BaseModel, field_validator
-
-# ==================== ENV + CLIENT ====================
-
-load_dotenv()
-api_key = os.getenv("OPENAI_API_KEY")
-if not api_key:
-    raise ValueError("OPENAI_API_KEY not found. Put it in .env")
-
-client = OpenAI(api_key=api_key)
+import sys
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, Any, Deque, Iterator, List, Optional, Set, Union
+
+from pydantic import BaseModel, ValidationError, field_validator
+
+from fidelity_check import FidelityIssue, check_instructions
+from form_store import write_json_atomic
+from llm_batch import BatchRequestWriter, BatchResults, add_batch_arguments, batch_results_from_args
+from llm_cache import ResponseCache, add_cache_arguments, cache_from_args, cached_completion, exit_on_replay_misses
+from llm_metrics import MetricsRecorder, add_metrics_arguments, metrics_from_args
+from task_dataset import (
+    DEFAULT_TASKS_DIR,
+    MASK_RATIO,
+    TaskDataset,
+    build_training_tasks,
+    form_fields_meta,
+    keeps_stored_tasks,
+    stored_masks,
+    task_fingerprint,
+    task_masks,
+)
+from template_instructions import template_instructions
+
+# ==================== CLIENT ====================
+#
+# The OpenAI client is created by llm_cache.get_client() on the first LLM call
+# that misses the cache.
+
+# Optional LLM response cache and call metrics, configured from the CLI in main()
+response_cache: Optional[ResponseCache] = None
+metrics: Optional[MetricsRecorder] = None
+# Responses read from a Batch API results file (--batch-ingest) instead of calling the API
+batch_results: Optional[BatchResults] = None
+# --fidelity: "off", "flag" (report tasks that leave out or leak values) or "retry" (also re-request them once)
+fidelity_mode = "flag"
+# --generator: "llm" (gpt-4o) or "template" (template_instructions.py, no API calls)
+generator_mode = "llm"
 
 
 # ==================== Pydantic for LLM output ====================
@@ -34,15 +61,77 @@ class TrainingInstructions(BaseModel):
         return v
 
 
+class PackedFormInstructions(BaseModel):
+    """One form's 5 instructions in a packed response, keyed by its task set ID."""
+    taskSetId: str
+    instructions: List[str]
+
+
+class PackedInstructions(BaseModel):
+    """
+    LLM output for several forms in one request (--pack). Each entry is checked
+    against TrainingInstructions on its own, so one bad form does not sink the rest.
+    """
+    forms: List[PackedFormInstructions]
+
+
 # ==================== Helper: generate 5 instructions for one form ====================
 
-def generate_instructions_for_form(
+def task_set_id(source_name: str, form_id: str) -> str:
+    """Batch API custom_id for the 5 tasks of one form, e.g. "tasks-llm-27"."""
+    return f"tasks-{source_name}-{form_id}"
+
+
+# What every instruction must do, shared by the single-form and packed prompts
+INSTRUCTION_RULES = (
+    "- For EACH of the 5 tasks, write ONE first-person paragraph (instruction) "
+    "describing the same person and values in groundTruth.\n"
+    "- All 5 tasks MUST describe EXACTLY the same values (name, dates, amounts, etc.), "
+    "copied from groundTruth. You must NOT invent, change, or add any new values.\n"
+    "- You may only vary the wording/phrasing, not the underlying values.\n"
+    "- For a task where maskedFields is empty, you should clearly mention ALL fields and "
+    "their values from groundTruth.\n"
+    "- For a task where maskedFields is non-empty, you MUST NOT mention those masked field ids at all. "
+    "Do NOT hint or partially mention them. Just omit those fields from the text.\n"
+    "- When you mention a field, its value MUST exactly match groundTruth (same spelling, numbers, dates, etc.).\n"
+    "- Do NOT invent new personal details, companies, addresses, or phone numbers. Only use values from groundTruth.\n\n"
+)
+
+
+def instruction_spec(
     form: Dict[str, Any],
     mask_flags: List[bool],
     masked_fields_per_task: List[List[str]],
-) -> List[str]:
+) -> Dict[str, Any]:
+    """What the prompt shows about one form: its fields, groundTruth and which fields each task masks."""
+    # Build tasks spec for the prompt (what to mask per task)
+    tasks_spec = []
+    for i in range(5):
+        tasks_spec.append({
+            "taskId": f"task_{i+1}",
+            "masked": mask_flags[i],
+            "maskedFields": masked_fields_per_task[i],
+        })
+
+    return {
+        "formId": form.get("id", "unknown"),
+        "title": form.get("title", ""),
+        "baseInputToLLM": form.get("inputToLLM", ""),
+        "fields": form_fields_meta(form),
+        "groundTruth": form.get("groundTruth", {}),
+        "tasks": tasks_spec,
+    }
+
+
+def build_instruction_request(
+    form: Dict[str, Any],
+    mask_flags: List[bool],
+    masked_fields_per_task: List[List[str]],
+    feedback: Optional[Dict[str, List[FidelityIssue]]] = None,
+) -> Dict[str, Any]:
     """
-    Call the LLM once to generate 5 instructions for a given form.
+    The chat completion request for a form's 5 instructions. `feedback` lists
+    the problems found in an earlier answer, by task ID, for a retry.
 
     All instructions MUST:
       - be first-person
@@ -52,30 +141,6 @@ def generate_instructions_for_form(
     NOT mention those fields at all.
     """
 
-    form_id = form.get("id", "unknown")
-    title = form.get("title", "")
-    base_input = form.get("inputToLLM", "")
-    ground_truth = form.get("groundTruth", {})
-
-    # Collect simple field metadata: id, label, type
-    fields_meta = []
-    for page in form.get("pages", []):
-        for field in page.get("fields", []):
-            fields_meta.append({
-                "id": field.get("id"),
-                "label": field.get("label"),
-                "type": field.get("type"),
-            })
-
-    # Build tasks spec for the prompt (what to mask per task)
-    tasks_spec = []
-    for i in range(5):
-        tasks_spec.append({
-            "taskId": f"task_{i+1}",
-            "masked": mask_flags[i],
-            "maskedFields": masked_fields_per_task[i],
-        })
-
     system_prompt = (
         "You generate first-person natural language descriptions for filling out a form.\n"
         "You are given:\n"
@@ -83,33 +148,14 @@ def generate_instructions_for_form(
         "- A groundTruth mapping from field id -> value\n"
         "- A tasks list specifying for each of 5 tasks which field ids are masked\n\n"
         "Your job:\n"
-        "- For EACH of the 5 tasks, write ONE first-person paragraph (instruction) "
-        "describing the same person and values in groundTruth.\n"
-        "- All 5 tasks MUST describe EXACTLY the same values (name, dates, amounts, etc.), "
-        "copied from groundTruth. You must NOT invent, change, or add any new values.\n"
-        "- You may only vary the wording/phrasing, not the underlying values.\n"
-        "- For a task where maskedFields is empty, you should clearly mention ALL fields and "
-        "their values from groundTruth.\n"
-        "- For a task where maskedFields is non-empty, you MUST NOT mention those masked field ids at all. "
-        "Do NOT hint or partially mention them. Just omit those fields from the text.\n"
-        "- When you mention a field, its value MUST exactly match groundTruth (same spelling, numbers, dates, etc.).\n"
-        "- Do NOT invent new personal details, companies, addresses, or phone numbers. Only use values from groundTruth.\n\n"
-        "Output strictly JSON with a single key 'instructions' mapping to an array of 5 strings.\n"
+        + INSTRUCTION_RULES
+        + "Output strictly JSON with a single key 'instructions' mapping to an array of 5 strings.\n"
         "instructions[0] corresponds to task_1, instructions[1] to task_2, etc."
     )
 
-    user_content = {
-        "formId": form_id,
-        "title": title,
-        "baseInputToLLM": base_input,
-        "fields": fields_meta,
-        "groundTruth": ground_truth,
-        "tasks": tasks_spec,
-    }
-
-    response = client.beta.chat.completions.parse(
-        model="gpt-4o",
-        messages=[
+    request = {
+        "model": "gpt-4o",
+        "messages": [
             {"role": "system", "content": system_prompt},
             {
                 "role": "user",
@@ -117,21 +163,404 @@ def generate_instructions_for_form(
                     "Here is the form and tasks specification. "
                     "Remember: NEVER change or invent values. Always copy values from groundTruth exactly. "
                     "For masked fields, do not mention them at all in that task's instruction.\n\n"
-                    + json.dumps(user_content, indent=2)
+                    + json.dumps(instruction_spec(form, mask_flags, masked_fields_per_task), indent=2)
                 ),
             },
         ],
-        response_format=TrainingInstructions,
-        temperature=0.4,  # low-ish for determinism in content, but paraphrasing is still possible
+        "response_format": TrainingInstructions,
+        "temperature": 0.4,  # low-ish for determinism in content, but paraphrasing is still possible
+    }
+    if feedback:
+        request["messages"].append({"role": "user", "content": build_fidelity_feedback(feedback)})
+    return request
+
+
+def build_packed_instruction_request(plans: List["TaskPlan"]) -> Dict[str, Any]:
+    """
+    One chat completion request for several forms' instructions. Forms are
+    keyed by task set ID ("tasks-llm-27") and sent as compact JSON, so the
+    system prompt and formatting are paid for once per pack, not per form.
+    """
+    system_prompt = (
+        "You generate first-person natural language descriptions for filling out forms.\n"
+        "You are given a list of forms. Each has:\n"
+        "- A taskSetId identifying it\n"
+        "- The list of fields (id, label, type)\n"
+        "- A groundTruth mapping from field id -> value\n"
+        "- A tasks list specifying for each of 5 tasks which field ids are masked\n\n"
+        "Your job, for every form on its own:\n"
+        + INSTRUCTION_RULES
+        + "Each form describes a different person: never carry values from one form into another.\n"
+        "Output strictly JSON with a single key 'forms' mapping to an array with one object per input form, "
+        "in input order: {\"taskSetId\": <the form's taskSetId>, \"instructions\": <array of 5 strings>}.\n"
+        "instructions[0] corresponds to task_1, instructions[1] to task_2, etc."
     )
+    forms = [
+        {"taskSetId": plan.custom_id, **instruction_spec(plan.form, plan.mask_flags, plan.masked_fields_per_task)}
+        for plan in plans
+    ]
+    return {
+        "model": "gpt-4o",
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {
+                "role": "user",
+                "content": (
+                    "Here are the forms and their tasks specifications. "
+                    "Remember: NEVER change or invent values. Always copy values from each form's groundTruth exactly. "
+                    "For masked fields, do not mention them at all in that task's instruction.\n\n"
+                    + json.dumps({"forms": forms}, ensure_ascii=False, separators=(",", ":"))
+                ),
+            },
+        ],
+        "response_format": PackedInstructions,
+        "temperature": 0.4,
+    }
+
 
-    parsed: TrainingInstructions = response.choices[0].message.parsed
+def build_fidelity_feedback(failing: Dict[str, List[FidelityIssue]]) -> str:
+    """Retry message naming each task's omitted and leaked values."""
+    lines = ["A previous answer had these problems. Write all 5 instructions again and fix them:"]
+    for task_id, issues in failing.items():
+        for issue in issues:
+            value = json.dumps(issue.value, ensure_ascii=False)
+            if issue.kind == "leak":
+                lines.append(f"- {task_id}: mentions masked field {issue.field_id} ({value}); leave it out entirely")
+            else:
+                lines.append(f"- {task_id}: leaves out {issue.field_id}; state its value exactly as {value}")
+    return "\n".join(lines)
+
+
+def generate_instructions_for_form(
+    form: Dict[str, Any],
+    mask_flags: List[bool],
+    masked_fields_per_task: List[List[str]],
+    custom_id: Optional[str] = None,
+    feedback: Optional[Dict[str, List[FidelityIssue]]] = None,
+) -> List[str]:
+    """
+    Call the LLM once to generate 5 instructions for a given form. With
+    --batch-ingest the response is the results file entry for `custom_id`.
+    """
+    form_id = form.get("id", "unknown")
+    request = build_instruction_request(form, mask_flags, masked_fields_per_task, feedback)
+    started = time.monotonic()
+    completion = None
+    try:
+        if batch_results is not None:
+            completion = batch_results.completion(custom_id)
+        else:
+            completion = cached_completion(request, response_cache)
+        parsed = TrainingInstructions.model_validate_json(completion.content)
+    except Exception as e:
+        if metrics is not None:
+            metrics.record_call(
+                "instructions",
+                [form_id],
+                time.monotonic() - started,
+                attempt=1 if feedback else 0,
+                usage=completion.usage if completion else None,
+                rejected_ids=[form_id],
+                finish_reason=completion.finish_reason if completion else None,
+                response_cache_hit=completion.cached if completion else False,
+                error=str(e),
+            )
+        raise
+
+    if metrics is not None:
+        metrics.record_call(
+            "instructions",
+            [form_id],
+            time.monotonic() - started,
+            attempt=1 if feedback else 0,
+            usage=completion.usage,
+            accepted_ids=[form_id],
+            finish_reason=completion.finish_reason,
+            response_cache_hit=completion.cached,
+        )
     return parsed.instructions
 
 
+def generate_packed_instructions(plans: List["TaskPlan"]) -> Dict[str, List[str]]:
+    """
+    Call the LLM once for several forms. Returns the valid instructions by task
+    set ID; forms that are missing or invalid in the response (or every form,
+    if the call fails) are left out for the caller to request on their own.
+    """
+    form_ids = [plan.form_id for plan in plans]
+    wanted = {plan.custom_id: plan.form_id for plan in plans}
+    request = build_packed_instruction_request(plans)
+    started = time.monotonic()
+    completion = None
+    accepted: Dict[str, List[str]] = {}
+    error = None
+    try:
+        completion = cached_completion(request, response_cache)
+        parsed = PackedInstructions.model_validate_json(completion.content)
+        for entry in parsed.forms:
+            if entry.taskSetId not in wanted or entry.taskSetId in accepted:
+                continue
+            try:
+                accepted[entry.taskSetId] = TrainingInstructions(instructions=entry.instructions).instructions
+            except ValidationError:
+                continue
+    except Exception as e:
+        error = str(e)
+
+    if metrics is not None:
+        metrics.record_call(
+            "instructions",
+            form_ids,
+            time.monotonic() - started,
+            usage=completion.usage if completion else None,
+            accepted_ids=[wanted[key] for key in accepted],
+            rejected_ids=[form_id for key, form_id in wanted.items() if key not in accepted],
+            finish_reason=completion.finish_reason if completion else None,
+            response_cache_hit=completion.cached if completion else False,
+            error=error,
+        )
+    return accepted
+
+
+# ==================== Planning + execution ====================
+
+# Rough size of prompt and completion text: about 4 characters per token
+CHARS_PER_TOKEN = 4
+DEFAULT_PACK_MAX_TOKENS = 8000
+
+@dataclass
+class TaskPlan:
+    """One form's 5 tasks: which are masked and which fields each leaves out, fixed before any LLM call."""
+    source_name: str
+    source_dict: Dict[str, Any]
+    form_id: str
+    mask_flags: List[bool]
+    masked_fields_per_task: List[List[str]]
+    # Stored instructions to repair instead of generating a fresh set (--fidelity retry)
+    previous: Optional[List[str]] = None
+
+    @property
+    def form(self) -> Dict[str, Any]:
+        return self.source_dict[self.form_id]
+
+    @property
+    def custom_id(self) -> str:
+        return task_set_id(self.source_name, self.form_id)
+
+
+def repair_instructions(plan: TaskPlan, instructions: List[str]) -> List[str]:
+    """
+    Re-request a form whose instructions leave out or leak values, once, with
+    the problems listed. Only the failing tasks are replaced, and only by
+    retried instructions that pass the check.
+    """
+    failing = check_instructions(plan.form, instructions, plan.masked_fields_per_task)
+    if not failing:
+        return instructions
+    retried = generate_instructions_for_form(
+        plan.form, plan.mask_flags, plan.masked_fields_per_task, plan.custom_id, feedback=failing
+    )
+    still_failing = check_instructions(plan.form, retried, plan.masked_fields_per_task)
+    return [
+        retried[i] if f"task_{i + 1}" in failing and f"task_{i + 1}" not in still_failing else instruction
+        for i, instruction in enumerate(instructions)
+    ]
+
+
+def estimate_plan_tokens(plan: TaskPlan) -> int:
+    """Estimated tokens one form adds to a packed request: its spec, plus 5 instructions restating its values."""
+    spec = json.dumps(instruction_spec(plan.form, plan.mask_flags, plan.masked_fields_per_task), separators=(",", ":"))
+    values = json.dumps(plan.form.get("groundTruth", {}), separators=(",", ":"))
+    return (len(spec) + 5 * (len(values) + 200)) // CHARS_PER_TOKEN
+
+
+def pack_plans(plans: List[TaskPlan], pack_size: int, max_tokens: int = DEFAULT_PACK_MAX_TOKENS) -> List[List[TaskPlan]]:
+    """
+    Group consecutive plans into packs of at most `pack_size` forms and about
+    `max_tokens` estimated tokens. A form over the budget on its own gets a
+    pack to itself, and so does a form that only needs repairing.
+    """
+    packs: List[List[TaskPlan]] = []
+    pack: List[TaskPlan] = []
+    pack_tokens = 0
+    for plan in plans:
+        tokens = estimate_plan_tokens(plan) if plan.previous is None else max_tokens + 1
+        if pack and (len(pack) >= pack_size or pack_tokens + tokens > max_tokens):
+            packs.append(pack)
+            pack, pack_tokens = [], 0
+        pack.append(plan)
+        pack_tokens += tokens
+    if pack:
+        packs.append(pack)
+    return packs
+
+
+def _generate_planned_tasks(plan: TaskPlan, packed: Optional[List[str]] = None) -> Union[List[str], Exception]:
+    """
+    Instructions for one plan, or the exception that stopped them (so one form
+    never fails the rest). `packed` is the plan's share of a packed response.
+    """
+    try:
+        instructions = packed if packed is not None else plan.previous
+        if instructions is None and generator_mode == "template":
+            return template_instructions(plan.form, plan.mask_flags, plan.masked_fields_per_task)
+        if instructions is None:
+            instructions = generate_instructions_for_form(
+                plan.form, plan.mask_flags, plan.masked_fields_per_task, plan.custom_id
+            )
+        if fidelity_mode == "retry":
+            instructions = repair_instructions(plan, instructions)
+        return instructions
+    except Exception as e:
+        return e
+
+
+def _generate_task_pack(pack: List[TaskPlan]) -> List[Union[List[str], Exception]]:
+    """
+    Results for a pack of plans, in order: one packed call, then a single-form
+    call for every form the packed response did not answer validly.
+    """
+    if len(pack) == 1:
+        return [_generate_planned_tasks(pack[0])]
+    packed = generate_packed_instructions(pack)
+    if len(packed) < len(pack):
+        print(f"  ↻ {len(pack) - len(packed)} of {len(pack)} packed forms had no valid instructions; requesting them one by one")
+    return [_generate_planned_tasks(plan, packed.get(plan.custom_id)) for plan in pack]
+
+
+def run_task_plans(
+    plans: List[TaskPlan],
+    concurrency: int,
+    pack_size: int = 1,
+    pack_max_tokens: int = DEFAULT_PACK_MAX_TOKENS,
+) -> Iterator[tuple[TaskPlan, Union[List[str], Exception]]]:
+    """
+    Yield (plan, instructions or exception) in plan order. With pack_size > 1
+    consecutive plans share a request (see pack_plans). With concurrency > 1
+    the LLM calls run on a thread pool with at most two packs per worker
+    queued, but results are still handed back in order, so logs and saved
+    configs are the same as a serial run.
+    """
+    packs = pack_plans(plans, pack_size, pack_max_tokens)
+    if concurrency <= 1:
+        for pack in packs:
+            yield from zip(pack, _generate_task_pack(pack))
+        return
+
+    pack_iter = iter(packs)
+    in_flight: Deque[tuple[List[TaskPlan], Future]] = deque()
+    pool = ThreadPoolExecutor(max_workers=concurrency)
+
+    def submit_next() -> None:
+        pack = next(pack_iter, None)
+        if pack is not None:
+            in_flight.append((pack, pool.submit(_generate_task_pack, pack)))
+
+    try:
+        for _ in range(2 * concurrency):
+            submit_next()
+        while in_flight:
+            pack, future = in_flight.popleft()
+            results = future.result()
+            submit_next()
+            yield from zip(pack, results)
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
 # ==================== Main script ====================
 
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Generate trainingTasks for every form in the public configs into the task dataset.")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=1,
+        help="number of forms to request in parallel (default: 1, i.e. serial); output order is unchanged",
+    )
+    parser.add_argument(
+        "--generator",
+        choices=["llm", "template"],
+        default="llm",
+        help="'llm' asks gpt-4o; 'template' builds instructions from phrase templates per field type with no API "
+        "calls (template_instructions.py), for bulk and load-test data (default: llm)",
+    )
+    parser.add_argument(
+        "--fallback",
+        choices=["none", "template"],
+        default="none",
+        help="'template' gives forms whose LLM call fails template instructions instead of none; "
+        "the next LLM run replaces them (default: none)",
+    )
+    parser.add_argument(
+        "--pack",
+        type=int,
+        default=1,
+        metavar="N",
+        help="put up to N forms in one request with a per-form keyed output (default: 1, i.e. one form per "
+        "request); forms without valid instructions in the packed response are re-requested on their own",
+    )
+    parser.add_argument(
+        "--pack-max-tokens",
+        type=int,
+        default=DEFAULT_PACK_MAX_TOKENS,
+        help=f"estimated prompt + completion tokens per packed request (default: {DEFAULT_PACK_MAX_TOKENS})",
+    )
+    parser.add_argument(
+        "--checkpoint-every",
+        type=int,
+        default=10,
+        help="atomically save the task dataset after this many forms get new tasks (default: 10); "
+        "an interrupted run resumes where the last checkpoint left off",
+    )
+    parser.add_argument(
+        "--tasks-dir",
+        default=DEFAULT_TASKS_DIR,
+        help=f"sharded JSONL dataset the tasks are written to, see task_dataset.py (default: {DEFAULT_TASKS_DIR})",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="regenerate every form's trainingTasks, even when its fields, groundTruth, inputToLLM and masks are unchanged",
+    )
+    parser.add_argument(
+        "--fidelity",
+        choices=["off", "flag", "retry"],
+        default="flag",
+        help="check each instruction against groundTruth and its maskedFields (see fidelity_check.py): 'flag' "
+        "reports tasks that leave out or leak values, 'retry' re-requests them once and also repairs failing "
+        "stored tasks (default: flag)",
+    )
+    add_batch_arguments(parser)
+    add_cache_arguments(parser)
+    add_metrics_arguments(parser)
+    args = parser.parse_args(argv)
+    if args.concurrency < 1:
+        parser.error("--concurrency must be >= 1")
+    if args.checkpoint_every < 1:
+        parser.error("--checkpoint-every must be >= 1")
+    if args.pack < 1:
+        parser.error("--pack must be >= 1")
+    if args.generator == "template" and (args.pack > 1 or args.batch_export or args.batch_ingest or args.fidelity == "retry"):
+        parser.error("--generator template makes no API calls; drop --pack, batch files and --fidelity retry")
+    if args.pack > 1 and (args.batch_export or args.batch_ingest):
+        parser.error("--pack needs live API calls for its single-form fallback; batch files hold one form per request")
+    if args.fidelity == "retry" and (args.batch_export or args.batch_ingest):
+        parser.error("--fidelity retry needs live API calls; use --fidelity flag with batch files")
+    return args
+
+
 def main():
+    global response_cache, metrics, batch_results, fidelity_mode, generator_mode
+
+    args = parse_args()
+    fidelity_mode = args.fidelity
+    generator_mode = args.generator
+    response_cache = cache_from_args(args)
+    metrics = metrics_from_args(args, "generate_synthetic_task")
+    batch_results = batch_results_from_args(args)
+    batch_writer = BatchRequestWriter(args.batch_export) if args.batch_export else None
+
     manual_config_file = "public/manual_config.json"
     llm_config_file = "public/llm_generated_config.json"
 
@@ -152,6 +581,21 @@ def main():
     else:
         print(f"No LLM-generated config found at {llm_config_file}, continuing with empty LLM set.")
 
+    # ---- Load tasks; any still embedded in a config move to the dataset on the next save ----
+    dataset = TaskDataset(args.tasks_dir)
+    print(f"Loaded tasks of {len(dataset)} forms from {args.tasks_dir}")
+    embedded: Set[str] = set()
+    for name, config in (("manual", manual_config), ("llm", llm_config)):
+        if dataset.adopt_embedded(name, config):
+            embedded.add(name)
+    if embedded:
+        print(f"Moving trainingTasks embedded in the {' and '.join(sorted(embedded))} config into {args.tasks_dir}")
+    # Forms deleted from a config lose their tasks; a config that is missing keeps them
+    loaded = {name for name, path in (("manual", manual_config_file), ("llm", llm_config_file)) if os.path.exists(path)}
+    dropped = dataset.prune(loaded, set(manual_config) | set(llm_config))
+    if dropped:
+        print(f"Dropping tasks of {len(dropped)} forms no longer in the configs: {', '.join(dropped)}")
+
     # Collect all forms (ordered) as (source_name, source_dict, form_id)
     forms_index: List[tuple[str, Dict[str, Any], str]] = []
     for fid in sorted(manual_config.keys(), key=lambda x: int(x) if x.isdigit() else x):
@@ -166,91 +610,149 @@ def main():
 
     tasks_per_form = 5
     total_tasks = total_forms * tasks_per_form
-    num_masked = max(1, int(total_tasks * 0.1))  # ~10%
 
     print(f"Total forms: {total_forms}")
     print(f"Total training tasks: {total_tasks}")
-    print(f"Number of masked tasks (~10%): {num_masked}")
-
-    # ---- Choose which global tasks are masked ----
-    random.seed(42)  # reproducible
-    all_task_indices = list(range(total_tasks))  # 0..total_tasks-1
-    masked_global_indices = set(random.sample(all_task_indices, num_masked))
-
-    # ---- For each form, compute mask flags and generate instructions ----
-    global_task_counter = 0
 
+    # ---- Masks come from a hash of form ID, task ID and groundTruth keys, so other forms never shift them ----
+    plans: List[TaskPlan] = []
     for (source_name, source_dict, form_id) in forms_index:
         form = source_dict[form_id]
-        print(f"\nProcessing form {form_id} ({source_name}) - {form.get('title', '')}")
-
-        # Some forms may already have trainingTasks; we overwrite them
-        if "trainingTasks" in form:
-            print("  Note: form already has trainingTasks, they will be overwritten.")
-
-        # Determine mask_flags and maskedFields for this form's 5 tasks
-        # We will mask fields from groundTruth keys
-        gt = form.get("groundTruth", {})
-        field_ids = list(gt.keys())
-
-        mask_flags: List[bool] = []
-        masked_fields_per_task: List[List[str]] = []
-
-        for i in range(tasks_per_form):
-            global_index = global_task_counter
-            global_task_counter += 1
+        # We mask fields from groundTruth keys
+        field_ids = list(form.get("groundTruth", {}).keys())
+        mask_flags, masked_fields_per_task = task_masks(form_id, field_ids, tasks_per_form)
+        plans.append(TaskPlan(source_name, source_dict, form_id, mask_flags, masked_fields_per_task))
+
+    num_masked = sum(sum(plan.mask_flags) for plan in plans)
+    print(f"Number of masked tasks (target {MASK_RATIO:.0%}): {num_masked} ({num_masked / total_tasks:.1%})")
+
+    # Forms whose stored tasks match their current inputs keep them (and their masks)
+    if not args.force:
+        stale = []
+        repairs = 0
+        for plan in plans:
+            stored = dataset.get(plan.form_id)
+            if not keeps_stored_tasks(plan.form, stored, args.generator, tasks_per_form):
+                stale.append(plan)
+            elif args.fidelity == "retry":
+                # Repairs keep the stored masks, which may predate the current mask scheme
+                previous = [task["instruction"] for task in stored.tasks]
+                mask_flags, masked_fields_per_task = stored_masks(stored.tasks)
+                if check_instructions(plan.form, previous, masked_fields_per_task):
+                    plan.mask_flags, plan.masked_fields_per_task = mask_flags, masked_fields_per_task
+                    plan.previous = previous
+                    stale.append(plan)
+                    repairs += 1
+        if len(stale) < len(plans):
+            print(f"Skipping {len(plans) - len(stale)} forms whose trainingTasks are up to date (--force regenerates them)")
+        if repairs:
+            print(f"Repairing failing stored tasks in {repairs} forms (--fidelity retry)")
+        plans = stale
+        print(f"Forms to generate: {len(plans)}")
+
+    if batch_writer is not None:
+        for plan in plans:
+            batch_writer.add(plan.custom_id, build_instruction_request(plan.form, plan.mask_flags, plan.masked_fields_per_task))
+            print(f"  ⇢ Exported request {plan.custom_id}")
+        batch_writer.close()
+        print(f"\n✓ Wrote {batch_writer.count} batch requests to {args.batch_export}; tasks and configs left unchanged")
+        print("  Submit it to the Batch API, then ingest the results file with:")
+        print("  python generate_synthetic_task.py --batch-ingest RESULTS.jsonl")
+        print("  Masks are re-derived from each form's ID and groundTruth keys on ingest, so do not edit those in between.")
+        return
 
-            masked = global_index in masked_global_indices
-            mask_flags.append(masked)
+    if args.concurrency > 1:
+        print(f"Concurrency: {args.concurrency} {'packs' if args.pack > 1 else 'forms'} in flight")
+    if args.pack > 1:
+        packs = pack_plans(plans, args.pack, args.pack_max_tokens)
+        print(f"Packing up to {args.pack} forms (≈{args.pack_max_tokens} tokens) per request: "
+              f"{len(packs)} requests for {len(plans)} forms")
+
+    # ---- Checkpoints: atomically rewrite the shards that gained tasks, then strip any embedded ones ----
+    config_files = {"manual": manual_config_file, "llm": llm_config_file}
+    configs = {"manual": manual_config, "llm": llm_config}
+    added = 0
+
+    def checkpoint() -> None:
+        if dataset.dirty:
+            dataset.save()
+        # Configs lose their embedded tasks only once the dataset holds them
+        for name in sorted(embedded):
+            write_json_atomic(config_files[name], configs[name])
+            print(f"  ✓ Removed embedded trainingTasks from {config_files[name]}")
+        embedded.clear()
+
+    # ---- Generate instructions; results arrive in form order whatever the concurrency ----
+    since_checkpoint = 0
+    unfaithful_tasks = 0
+    try:
+        for plan, result in run_task_plans(plans, args.concurrency, args.pack, args.pack_max_tokens):
+            form_id = plan.form_id
+            form = plan.form
+            mask_flags = plan.mask_flags
+            masked_fields_per_task = plan.masked_fields_per_task
+            print(f"\nProcessing form {form_id} ({plan.source_name}) - {form.get('title', '')}")
+
+            # Some forms may already have tasks; we overwrite them
+            if form_id in dataset:
+                print("  Note: form already has trainingTasks, they will be overwritten.")
+
+            generator = args.generator
+            if isinstance(result, Exception) and args.fallback == "template":
+                print(f"  ✗ Error generating instructions for form {form_id}: {result}; using template instructions")
+                result = template_instructions(form, mask_flags, masked_fields_per_task)
+                generator = "template"
+            if isinstance(result, Exception):
+                print(f"  ✗ Error generating instructions for form {form_id}: {result}")
+                # skip adding trainingTasks if generation fails
+                continue
+            instructions = result
+
+            if args.fidelity != "off":
+                failing = check_instructions(form, instructions, masked_fields_per_task)
+                for issues in failing.values():
+                    for issue in issues:
+                        print(f"  ⚠ {issue.task_id}: {'mentions masked' if issue.kind == 'leak' else 'leaves out'} {issue.field_id}")
+                unfaithful_tasks += len(failing)
+
+            training_tasks = build_training_tasks(instructions, mask_flags, masked_fields_per_task)
+            fingerprint = task_fingerprint(form, mask_flags, masked_fields_per_task, generator)
+            dataset.put(form_id, plan.source_name, training_tasks, fingerprint)
+            added += 1
+
+            print(f"  ✓ Added trainingTasks (5) to form {form_id}")
+            masked_count = sum(mask_flags)
+            if masked_count:
+                print(f"    Masked tasks in this form: {masked_count} (global masked fields: {masked_fields_per_task})")
+
+            since_checkpoint += 1
+            if since_checkpoint >= args.checkpoint_every:
+                checkpoint()
+                since_checkpoint = 0
+                print("  ✓ Checkpoint saved")
+    except KeyboardInterrupt:
+        checkpoint()
+        print("\n⚠ Interrupted. Finished forms are saved; rerun to generate the rest.")
+        sys.exit(130)
+
+    # ---- Save the dataset ----
+    checkpoint()
+    if added:
+        print(f"\nSaved tasks of {added} forms to {args.tasks_dir}")
+    elif dropped:
+        print(f"\nRemoved the tasks of {len(dropped)} dropped forms from {args.tasks_dir}")
+    else:
+        print(f"\nNo new tasks; left {args.tasks_dir} untouched")
 
-            if masked and field_ids:
-                # choose 1–min(3, len(field_ids)) fields to omit in this task
-                num_to_mask = min(len(field_ids), max(1, len(field_ids) // 3))
-                masked_fields = random.sample(field_ids, num_to_mask)
-            else:
-                masked_fields = []
-
-            masked_fields_per_task.append(masked_fields)
-
-        # Call LLM to generate 5 instructions for this form
-        try:
-            instructions = generate_instructions_for_form(form, mask_flags, masked_fields_per_task)
-        except Exception as e:
-            print(f"  ✗ Error generating instructions for form {form_id}: {e}")
-            # skip adding trainingTasks if generation fails
-            continue
-
-        # Build trainingTasks array
-        training_tasks = []
-        for i in range(tasks_per_form):
-            training_tasks.append({
-                "id": f"task_{i+1}",
-                "instruction": instructions[i],
-                "masked": mask_flags[i],
-                "maskedFields": masked_fields_per_task[i],
-            })
-
-        form["trainingTasks"] = training_tasks
-        source_dict[form_id] = form
-
-        print(f"  ✓ Added trainingTasks (5) to form {form_id}")
-        masked_count = sum(mask_flags)
-        if masked_count:
-            print(f"    Masked tasks in this form: {masked_count} (global masked fields: {masked_fields_per_task})")
-
-    # ---- Save back configs ----
-    os.makedirs("public", exist_ok=True)
-
-    with open(manual_config_file, "w", encoding="utf-8") as f:
-        json.dump(manual_config, f, indent=2, ensure_ascii=False)
-    print(f"\nSaved updated manual forms to {manual_config_file}")
-
-    with open(llm_config_file, "w", encoding="utf-8") as f:
-        json.dump(llm_config, f, indent=2, ensure_ascii=False)
-    print(f"Saved updated LLM forms to {llm_config_file}")
-
-    print("\nAll done. Each form now has a trainingTasks array with 5 tasks.")
+    print(f"\nAll done. Each form now has 5 training tasks in {args.tasks_dir}.")
     print("All tasks share the same groundTruth values; ~10% of tasks have masked fields.")
+    if unfaithful_tasks:
+        print(f"⚠ {unfaithful_tasks} saved tasks leave out or leak groundTruth values; "
+              "see python fidelity_check.py, or rerun with --fidelity retry")
+
+    if response_cache is not None:
+        response_cache.print_stats()
+    exit_on_replay_misses(response_cache)
 
 
 if __name__ == "__main__":
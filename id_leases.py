@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Lease-based form ID allocation for running several generate_pages.py workers
+against one shared store.
+
+Workers claim ranges of form IDs from a JSON lease table guarded by a POSIX
+file lock, so it can live on a shared filesystem (NFSv4, or NFSv3 with lockd).
+A lease expires unless its worker keeps renewing it; expired ranges, and
+ranges with forms that failed, are handed to the next worker that asks. Each
+worker commits to its own shard (`<store>/shards/<worker>/`), and `merge`
+folds every shard into the public JSON once the workers are done.
+
+    python generate_pages.py 20 --worker build1.0 --store /shared/.form_store/llm_generated_config
+    python id_leases.py status [--leases FILE]
+    python id_leases.py merge  [--leases FILE] [--store DIR] [--output FILE] [--keep] [--force]
+"""
+
+import argparse
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from form_store import (
+    DEFAULT_OUTPUT_FILE,
+    DEFAULT_STORE_DIR,
+    FormStore,
+    compact_stores,
+    shard_dir,
+    shard_workers,
+    write_json_atomic,
+)
+
+DEFAULT_LEASE_FILE = os.path.join(os.path.dirname(DEFAULT_STORE_DIR), "leases.json")
+DEFAULT_LEASE_TTL = 600.0
+DEFAULT_MAX_ATTEMPTS = 3
+
+LEASED = "leased"
+FAILED = "failed"
+
+
+def lease_file_for(store_dir: str) -> str:
+    """The lease table kept next to a store directory, so workers sharing a store share its leases."""
+    return os.path.join(os.path.dirname(os.path.normpath(store_dir)) or ".", "leases.json")
+
+
+@dataclass
+class Lease:
+    """A claimed range of form IDs. `ids` are the IDs still to generate."""
+    lease_id: str
+    start: int
+    size: int
+    ids: List[str]
+    attempts: int
+    reclaimed: bool = False
+
+
+class LeaseTable:
+    """
+    Shared table of ID-range leases.
+
+    Every operation reads, updates and atomically rewrites the JSON file while
+    holding an exclusive lock on `<path>.lock`. Ranges that finish cleanly are
+    dropped from the table; `next_id` always points past every range ever
+    handed out, so IDs are never allocated twice.
+    """
+
+    def __init__(
+        self,
+        path: str = DEFAULT_LEASE_FILE,
+        ttl: float = DEFAULT_LEASE_TTL,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+    ):
+        if fcntl is None:
+            raise RuntimeError("Lease-based ID allocation needs POSIX file locks (fcntl), which this platform lacks")
+        self.path = path
+        self.ttl = ttl
+        self.max_attempts = max_attempts
+        # Distinguishes this process from an earlier, crashed worker with the same name
+        self.token = uuid.uuid4().hex
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    @contextmanager
+    def _locked(self) -> Iterator[Dict[str, Any]]:
+        with open(self.path + ".lock", "a+") as lock_file:
+            fcntl.lockf(lock_file, fcntl.LOCK_EX)
+            try:
+                state = {"next_id": 1, "leases": {}}
+                if os.path.exists(self.path):
+                    with open(self.path, "r", encoding="utf-8") as f:
+                        state = json.load(f)
+                before = json.dumps(state, sort_keys=True)
+                yield state
+                if json.dumps(state, sort_keys=True) != before:
+                    write_json_atomic(self.path, state)
+            finally:
+                fcntl.lockf(lock_file, fcntl.LOCK_UN)
+
+    def _claimable(self, lease: Dict[str, Any], worker: str, now: float) -> bool:
+        if lease["status"] == FAILED:
+            return lease["attempts"] < self.max_attempts
+        if lease["worker"] == worker and lease["token"] != self.token:
+            return True  # left behind by an earlier run of this worker
+        return lease["expires"] < now
+
+    def claim(self, worker: str, size: int, floor: int = 1) -> Lease:
+        """
+        Claim the lowest reclaimable range (expired, failed, or left by an
+        earlier run of `worker`), or else `size` fresh IDs starting no lower
+        than `floor`.
+        """
+        now = time.time()
+        with self._locked() as state:
+            candidates = [
+                (lease["start"], lease_id)
+                for lease_id, lease in state["leases"].items()
+                if self._claimable(lease, worker, now)
+            ]
+            reclaimed = bool(candidates)
+            if reclaimed:
+                lease_id = min(candidates)[1]
+                lease = state["leases"][lease_id]
+            else:
+                start = max(state["next_id"], floor)
+                state["next_id"] = start + size
+                lease_id = str(start)
+                lease = state["leases"][lease_id] = {
+                    "start": start,
+                    "size": size,
+                    "ids": [str(n) for n in range(start, start + size)],
+                    "attempts": 0,
+                }
+            lease.update(
+                status=LEASED,
+                worker=worker,
+                token=self.token,
+                host=socket.gethostname(),
+                pid=os.getpid(),
+                expires=now + self.ttl,
+                attempts=lease["attempts"] + 1,
+            )
+            return Lease(lease_id, lease["start"], lease["size"], list(lease["ids"]), lease["attempts"], reclaimed)
+
+    def renew(self, worker: str) -> int:
+        """Extend every lease this process holds; returns how many were renewed."""
+        now = time.time()
+        renewed = 0
+        with self._locked() as state:
+            for lease in state["leases"].values():
+                if lease["status"] == LEASED and lease["worker"] == worker and lease["token"] == self.token:
+                    lease["expires"] = now + self.ttl
+                    renewed += 1
+        return renewed
+
+    def holds(self, worker: str, lease_id: str) -> bool:
+        """True if this process still holds `lease_id` (it has not expired and been reclaimed)."""
+        with self._locked() as state:
+            lease = state["leases"].get(lease_id)
+            return (
+                lease is not None
+                and lease["status"] == LEASED
+                and lease["worker"] == worker
+                and lease["token"] == self.token
+            )
+
+    def complete(self, worker: str, lease_id: str, failed: Optional[Dict[str, str]] = None) -> None:
+        """
+        Finish a lease. A clean range is dropped from the table; a range with
+        failed forms keeps just those IDs so another claim can retry them.
+        """
+        with self._locked() as state:
+            lease = state["leases"].get(lease_id)
+            if lease is None or lease["worker"] != worker or lease["token"] != self.token:
+                return
+            if failed:
+                lease.update(status=FAILED, ids=[i for i in lease["ids"] if i in failed], errors=failed)
+            else:
+                del state["leases"][lease_id]
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._locked() as state:
+            return json.loads(json.dumps(state))
+
+
+class LeaseHeartbeat:
+    """Background thread that renews a worker's leases every ttl / 3 seconds."""
+
+    def __init__(self, table: LeaseTable, worker: str):
+        self.table = table
+        self.worker = worker
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="lease-heartbeat", daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.table.ttl / 3):
+            try:
+                self.table.renew(self.worker)
+            except Exception as e:
+                print(f"  ⚠ Could not renew leases: {e}")
+
+    def start(self) -> "LeaseHeartbeat":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+def active_leases(state: Dict[str, Any], now: Optional[float] = None) -> List[Dict[str, Any]]:
+    now = time.time() if now is None else now
+    return [lease for lease in state["leases"].values() if lease["status"] == LEASED and lease["expires"] >= now]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect the ID lease table or merge worker shards.")
+    parser.add_argument("command", choices=["status", "merge"])
+    parser.add_argument("--leases", default=None, help="lease table (default: leases.json next to --store)")
+    parser.add_argument("--store", default=DEFAULT_STORE_DIR, help=f"store directory (default: {DEFAULT_STORE_DIR})")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT_FILE, help=f"merged JSON file (default: {DEFAULT_OUTPUT_FILE})")
+    parser.add_argument("--keep", action="store_true", help="keep the shards after merging")
+    parser.add_argument("--force", action="store_true", help="merge even while workers hold live leases")
+    args = parser.parse_args()
+    args.leases = args.leases or lease_file_for(args.store)
+
+    state = LeaseTable(args.leases).snapshot() if os.path.exists(args.leases) else {"next_id": 1, "leases": {}}
+    live = active_leases(state)
+
+    if args.command == "status":
+        now = time.time()
+        print(f"Lease table: {args.leases}")
+        print(f"  Next ID: {state['next_id']}")
+        for lease_id, lease in sorted(state["leases"].items(), key=lambda kv: kv[1]["start"]):
+            if lease["status"] == FAILED:
+                state_text = f"failed (attempt {lease['attempts']})"
+            elif lease["expires"] < now:
+                state_text = f"expired, held by {lease['worker']}"
+            else:
+                state_text = f"held by {lease['worker']} on {lease['host']} for {lease['expires'] - now:.0f}s"
+            print(f"  {lease_id:>6s}: {', '.join(lease['ids'])} — {state_text}")
+        workers = shard_workers(args.store)
+        print(f"  Shards in {args.store}: {', '.join(workers) if workers else 'none'}")
+        return
+
+    if live and not args.force:
+        holders = sorted({lease["worker"] for lease in live})
+        parser.error(f"{len(live)} leases are still held by {', '.join(holders)}; wait for them or pass --force")
+
+    stores = [FormStore(args.store)] + [
+        FormStore(shard_dir(args.store, worker), writer=worker) for worker in shard_workers(args.store)
+    ]
+    pending = sum(len(store) for store in stores)
+    total = compact_stores(stores, args.output, keep=args.keep)
+    print(f"✓ Merged {pending} forms from {len(stores) - 1} shards into {args.output} ({total} forms total)")
+
+
+if __name__ == "__main__":
+    main()
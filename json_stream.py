@@ -0,0 +1,105 @@
+"""
+Incremental extraction of array items from a streamed JSON document.
+
+Used by generate_pages.py --stream to pull each form out of a
+{"forms": [...]} completion as soon as its closing brace arrives.
+"""
+
+import json
+from typing import Any, List, Optional
+
+
+class JsonArrayStream:
+    """
+    Feed text chunks of a JSON object; get back each object item of the
+    top-level `key` array once it is complete.
+
+        stream = JsonArrayStream("forms")
+        for chunk in chunks:
+            for form in stream.feed(chunk):
+                ...
+
+    Only tracks strings, escapes and bracket depth, so it never re-parses text
+    it has already scanned, and only keeps the chunks of the item (or key)
+    still being read, so time and memory stay linear in the response size.
+    Raises ValueError on unbalanced brackets.
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self.done = False  # True once the target array has closed
+        # Chunks from offset _parts_start on, covering any item or key not yet complete
+        self._parts: List[str] = []
+        self._parts_start = 0
+        self._pos = 0  # offset of the next character to scan
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_key: Optional[str] = None
+        self._in_array = False
+        self._item_start: Optional[int] = None
+
+    def _slice(self, start: int, end: int) -> str:
+        """Text between two offsets of the stream, both within the kept chunks."""
+        text = "".join(self._parts)
+        self._parts = [text]
+        return text[start - self._parts_start:end - self._parts_start]
+
+    def _trim(self) -> None:
+        """Drop the chunks that end before anything still needed."""
+        if self._item_start is not None:
+            needed = self._item_start
+        elif self._in_string and self._depth == 1:
+            needed = self._string_start
+        else:
+            needed = self._pos
+        drop = 0
+        for part in self._parts:
+            if self._parts_start + len(part) > needed:
+                break
+            self._parts_start += len(part)
+            drop += 1
+        del self._parts[:drop]
+
+    def feed(self, chunk: str) -> List[Any]:
+        self._parts.append(chunk)
+        base = self._pos
+        items: List[Any] = []
+
+        for j, c in enumerate(chunk):
+            i = base + j
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._last_key = self._slice(self._string_start + 1, i)
+                continue
+
+            if c == '"':
+                self._in_string = True
+                self._string_start = i
+            elif c == "{" or c == "[":
+                self._depth += 1
+                if c == "[" and self._depth == 2 and self._last_key == self.key and not self.done:
+                    self._in_array = True
+                elif c == "{" and self._in_array and self._depth == 3:
+                    self._item_start = i
+            elif c == "}" or c == "]":
+                if c == "}" and self._in_array and self._depth == 3 and self._item_start is not None:
+                    items.append(json.loads(self._slice(self._item_start, i + 1)))
+                    self._item_start = None
+                elif c == "]" and self._in_array and self._depth == 2:
+                    self._in_array = False
+                    self.done = True
+                self._depth -= 1
+                if self._depth < 0:
+                    raise ValueError(f"Unbalanced '{c}' at offset {i} in streamed JSON")
+
+        self._pos = base + len(chunk)
+        self._trim()
+        return items
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Offline batch files for the generation scripts.
+
+`--batch-export FILE` writes every planned chat completion request as one
+line of a Batch API input file instead of calling the API:
+
+    {"custom_id": "forms-27-28-29", "method": "POST", "url": "/v1/chat/completions", "body": {...}}
+
+Once the batch has run, `--batch-ingest RESULTS` reads the results file (one
+`{"custom_id", "response": {"status_code", "body"}, "error"}` line per
+request, in any order) and runs each response through the same validation,
+post-processing and saving as a live call. Custom IDs name the forms or task
+sets a request covers, so results can be matched without the request file.
+
+    python llm_batch.py summary FILE   # count requests, or results by status
+"""
+
+import argparse
+import json
+import os
+import threading
+from typing import Any, Dict, Optional, Set, Union
+
+from llm_cache import CompletionResult
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+
+
+class BatchResultError(ValueError):
+    """A batch results file has no usable response for a custom ID."""
+
+
+def request_body(request: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    The JSON body for a request: a Pydantic model passed as response_format is
+    turned into the json_schema response format that parse() would send.
+    """
+    body = dict(request)
+    response_format = body.get("response_format")
+    if isinstance(response_format, type) and hasattr(response_format, "model_json_schema"):
+        body["response_format"] = {
+            "type": "json_schema",
+            "json_schema": {"name": response_format.__name__, "strict": False, "schema": response_format.model_json_schema()},
+        }
+    return body
+
+
+class BatchRequestWriter:
+    """Appends Batch API request lines to a JSONL file. Safe to share between threads."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.count = 0
+        self._ids: Set[str] = set()
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file = open(path, "w", encoding="utf-8")
+
+    def add(self, custom_id: str, request: Dict[str, Any]) -> None:
+        line = json.dumps(
+            {"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT, "body": request_body(request)},
+            ensure_ascii=False,
+        )
+        with self._lock:
+            if custom_id in self._ids:
+                raise ValueError(f"Duplicate batch custom_id {custom_id!r}")
+            self._ids.add(custom_id)
+            self._file.write(line + "\n")
+            self.count += 1
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self) -> "BatchRequestWriter":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+
+def _parse_result(line: Dict[str, Any]) -> Union[CompletionResult, str]:
+    """A completion for a successful result line, or the error message for a failed one."""
+    error = line.get("error")
+    response = line.get("response") or {}
+    body = response.get("body") or {}
+    if error or response.get("status_code") != 200:
+        error = error or body.get("error") or {}
+        message = error.get("message") if isinstance(error, dict) else str(error)
+        return f"batch request failed (HTTP {response.get('status_code')}): {message or 'no response'}"
+
+    choices = body.get("choices") or []
+    if not choices:
+        return "batch response has no choices"
+    message = choices[0].get("message") or {}
+    content = message.get("content")
+    if content is None:
+        return f"model refused: {message.get('refusal')}" if message.get("refusal") else "batch response has no content"
+    return CompletionResult(content=content, finish_reason=choices[0].get("finish_reason"), usage=body.get("usage"))
+
+
+class BatchResults:
+    """The responses in a Batch API results (or errors) file, by custom ID."""
+
+    def __init__(self, results: Dict[str, Union[CompletionResult, str]]):
+        self.results = results
+
+    @classmethod
+    def load(cls, path: str) -> "BatchResults":
+        results: Dict[str, Union[CompletionResult, str]] = {}
+        with open(path, "r", encoding="utf-8") as f:
+            for lineno, text in enumerate(f, 1):
+                if not text.strip():
+                    continue
+                try:
+                    line = json.loads(text)
+                    custom_id = line["custom_id"]
+                except (json.JSONDecodeError, KeyError, TypeError) as e:
+                    raise ValueError(f"{path}:{lineno}: not a batch result line ({e})") from e
+                results[custom_id] = _parse_result(line)
+        return cls(results)
+
+    def __contains__(self, custom_id: str) -> bool:
+        return custom_id in self.results
+
+    def __len__(self) -> int:
+        return len(self.results)
+
+    def completion(self, custom_id: str) -> CompletionResult:
+        """The response for `custom_id`; raises BatchResultError if it is missing or failed."""
+        result = self.results.get(custom_id)
+        if result is None:
+            raise BatchResultError(f"no result for {custom_id} in the batch results file")
+        if isinstance(result, str):
+            raise BatchResultError(result)
+        return result
+
+    def failed(self) -> Dict[str, str]:
+        return {custom_id: r for custom_id, r in self.results.items() if isinstance(r, str)}
+
+
+def add_batch_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add the shared --batch-export / --batch-ingest flags."""
+    group = parser.add_argument_group("offline batch files")
+    mode = group.add_mutually_exclusive_group()
+    mode.add_argument(
+        "--batch-export",
+        metavar="FILE",
+        default=None,
+        help="write every planned request to a Batch API input JSONL file instead of calling the API",
+    )
+    mode.add_argument(
+        "--batch-ingest",
+        metavar="RESULTS",
+        default=None,
+        help="read responses from a Batch API results JSONL file instead of calling the API",
+    )
+
+
+def batch_results_from_args(args: argparse.Namespace) -> Optional[BatchResults]:
+    if not args.batch_ingest:
+        return None
+    results = BatchResults.load(args.batch_ingest)
+    print(f"Loaded {len(results)} batch results from {args.batch_ingest} ({len(results.failed())} failed)")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize a Batch API request or results file.")
+    parser.add_argument("command", choices=["summary"])
+    parser.add_argument("file", help="request or results JSONL")
+    args = parser.parse_args()
+
+    requests = 0
+    with open(args.file, "r", encoding="utf-8") as f:
+        for text in f:
+            if text.strip() and "body" in json.loads(text):
+                requests += 1
+    if requests:
+        print(f"{args.file}: {requests} requests")
+        return
+
+    results = BatchResults.load(args.file)
+    failed = results.failed()
+    print(f"{args.file}: {len(results)} results, {len(results) - len(failed)} ok, {len(failed)} failed")
+    for custom_id, error in sorted(failed.items()):
+        print(f"  ✗ {custom_id}: {error}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+"""
+Content-addressed on-disk cache for LLM chat completions.
+
+Entries are keyed by a SHA-256 of the full request (model, messages, response
+schema, sampling parameters), so any change to the prompt or the Pydantic
+schema produces a new key. Used by generate_pages.py and
+generate_synthetic_task.py when --cache-dir / --replay-only is passed.
+
+    python llm_cache.py stats [--cache-dir .llm_cache]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+DEFAULT_CACHE_DIR = ".llm_cache"
+
+
+_client: Any = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> Any:
+    """
+    The shared OpenAI client, created on first use. Loads .env and needs
+    OPENAI_API_KEY only then, so cache replays and offline tools never do.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            from dotenv import load_dotenv
+            from openai import OpenAI
+
+            load_dotenv()
+            api_key = os.getenv("OPENAI_API_KEY")
+            if not api_key:
+                raise ValueError("OPENAI_API_KEY not found. Put OPENAI_API_KEY=your-key in .env")
+            _client = OpenAI(api_key=api_key)
+        return _client
+
+
+class CacheMiss(RuntimeError):
+    """Raised in replay-only mode when a request has no cached response."""
+
+
+class StreamCancelled(Exception):
+    """Raised by a streaming callback to stop the completion early."""
+
+
+@dataclass
+class CompletionResult:
+    """The parts of a chat completion the generators use, whether live or replayed."""
+    content: str
+    finish_reason: Optional[str] = None
+    usage: Optional[Dict[str, Any]] = None
+    cached: bool = False
+
+
+def _json_default(obj: Any) -> Any:
+    # Pydantic model classes passed as response_format are keyed by their JSON schema
+    if isinstance(obj, type) and hasattr(obj, "model_json_schema"):
+        return {"pydantic_schema": obj.model_json_schema(), "name": obj.__name__}
+    raise TypeError(f"Cannot hash request value of type {type(obj).__name__}")
+
+
+def request_key(request: Dict[str, Any]) -> str:
+    """Stable hash of a chat completion request."""
+    canonical = json.dumps(request, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=_json_default)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def usage_to_dict(usage: Any) -> Optional[Dict[str, Any]]:
+    if usage is None:
+        return None
+    if hasattr(usage, "model_dump"):
+        return usage.model_dump(exclude_none=True)
+    return dict(usage)
+
+
+class ResponseCache:
+    """
+    Directory of `<key[:2]>/<key>.json` entries with size-based LRU eviction.
+
+    Hits refresh the entry's mtime, and eviction removes the oldest entries
+    until the cache fits in max_bytes. Safe to share between threads.
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_bytes: Optional[int] = None, replay_only: bool = False):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.replay_only = replay_only
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._total_bytes: Optional[int] = None
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _entries(self) -> List[Tuple[float, int, str]]:
+        """(mtime, size, path) for every entry on disk."""
+        entries = []
+        for root, _dirs, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def get(self, key: str) -> Optional[CompletionResult]:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            os.utime(path)
+        except (FileNotFoundError, json.JSONDecodeError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return CompletionResult(
+            content=entry["content"],
+            finish_reason=entry.get("finish_reason"),
+            usage=entry.get("usage"),
+            cached=True,
+        )
+
+    def put(self, key: str, result: CompletionResult, model: Optional[str] = None) -> None:
+        entry = {
+            "key": key,
+            "model": model,
+            "created": time.time(),
+            "finish_reason": result.finish_reason,
+            "usage": result.usage,
+            "content": result.content,
+        }
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        size = os.path.getsize(tmp_path)
+
+        with self._lock:
+            # An entry being overwritten no longer counts towards the total
+            try:
+                replaced = os.path.getsize(path)
+            except FileNotFoundError:
+                replaced = 0
+            os.replace(tmp_path, path)
+            self.writes += 1
+            if self._total_bytes is not None:
+                self._total_bytes += size - replaced
+            if self.max_bytes is not None:
+                self._evict()
+
+    def _evict(self) -> None:
+        # Caller holds self._lock
+        if self._total_bytes is not None and self._total_bytes <= self.max_bytes:
+            return
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _mtime, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            self.evictions += 1
+        self._total_bytes = total
+
+    def stats(self) -> Dict[str, Any]:
+        entries = self._entries()
+        lookups = self.hits + self.misses
+        return {
+            "cache_dir": self.cache_dir,
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            "writes": self.writes,
+            "evictions": self.evictions,
+            "replay_only": self.replay_only,
+        }
+
+    def print_stats(self) -> None:
+        s = self.stats()
+        print("\nLLM RESPONSE CACHE")
+        print("-" * 60)
+        print(f"  Directory : {s['cache_dir']}{' (replay-only)' if s['replay_only'] else ''}")
+        limit = f" / {s['max_bytes'] / 1e6:.1f} MB" if s["max_bytes"] else ""
+        print(f"  Entries   : {s['entries']} ({s['bytes'] / 1e6:.2f} MB{limit})")
+        print(f"  Hits      : {s['hits']}  Misses: {s['misses']}  Hit rate: {s['hit_rate'] * 100:.1f}%")
+        print(f"  Writes    : {s['writes']}  Evictions: {s['evictions']}")
+
+
+def cached_completion(
+    request: Dict[str, Any],
+    cache: Optional[ResponseCache] = None,
+    client: Any = None,
+) -> CompletionResult:
+    """
+    Run `client.beta.chat.completions.parse(**request)`, going through `cache`
+    when one is configured. `client` defaults to get_client(). In replay-only
+    mode a miss raises CacheMiss instead of calling the API. A truncated
+    response is returned (and cached) with finish_reason="length" instead of
+    raising.
+    """
+    key = request_key(request) if cache is not None else None
+    if cache is not None:
+        hit = cache.get(key)
+        if hit is not None:
+            return hit
+        if cache.replay_only:
+            raise CacheMiss(f"No cached response for request {key[:12]} (replay-only mode)")
+
+    client = client if client is not None else get_client()
+    try:
+        response = client.beta.chat.completions.parse(**request)
+    except Exception as e:
+        # parse() raises on output cut off at max_tokens; keep the partial completion
+        response = getattr(e, "completion", None)
+        if response is None or response.choices[0].finish_reason != "length":
+            raise
+    choice = response.choices[0]
+    content = choice.message.content
+    if not isinstance(content, str):
+        content = json.dumps(content)
+    result = CompletionResult(
+        content=content,
+        finish_reason=choice.finish_reason,
+        usage=usage_to_dict(getattr(response, "usage", None)),
+    )
+
+    if cache is not None:
+        cache.put(key, result, model=request.get("model"))
+    return result
+
+
+def streamed_completion(
+    request: Dict[str, Any],
+    cache: Optional[ResponseCache],
+    on_delta: Callable[[str], None],
+    client: Any = None,
+) -> CompletionResult:
+    """
+    Streaming counterpart of cached_completion: `on_delta` receives the content
+    as it arrives (a cache hit is delivered as one chunk). If `on_delta` raises
+    StreamCancelled the stream is closed, nothing is cached, and the partial
+    result is returned with finish_reason="cancelled".
+
+    Shares cache entries with cached_completion, since `stream` is not part of
+    the request key.
+    """
+    key = request_key(request) if cache is not None else None
+    if cache is not None:
+        hit = cache.get(key)
+        if hit is not None:
+            try:
+                on_delta(hit.content)
+            except StreamCancelled:
+                return CompletionResult(content=hit.content, finish_reason="cancelled", usage=hit.usage, cached=True)
+            return hit
+        if cache.replay_only:
+            raise CacheMiss(f"No cached response for request {key[:12]} (replay-only mode)")
+
+    client = client if client is not None else get_client()
+    stream = client.chat.completions.create(**request, stream=True, stream_options={"include_usage": True})
+    parts: List[str] = []
+    finish_reason = None
+    usage = None
+    try:
+        for chunk in stream:
+            if getattr(chunk, "usage", None) is not None:
+                usage = usage_to_dict(chunk.usage)
+            if not chunk.choices:
+                continue
+            choice = chunk.choices[0]
+            if choice.finish_reason:
+                finish_reason = choice.finish_reason
+            text = choice.delta.content
+            if text:
+                parts.append(text)
+                on_delta(text)
+    except StreamCancelled:
+        finish_reason = "cancelled"
+    finally:
+        close = getattr(stream, "close", None)
+        if close is not None:
+            close()
+
+    result = CompletionResult(content="".join(parts), finish_reason=finish_reason, usage=usage)
+    if cache is not None and finish_reason != "cancelled":
+        cache.put(key, result, model=request.get("model"))
+    return result
+
+
+def add_cache_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add the shared --cache-dir / --cache-max-mb / --replay-only flags."""
+    group = parser.add_argument_group("LLM response cache")
+    group.add_argument(
+        "--cache-dir",
+        default=None,
+        help=f"cache LLM responses in this directory (opt-in; e.g. {DEFAULT_CACHE_DIR})",
+    )
+    group.add_argument("--cache-max-mb", type=float, default=None, help="evict least recently used entries above this size")
+    group.add_argument(
+        "--replay-only",
+        action="store_true",
+        help="serve every request from the cache and fail on a miss (implies --cache-dir)",
+    )
+
+
+def cache_from_args(args: argparse.Namespace) -> Optional[ResponseCache]:
+    if not args.cache_dir and not args.replay_only:
+        return None
+    max_bytes = int(args.cache_max_mb * 1e6) if args.cache_max_mb else None
+    return ResponseCache(args.cache_dir or DEFAULT_CACHE_DIR, max_bytes=max_bytes, replay_only=args.replay_only)
+
+
+def exit_on_replay_misses(cache: Optional[ResponseCache]) -> None:
+    """
+    End a --replay-only run with exit status 1 if any request missed the
+    cache. Each miss already failed its own request (and was reported) so the
+    replayed results could still be saved; this makes the run fail as a whole.
+    """
+    if cache is not None and cache.replay_only and cache.misses:
+        print(f"\n✗ {cache.misses} requests had no cached response (replay-only mode)")
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect the LLM response cache.")
+    parser.add_argument("command", choices=["stats"])
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.cache_dir):
+        print(f"No cache found at {args.cache_dir}")
+        return
+    ResponseCache(args.cache_dir).print_stats()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+"""
+Per-call token, latency and retry telemetry for the generation scripts.
+
+Every LLM call is recorded as one JSON line (when --metrics-dir is given),
+and a rollup with p50/p95 latency and tokens per accepted form is printed
+when the script exits. A Prometheus text-format file with the same totals is
+written next to the JSONL stream, for node_exporter's textfile collector or a
+pushgateway.
+"""
+
+import argparse
+import atexit
+import json
+import math
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile; 0.0 for an empty list."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def cached_prompt_tokens(usage: Dict[str, Any]) -> int:
+    details = usage.get("prompt_tokens_details") or {}
+    return int(details.get("cached_tokens") or 0)
+
+
+class MetricsRecorder:
+    """
+    Collects one record per LLM call. Thread-safe.
+
+    Calls served from the local response cache are recorded but do not count
+    towards billed tokens.
+    """
+
+    def __init__(self, script: str, metrics_dir: Optional[str] = None):
+        self.script = script
+        self.metrics_dir = os.path.abspath(metrics_dir) if metrics_dir else None
+        self.started = time.monotonic()
+        self.records: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._jsonl = None
+        self.jsonl_path: Optional[str] = None
+        self.prom_path: Optional[str] = None
+        self._finished = False
+
+        if self.metrics_dir:
+            os.makedirs(self.metrics_dir, exist_ok=True)
+            stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+            self.jsonl_path = os.path.join(self.metrics_dir, f"{script}-{stamp}.jsonl")
+            self.prom_path = os.path.join(self.metrics_dir, f"{script}.prom")
+            self._jsonl = open(self.jsonl_path, "a", encoding="utf-8")
+
+    def record_call(
+        self,
+        kind: str,
+        form_ids: List[str],
+        latency: float,
+        usage: Optional[Dict[str, Any]] = None,
+        accepted_ids: Optional[List[str]] = None,
+        rejected_ids: Optional[List[str]] = None,
+        attempt: int = 0,
+        finish_reason: Optional[str] = None,
+        response_cache_hit: bool = False,
+        error: Optional[str] = None,
+    ) -> None:
+        usage = usage or {}
+        record = {
+            "ts": time.time(),
+            "script": self.script,
+            "kind": kind,
+            "form_ids": form_ids,
+            "attempt": attempt,
+            "retry": attempt > 0,
+            "latency_s": round(latency, 4),
+            "prompt_tokens": int(usage.get("prompt_tokens") or 0),
+            "completion_tokens": int(usage.get("completion_tokens") or 0),
+            "cached_prompt_tokens": cached_prompt_tokens(usage),
+            "accepted_ids": accepted_ids or [],
+            "rejected_ids": rejected_ids or [],
+            "finish_reason": finish_reason,
+            "response_cache_hit": response_cache_hit,
+            "error": error,
+        }
+        with self._lock:
+            self.records.append(record)
+            if self._jsonl is not None:
+                self._jsonl.write(json.dumps(record, ensure_ascii=False) + "\n")
+                self._jsonl.flush()
+
+    # ---------- rollup ----------
+
+    def rollup(self) -> Dict[str, Any]:
+        with self._lock:
+            records = list(self.records)
+
+        billed = [r for r in records if not r["response_cache_hit"]]
+        prompt_tokens = sum(r["prompt_tokens"] for r in billed)
+        completion_tokens = sum(r["completion_tokens"] for r in billed)
+        accepted = sum(len(r["accepted_ids"]) for r in records)
+        latencies = [r["latency_s"] for r in billed]
+        retry_records = [r for r in records if r["retry"]]
+
+        return {
+            "calls": len(records),
+            "response_cache_hits": len(records) - len(billed),
+            "retries": len(retry_records),
+            "errors": sum(1 for r in records if r["error"]),
+            "truncated": sum(1 for r in records if r["finish_reason"] == "length"),
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cached_prompt_tokens": sum(r["cached_prompt_tokens"] for r in billed),
+            "retry_tokens": sum(r["prompt_tokens"] + r["completion_tokens"] for r in retry_records
+                                if not r["response_cache_hit"]),
+            "accepted_forms": accepted,
+            "rejected_forms": sum(len(r["rejected_ids"]) for r in records),
+            "tokens_per_accepted_form": ((prompt_tokens + completion_tokens) / accepted) if accepted else 0.0,
+            "latency_p50_s": percentile(latencies, 50),
+            "latency_p95_s": percentile(latencies, 95),
+            "llm_time_s": sum(latencies),
+            "retry_time_s": sum(r["latency_s"] for r in retry_records if not r["response_cache_hit"]),
+            "wall_time_s": time.monotonic() - self.started,
+        }
+
+    def print_rollup(self) -> None:
+        r = self.rollup()
+        print("\nLLM CALL METRICS")
+        print("-" * 60)
+        print(f"  Calls          : {r['calls']} ({r['retries']} retries, {r['errors']} errors, "
+              f"{r['truncated']} truncated, {r['response_cache_hits']} from cache)")
+        print(f"  Latency        : p50 {r['latency_p50_s']:.2f}s  p95 {r['latency_p95_s']:.2f}s")
+        print(f"  Time           : wall {r['wall_time_s']:.1f}s, in LLM calls {r['llm_time_s']:.1f}s "
+              f"(retries {r['retry_time_s']:.1f}s)")
+        print(f"  Tokens         : {r['prompt_tokens']} prompt ({r['cached_prompt_tokens']} cached) + "
+              f"{r['completion_tokens']} completion; {r['retry_tokens']} spent on retries")
+        print(f"  Forms          : {r['accepted_forms']} accepted, {r['rejected_forms']} rejected")
+        print(f"  Tokens per accepted form: {r['tokens_per_accepted_form']:.0f}")
+        if self.jsonl_path:
+            print(f"  Metrics stream : {self.jsonl_path}")
+            print(f"  Prometheus     : {self.prom_path}")
+
+    def prometheus_text(self) -> str:
+        r = self.rollup()
+        label = f'script="{self.script}"'
+        lines = []
+
+        def metric(name: str, kind: str, help_text: str, value: float) -> None:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.append(f"{name}{{{label}}} {value}")
+
+        metric("formgen_llm_calls_total", "counter", "LLM calls made, including retries.", r["calls"])
+        metric("formgen_llm_retries_total", "counter", "LLM calls that were retries.", r["retries"])
+        metric("formgen_llm_errors_total", "counter", "LLM calls that failed.", r["errors"])
+        metric("formgen_llm_response_cache_hits_total", "counter", "Calls served from the local response cache.",
+               r["response_cache_hits"])
+        metric("formgen_llm_prompt_tokens_total", "counter", "Billed prompt tokens.", r["prompt_tokens"])
+        metric("formgen_llm_cached_prompt_tokens_total", "counter", "Prompt tokens served from the provider's prompt cache.",
+               r["cached_prompt_tokens"])
+        metric("formgen_llm_completion_tokens_total", "counter", "Billed completion tokens.", r["completion_tokens"])
+        metric("formgen_forms_accepted_total", "counter", "Forms or task sets that passed validation.", r["accepted_forms"])
+        metric("formgen_forms_rejected_total", "counter", "Forms or task sets that failed validation.", r["rejected_forms"])
+        metric("formgen_tokens_per_accepted_form", "gauge", "Billed tokens per accepted form.",
+               round(r["tokens_per_accepted_form"], 2))
+
+        lines.append("# HELP formgen_llm_latency_seconds LLM call latency.")
+        lines.append("# TYPE formgen_llm_latency_seconds summary")
+        lines.append(f'formgen_llm_latency_seconds{{{label},quantile="0.5"}} {r["latency_p50_s"]}')
+        lines.append(f'formgen_llm_latency_seconds{{{label},quantile="0.95"}} {r["latency_p95_s"]}')
+        lines.append(f"formgen_llm_latency_seconds_sum{{{label}}} {round(r['llm_time_s'], 4)}")
+        lines.append(f"formgen_llm_latency_seconds_count{{{label}}} {r['calls'] - r['response_cache_hits']}")
+        return "\n".join(lines) + "\n"
+
+    def finish(self) -> None:
+        """Print the rollup and write the Prometheus file. Safe to call more than once."""
+        if self._finished:
+            return
+        self._finished = True
+        if self.prom_path:
+            tmp_path = self.prom_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(self.prometheus_text())
+            os.replace(tmp_path, self.prom_path)
+        if self._jsonl is not None:
+            self._jsonl.close()
+            self._jsonl = None
+        if self.records:
+            self.print_rollup()
+
+
+def add_metrics_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--metrics-dir",
+        default=None,
+        help="write a per-call JSONL metrics stream and a Prometheus .prom file to this directory",
+    )
+
+
+def metrics_from_args(args: argparse.Namespace, script: str) -> MetricsRecorder:
+    """Create the script's recorder; its rollup is printed when the process exits."""
+    recorder = MetricsRecorder(script, args.metrics_dir)
+    atexit.register(recorder.finish)
+    return recorder
@@ -0,0 +1,439 @@
+#!/usr/bin/env python3
+"""
+Sharded JSONL dataset of training tasks, kept out of the browser configs.
+
+generate_synthetic_task.py writes each form's trainingTasks here instead of
+into public/*.json, which the frontend fetches in full on every page load.
+Training pipelines can stream the tasks without loading the form corpus.
+
+Layout of a dataset directory:
+    tasks-00003-of-00008.jsonl   one record per task, forms assigned to shards by a hash of their ID:
+                                 {"formId", "source", "taskId", "instruction", "masked", "maskedFields", "fingerprint"}
+    index.json                   shard count, per-shard record/form counts and sha256, and each form's
+                                 shard, fingerprint and task count
+
+Form IDs are unique across the manual and LLM configs (form_lint.py reports
+duplicates), so a form's tasks are keyed by its ID alone. A save rewrites
+only the shards whose forms changed, each atomically, then the index.
+
+    python task_dataset.py stats   [--tasks-dir datasets/training_tasks]
+    python task_dataset.py migrate [--tasks-dir DIR] [--stamp-fingerprints] [public/manual_config.json public/llm_generated_config.json]
+
+`migrate` also drops the tasks of forms that are no longer in their config.
+Tasks saved without a fingerprint count as stale, so the generator redoes
+them; `--stamp-fingerprints` instead records them as matching their forms'
+current inputs, once, for tasks known to be current.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import tempfile
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional, Set
+
+from form_store import _fsync_dir, write_json_atomic
+
+DEFAULT_TASKS_DIR = "datasets/training_tasks"
+DEFAULT_NUM_SHARDS = 8
+INDEX_FILE = "index.json"
+DATASET_FORMAT = 1
+
+# Which config each source name stands for
+SOURCE_CONFIG_FILES = {"manual": "public/manual_config.json", "llm": "public/llm_generated_config.json"}
+
+# The per-task keys of a trainingTasks entry, as in form_schema.TrainingTask
+TASK_KEYS = ("id", "instruction", "masked", "maskedFields")
+
+# Share of tasks with masked fields
+MASK_RATIO = 0.1
+
+
+@dataclass
+class FormTasks:
+    """One form's training tasks, in the trainingTasks shape, with the fingerprint they were generated from."""
+    source: str
+    fingerprint: Optional[str]
+    tasks: List[Dict[str, Any]]
+
+
+def source_name(config_path: str) -> str:
+    """"manual" / "llm" for the public configs, else the file name without extension."""
+    for name, path in SOURCE_CONFIG_FILES.items():
+        if os.path.normpath(config_path) == os.path.normpath(path):
+            return name
+    return os.path.splitext(os.path.basename(config_path))[0]
+
+
+def shard_name(shard: int, num_shards: int) -> str:
+    return f"tasks-{shard:05d}-of-{num_shards:05d}.jsonl"
+
+
+def _sort_key(form_id: str) -> Any:
+    return (0, int(form_id), "") if form_id.isdigit() else (1, 0, form_id)
+
+
+def form_fields_meta(form: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """id, label and type of every page field: what the prompt shows the LLM about the form."""
+    return [
+        {"id": field.get("id"), "label": field.get("label"), "type": field.get("type")}
+        for page in form.get("pages", [])
+        for field in page.get("fields", [])
+    ]
+
+
+def task_fingerprint(
+    form: Dict[str, Any],
+    mask_flags: List[bool],
+    masked_fields_per_task: List[List[str]],
+    generator: str = "llm",
+) -> str:
+    """
+    Hash of everything a form's instructions are generated from: title,
+    inputToLLM, fields, groundTruth, the mask spec and, for anything but the
+    LLM, the generator. Stored with the tasks so reruns can skip forms whose
+    inputs have not changed, while template tasks still count as stale for an
+    LLM run.
+    """
+    payload = {
+        "title": form.get("title", ""),
+        "inputToLLM": form.get("inputToLLM", ""),
+        "fields": form_fields_meta(form),
+        "groundTruth": form.get("groundTruth", {}),
+        "tasks": [[flag, fields] for flag, fields in zip(mask_flags, masked_fields_per_task)],
+    }
+    if generator != "llm":
+        payload["generator"] = generator
+    canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+
+
+def _stable_unit(*parts: str) -> float:
+    """A number in [0, 1) fixed by `parts`, the same on every run and machine."""
+    digest = hashlib.sha256("\x1f".join(parts).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") / 2 ** 64
+
+
+def task_masks(
+    form_id: str,
+    field_ids: List[str],
+    tasks_per_form: int = 5,
+    ratio: float = MASK_RATIO,
+) -> tuple[List[bool], List[List[str]]]:
+    """
+    (mask_flags, masked_fields_per_task) for one form, from hashes of the form
+    ID, task IDs and groundTruth keys only, so adding or removing other forms
+    never changes a form's masks. The form masks floor(tasks * ratio + u) of
+    its tasks for a hashed u in [0, 1), which averages to `ratio` with less
+    spread than masking each task independently. A masked task omits the
+    fields that hash lowest for it.
+    """
+    task_ids = [f"task_{i + 1}" for i in range(tasks_per_form)]
+    num_masked_tasks = int(tasks_per_form * ratio + _stable_unit("mask", form_id))
+    masked_tasks = set(sorted(task_ids, key=lambda task_id: _stable_unit("mask", form_id, task_id))[:num_masked_tasks])
+
+    mask_flags: List[bool] = []
+    masked_fields_per_task: List[List[str]] = []
+    for task_id in task_ids:
+        masked = task_id in masked_tasks
+        mask_flags.append(masked)
+        if masked and field_ids:
+            # omit about a third of the fields, at least one
+            num_to_mask = min(len(field_ids), max(1, len(field_ids) // 3))
+            ranked = sorted(field_ids, key=lambda field_id: _stable_unit("field", form_id, task_id, field_id))
+            masked_fields_per_task.append(ranked[:num_to_mask])
+        else:
+            masked_fields_per_task.append([])
+    return mask_flags, masked_fields_per_task
+
+
+def stored_masks(tasks: List[Dict[str, Any]]) -> tuple[List[bool], List[List[str]]]:
+    """(mask_flags, masked_fields_per_task) of a form's saved trainingTasks."""
+    return [bool(task.get("masked")) for task in tasks], [list(task.get("maskedFields") or []) for task in tasks]
+
+
+def has_current_tasks(
+    form: Dict[str, Any],
+    stored: Optional[FormTasks],
+    tasks_per_form: int = 5,
+    generator: str = "llm",
+) -> bool:
+    """True if `generator` wrote the form's stored tasks from its current inputs and their own masks."""
+    if stored is None or not stored.tasks or not stored.fingerprint or len(stored.tasks) != tasks_per_form:
+        return False
+    return task_fingerprint(form, *stored_masks(stored.tasks), generator=generator) == stored.fingerprint
+
+
+def keeps_stored_tasks(
+    form: Dict[str, Any],
+    stored: Optional[FormTasks],
+    generator: str = "llm",
+    tasks_per_form: int = 5,
+) -> bool:
+    """
+    True if a `generator` run leaves the form's stored tasks alone. Current
+    LLM tasks are never replaced by template ones, but current template
+    tasks are upgraded by an LLM run.
+    """
+    return has_current_tasks(form, stored, tasks_per_form) or (
+        generator == "template" and has_current_tasks(form, stored, tasks_per_form, generator="template")
+    )
+
+
+def build_training_tasks(
+    instructions: List[str],
+    mask_flags: List[bool],
+    masked_fields_per_task: List[List[str]],
+) -> List[Dict[str, Any]]:
+    """A form's trainingTasks list: task_1, task_2, ... with each instruction and its masks."""
+    return [
+        {"id": f"task_{i + 1}", "instruction": instruction, "masked": mask_flags[i], "maskedFields": masked_fields_per_task[i]}
+        for i, instruction in enumerate(instructions)
+    ]
+
+
+def _write_lines_atomic(path: str, lines: List[str]) -> str:
+    """Write text lines to a temp file, fsync it and rename it over `path`; returns the content's sha256."""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    data = "".join(line + "\n" for line in lines).encode("utf-8")
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".jsonl")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    _fsync_dir(directory)
+    return hashlib.sha256(data).hexdigest()
+
+
+class TaskDataset:
+    """
+    The tasks of every form in a dataset directory, held in memory for the
+    generator. Use iter_task_records() to stream a dataset instead.
+    """
+
+    def __init__(self, root: str = DEFAULT_TASKS_DIR, num_shards: int = DEFAULT_NUM_SHARDS):
+        self.root = root
+        self.num_shards = num_shards
+        self.forms: Dict[str, FormTasks] = {}
+        self._shard_info: Dict[int, Dict[str, Any]] = {}
+        self._dirty: Set[int] = set()
+
+        index = read_index(root)
+        if index is not None:
+            self.num_shards = index["numShards"]
+            self._shard_info = {i: info for i, info in enumerate(index["shards"])}
+        for record in iter_task_records(root):
+            entry = self.forms.get(record["formId"])
+            if entry is None:
+                entry = self.forms[record["formId"]] = FormTasks(record.get("source", ""), record.get("fingerprint"), [])
+            entry.tasks.append({key: record[key if key != "id" else "taskId"] for key in TASK_KEYS})
+
+    def shard_of(self, form_id: str) -> int:
+        digest = hashlib.sha256(form_id.encode("utf-8")).digest()
+        return int.from_bytes(digest[:8], "big") % self.num_shards
+
+    def __contains__(self, form_id: str) -> bool:
+        return form_id in self.forms
+
+    def __len__(self) -> int:
+        return len(self.forms)
+
+    def get(self, form_id: str) -> Optional[FormTasks]:
+        return self.forms.get(form_id)
+
+    def put(self, form_id: str, source: str, tasks: List[Dict[str, Any]], fingerprint: Optional[str]) -> None:
+        """Set a form's tasks (a trainingTasks list); written on the next save()."""
+        self.forms[form_id] = FormTasks(source, fingerprint, [{key: task[key] for key in TASK_KEYS} for task in tasks])
+        self._dirty.add(self.shard_of(form_id))
+
+    def remove(self, form_id: str) -> None:
+        if self.forms.pop(form_id, None) is not None:
+            self._dirty.add(self.shard_of(form_id))
+
+    def adopt_embedded(self, source: str, config: Dict[str, Any]) -> int:
+        """
+        Move trainingTasks still embedded in a loaded config into the dataset,
+        unless the dataset already has that form. Strips them from the config
+        either way and returns the number of forms changed, so the caller
+        knows to save the config. Tasks without a fingerprint keep none and
+        count as stale; see stamp_fingerprints().
+        """
+        changed = 0
+        for form_id, form in config.items():
+            tasks = form.pop("trainingTasks", None)
+            fingerprint = form.pop("trainingTasksFingerprint", None)
+            if tasks is not None or fingerprint is not None:
+                changed += 1
+                if tasks and form_id not in self.forms:
+                    self.put(form_id, source, tasks, fingerprint)
+        return changed
+
+    def stamp_fingerprints(self, config: Dict[str, Any]) -> int:
+        """
+        Stamp tasks saved before fingerprints existed with the fingerprint of
+        their form's current inputs and their own masks, so the generator
+        keeps them. Only `task_dataset.py migrate --stamp-fingerprints` calls
+        this: it vouches that those tasks still match their forms. Returns the
+        number of forms stamped.
+        """
+        stamped = 0
+        for form_id, form in config.items():
+            entry = self.forms.get(form_id)
+            if entry is not None and entry.tasks and not entry.fingerprint:
+                self.put(form_id, entry.source, entry.tasks, task_fingerprint(form, *stored_masks(entry.tasks)))
+                stamped += 1
+        return stamped
+
+    def prune(self, sources: Set[str], form_ids: Set[str]) -> List[str]:
+        """
+        Drop the tasks of forms from `sources` whose ID is not in `form_ids`,
+        i.e. forms deleted from those configs. Tasks from other sources are
+        kept, so checking a subset of the configs never drops the rest.
+        Returns the dropped IDs.
+        """
+        stale = [
+            form_id for form_id, entry in self.forms.items()
+            if entry.source in sources and form_id not in form_ids
+        ]
+        for form_id in stale:
+            self.remove(form_id)
+        return sorted(stale, key=_sort_key)
+
+    @property
+    def dirty(self) -> bool:
+        return bool(self._dirty) or not os.path.exists(os.path.join(self.root, INDEX_FILE))
+
+    def save(self) -> None:
+        """Rewrite the shards whose forms changed since the last save, then the index."""
+        by_shard: Dict[int, List[str]] = {shard: [] for shard in self._dirty}
+        for form_id in self.forms:
+            shard = self.shard_of(form_id)
+            if shard in by_shard:
+                by_shard[shard].append(form_id)
+
+        for shard, form_ids in sorted(by_shard.items()):
+            lines = []
+            for form_id in sorted(form_ids, key=_sort_key):
+                entry = self.forms[form_id]
+                for task in entry.tasks:
+                    record = {
+                        "formId": form_id,
+                        "source": entry.source,
+                        "taskId": task["id"],
+                        "instruction": task["instruction"],
+                        "masked": task["masked"],
+                        "maskedFields": task["maskedFields"],
+                        "fingerprint": entry.fingerprint,
+                    }
+                    lines.append(json.dumps(record, ensure_ascii=False))
+            name = shard_name(shard, self.num_shards)
+            sha256 = _write_lines_atomic(os.path.join(self.root, name), lines)
+            self._shard_info[shard] = {"file": name, "records": len(lines), "forms": len(form_ids), "sha256": sha256}
+        self._dirty.clear()
+
+        shards = [
+            self._shard_info.get(i) or {"file": shard_name(i, self.num_shards), "records": 0, "forms": 0, "sha256": None}
+            for i in range(self.num_shards)
+        ]
+        index = {
+            "format": DATASET_FORMAT,
+            "numShards": self.num_shards,
+            "records": sum(shard["records"] for shard in shards),
+            "shards": shards,
+            "forms": {
+                form_id: {"shard": self.shard_of(form_id), "source": entry.source, "fingerprint": entry.fingerprint, "tasks": len(entry.tasks)}
+                for form_id, entry in sorted(self.forms.items(), key=lambda item: _sort_key(item[0]))
+            },
+        }
+        write_json_atomic(os.path.join(self.root, INDEX_FILE), index)
+
+
+def read_index(root: str = DEFAULT_TASKS_DIR) -> Optional[Dict[str, Any]]:
+    path = os.path.join(root, INDEX_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def iter_task_records(root: str = DEFAULT_TASKS_DIR) -> Iterator[Dict[str, Any]]:
+    """Stream every task record, shard by shard, without loading any form config."""
+    index = read_index(root)
+    if index is not None:
+        names = [shard["file"] for shard in index["shards"]]
+    elif os.path.isdir(root):
+        names = sorted(name for name in os.listdir(root) if name.startswith("tasks-") and name.endswith(".jsonl"))
+    else:
+        names = []
+    for name in names:
+        path = os.path.join(root, name)
+        if not os.path.exists(path):
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect the training task dataset or move embedded tasks into it.")
+    parser.add_argument("command", choices=["stats", "migrate"])
+    parser.add_argument("configs", nargs="*", default=list(SOURCE_CONFIG_FILES.values()), help="configs to migrate")
+    parser.add_argument("--tasks-dir", default=DEFAULT_TASKS_DIR, help=f"dataset directory (default: {DEFAULT_TASKS_DIR})")
+    parser.add_argument(
+        "--stamp-fingerprints",
+        action="store_true",
+        help="migrate: mark tasks saved without a fingerprint as up to date with their form, instead of stale",
+    )
+    args = parser.parse_args()
+
+    dataset = TaskDataset(args.tasks_dir)
+    if args.command == "stats":
+        records = sum(len(entry.tasks) for entry in dataset.forms.values())
+        masked = sum(task["masked"] for entry in dataset.forms.values() for task in entry.tasks)
+        print(f"Dataset: {args.tasks_dir} ({dataset.num_shards} shards)")
+        print(f"  Forms:  {len(dataset)}")
+        print(f"  Tasks:  {records} ({masked} masked)")
+        return
+
+    stripped: Dict[str, Dict[str, Any]] = {}
+    sources: Set[str] = set()
+    form_ids: Set[str] = set()
+    for path in args.configs:
+        if not os.path.exists(path):
+            print(f"⚠ {path} not found, skipping")
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            config = json.load(f)
+        before = len(dataset)
+        changed = dataset.adopt_embedded(source_name(path), config)
+        if changed:
+            stripped[path] = config
+        sources.add(source_name(path))
+        form_ids.update(config)
+        print(f"  {path}: moving tasks of {len(dataset) - before} forms, stripping {changed} forms")
+        if args.stamp_fingerprints:
+            print(f"  {path}: stamped fingerprints on tasks of {dataset.stamp_fingerprints(config)} forms")
+
+    dropped = dataset.prune(sources, form_ids)
+    if dropped:
+        print(f"  Dropping tasks of {len(dropped)} forms no longer in their config: {', '.join(dropped)}")
+
+    # The dataset is saved before any config loses its tasks
+    if dataset.dirty:
+        dataset.save()
+    for path, config in stripped.items():
+        write_json_atomic(path, config)
+    print(f"✓ Dataset {args.tasks_dir}: {len(dataset)} forms; rewrote {len(stripped)} configs")
+
+
+if __name__ == "__main__":
+    main()
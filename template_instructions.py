@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Offline, template-based training instructions.
+
+Builds the same 5 first-person instructions per form that
+generate_synthetic_task.py asks gpt-4o for, from phrase templates per field
+type, the form title, field labels and groundTruth. Values are copied
+verbatim, masked fields are left out, and every choice of phrasing is seeded
+by the form and task ID, so output is reproducible. No API calls: tens of
+thousands of tasks per second, for load and scale tests of the downstream
+agent or as a fallback when the LLM is unavailable.
+
+    python template_instructions.py [public/manual_config.json ...] [--tasks-dir DIR] [--force]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import time
+from typing import Any, Dict, List, Optional
+
+from task_dataset import (
+    DEFAULT_TASKS_DIR,
+    TaskDataset,
+    build_training_tasks,
+    keeps_stored_tasks,
+    source_name,
+    task_fingerprint,
+    task_masks,
+)
+
+DEFAULT_CONFIG_FILES = ["public/manual_config.json", "public/llm_generated_config.json"]
+
+OPENERS = [
+    "I'm filling out the {title}.",
+    "I need to complete the {title}.",
+    "Here are my details for the {title}.",
+    "Please help me fill in the {title}.",
+    "I'd like to submit the {title}.",
+]
+CLOSERS = ["", "", "That's everything.", "Thanks!", "Please submit it when it's done."]
+
+# Phrase templates per field type; {label} is the lower-cased label, {Label} as written
+PHRASES: Dict[str, List[str]] = {
+    "text": ["My {label} is {value}.", "For {label}, put {value}.", "{Label}: {value}.", "Use {value} as the {label}."],
+    "textarea": ["For {label}: {value}", "Under {label}, write: {value}", "{Label}: {value}"],
+    "email": ["My email is {value}.", "You can reach me at {value}.", "Use {value} for {label}."],
+    "phone": ["My phone number is {value}.", "Call me at {value}.", "{Label}: {value}."],
+    "url": ["My {label} is {value}.", "You can find it at {value}.", "{Label}: {value}."],
+    "select": ["For {label}, choose {value}.", "My {label} is {value}.", "Select {value} as the {label}."],
+    "radio": ["For {label}, pick {value}.", "My {label} is {value}.", "Go with {value} for {label}."],
+    "multiselect": ["For {label}, select {value}.", "My {label}: {value}.", "Tick {value} under {label}."],
+    "date": ["My {label} is {value}.", "For {label}, enter {value}.", "{Label}: {value}."],
+    "time": ["The {label} is {value}.", "Set {label} to {value}.", "{Label}: {value}."],
+    "date-range": ["For {label}, it's from {start} to {end}.", "{Label}: {start} to {end}.",
+                   "The {label} runs from {start} until {end}."],
+    "number": ["My {label} is {value}.", "Enter {value} for {label}.", "{Label}: {value}."],
+    "slider": ["Set {label} to {value}.", "I'd put {label} at {value}.", "{Label}: {value}."],
+    "currency": ["My {label} is {value}.", "Put {value} for {label}.", "{Label}: {value}."],
+    "star-rating": ["I'd give {label} {value} stars.", "Rate {label} {value} out of {max}.", "{Label}: {value} stars."],
+    "home-address": ["My address is {value}.", "I live at {value}.", "{Label}: {value}."],
+    "country": ["My country is {value}.", "I'm in {value}.", "{Label}: {value}."],
+    "state": ["My state is {value}.", "I'm based in {value}.", "{Label}: {value}."],
+    "zip": ["My ZIP code is {value}.", "{Label}: {value}.", "Use {value} for {label}."],
+    "credit-card": ["My card number is {value}.", "Charge the card {value}.", "{Label}: {value}."],
+    "expiration-date": ["It expires {value}.", "The expiration date is {value}.", "{Label}: {value}."],
+    "cvv": ["The CVV is {value}.", "Security code {value}.", "{Label}: {value}."],
+    "checkbox": ["{Label}: yes.", "Check \"{Label}\".", "Please tick {label}."],
+    "switch": ["Turn on {label}.", "{Label}: on.", "Please enable {label}."],
+    "reactive-chunks": ["For {label}: {value}.", "{Label}: {value}.", "My {label}: {value}."],
+}
+OFF_PHRASES: Dict[str, List[str]] = {
+    "checkbox": ["Leave \"{Label}\" unchecked.", "{Label}: no.", "Don't tick {label}."],
+    "switch": ["Turn off {label}.", "{Label}: off.", "Leave {label} disabled."],
+}
+DEFAULT_PHRASES = ["My {label} is {value}.", "{Label}: {value}."]
+
+_PARENTHETICAL_RE = re.compile(r"\s*\([^)]*\)")
+
+
+def _label(field: Dict[str, Any]) -> str:
+    # "Satisfaction Level (1-10)" reads as "Satisfaction Level"
+    return _PARENTHETICAL_RE.sub("", str(field.get("label") or field.get("id") or "")).strip().rstrip(":?*")
+
+
+def _join(items: List[str]) -> str:
+    if len(items) <= 1:
+        return "".join(items)
+    return ", ".join(items[:-1]) + " and " + items[-1]
+
+
+def _format_value(value: Any, field: Dict[str, Any]) -> str:
+    """groundTruth value as text, copied exactly; lists joined, currency with its symbol."""
+    field_type = field.get("type")
+    if isinstance(value, list):
+        if field_type == "reactive-chunks":
+            return "; ".join(_format_chunk(item, field) for item in value)
+        return _join([str(item) for item in value])
+    if field_type == "currency" and field.get("currency") in (None, "USD"):
+        return f"${value}"
+    if field_type == "currency":
+        return f"{value} {field['currency']}"
+    return str(value)
+
+
+def _format_chunk(item: Any, field: Dict[str, Any]) -> str:
+    if not isinstance(item, dict):
+        return str(item)
+    chunk_fields = {c.get("id"): c for c in field.get("chunkFields") or []}
+    parts = []
+    for key, value in item.items():
+        if value is None or value == "":
+            continue
+        sub_field = chunk_fields.get(key, {"id": key, "label": key, "type": "text"})
+        parts.append(f"{_label(sub_field)} {_format_value(value, sub_field)}")
+    return ", ".join(parts)
+
+
+def field_sentence(field: Dict[str, Any], value: Any, rng: random.Random) -> Optional[str]:
+    """One sentence stating `value` for `field`, or None when there is nothing to say."""
+    if value is None or value == "" or value == []:
+        return None
+    field_type = field.get("type")
+    label = _label(field)
+    values = {"Label": label, "label": label.lower(), "max": field.get("maxStars") or 5}
+    if isinstance(value, bool):
+        template = rng.choice((PHRASES if value else OFF_PHRASES).get(field_type) or DEFAULT_PHRASES)
+        values["value"] = "yes" if value else "no"
+    elif field_type == "date-range" and isinstance(value, dict):
+        template = rng.choice(PHRASES["date-range"])
+        values.update(start=value.get("from", ""), end=value.get("to", ""))
+    else:
+        template = rng.choice(PHRASES.get(field_type) or DEFAULT_PHRASES)
+        values["value"] = _format_value(value, field)
+    sentence = template.format(**values)
+    return sentence[0].upper() + sentence[1:]
+
+
+def _task_rng(form_id: str, task_id: str) -> random.Random:
+    digest = hashlib.sha256(f"template\x1f{form_id}\x1f{task_id}".encode("utf-8")).digest()
+    return random.Random(int.from_bytes(digest[:8], "big"))
+
+
+def template_instructions(
+    form: Dict[str, Any],
+    mask_flags: List[bool],
+    masked_fields_per_task: List[List[str]],
+) -> List[str]:
+    """
+    The form's instructions, one per task, in the same form as
+    generate_instructions_for_form: every groundTruth value verbatim, in page
+    order, except the task's masked fields.
+    """
+    form_id = str(form.get("id", ""))
+    title = form.get("title") or "form"
+    ground_truth = form.get("groundTruth") or {}
+    fields = [field for page in form.get("pages", []) for field in page.get("fields", [])]
+    instructions = []
+    for i, masked_fields in enumerate(masked_fields_per_task[:len(mask_flags)]):
+        rng = _task_rng(form_id, f"task_{i + 1}")
+        masked = set(masked_fields)
+        sentences = [rng.choice(OPENERS).format(title=title)]
+        for field in fields:
+            if field.get("id") in masked or field.get("id") not in ground_truth:
+                continue
+            sentence = field_sentence(field, ground_truth[field["id"]], rng)
+            if sentence:
+                sentences.append(sentence)
+        closer = rng.choice(CLOSERS)
+        if closer:
+            sentences.append(closer)
+        instructions.append(" ".join(sentences))
+    return instructions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Add template-based training tasks to the task dataset without the LLM.")
+    parser.add_argument("configs", nargs="*", default=DEFAULT_CONFIG_FILES, help="config JSON files")
+    parser.add_argument("--tasks-dir", default=DEFAULT_TASKS_DIR, help=f"task dataset directory (default: {DEFAULT_TASKS_DIR})")
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="replace every form's tasks, including up-to-date LLM-written ones",
+    )
+    args = parser.parse_args()
+
+    dataset = TaskDataset(args.tasks_dir)
+    total_tasks = 0
+    started = time.monotonic()
+    for path in args.configs:
+        if not os.path.exists(path):
+            print(f"⚠ {path} not found, skipping")
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            config = json.load(f)
+
+        source = source_name(path)
+        written = 0
+        for form_id, form in config.items():
+            stored = dataset.get(form_id)
+            if not args.force and keeps_stored_tasks(form, stored, generator="template"):
+                continue
+            mask_flags, masked_fields_per_task = task_masks(form_id, list(form.get("groundTruth", {}).keys()))
+            instructions = template_instructions(form, mask_flags, masked_fields_per_task)
+            tasks = build_training_tasks(instructions, mask_flags, masked_fields_per_task)
+            dataset.put(form_id, source, tasks, task_fingerprint(form, mask_flags, masked_fields_per_task, generator="template"))
+            written += 1
+            total_tasks += len(instructions)
+        print(f"✓ {path}: template tasks for {written} of {len(config)} forms")
+
+    if dataset.dirty:
+        dataset.save()
+    elapsed = time.monotonic() - started
+    print(f"\n{total_tasks} tasks in {elapsed:.2f}s ({total_tasks / max(elapsed, 1e-9):.0f} tasks/s, including JSON I/O) -> {args.tasks_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Durable work queue for form generation.
+
+Every planned form ID is written to a SQLite file with its industry, layout,
+batch and status before any LLM call is made. An interrupted or partly failed
+run can then be finished with `python generate_pages.py --resume`, which
+regenerates exactly the pending and failed items with their original plan.
+
+    python work_queue.py status [--queue .form_store/plan.sqlite]
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+
+DEFAULT_QUEUE_FILE = ".form_store/plan.sqlite"
+
+PENDING = "pending"
+IN_PROGRESS = "in_progress"
+DONE = "done"
+FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    form_id     TEXT PRIMARY KEY,
+    form_number INTEGER NOT NULL,
+    batch_start INTEGER NOT NULL,
+    industry    TEXT NOT NULL,
+    layout      TEXT NOT NULL,
+    status      TEXT NOT NULL DEFAULT 'pending',
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    last_error  TEXT,
+    updated_at  REAL NOT NULL,
+    required_types TEXT
+);
+CREATE INDEX IF NOT EXISTS items_status ON items(status, form_number);
+"""
+
+
+@dataclass
+class WorkItem:
+    form_id: str
+    form_number: int
+    batch_start: int  # form number that identifies the planned batch
+    industry: str
+    layout: str
+    status: str = PENDING
+    attempts: int = 0
+    last_error: Optional[str] = None
+    required_types: Optional[List[str]] = None  # field types the form was asked to include (--coverage)
+
+
+class WorkQueue:
+    """
+    SQLite-backed plan of form IDs and their status.
+
+    Every status change is its own committed transaction (WAL, synchronous=FULL),
+    so the file always reflects the last finished step. Safe to share between
+    threads.
+    """
+
+    def __init__(self, path: str = DEFAULT_QUEUE_FILE):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.executescript(SCHEMA)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(items)")}
+        if "required_types" not in columns:  # queue files written before --coverage
+            self._conn.execute("ALTER TABLE items ADD COLUMN required_types TEXT")
+        self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    # ---------- planning ----------
+
+    def add_items(self, items: Iterable[WorkItem]) -> None:
+        """Record planned items. Items already in the queue keep their existing plan and status."""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO items "
+                "(form_id, form_number, batch_start, industry, layout, status, updated_at, required_types) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (i.form_id, i.form_number, i.batch_start, i.industry, i.layout, PENDING, now,
+                     json.dumps(i.required_types) if i.required_types else None)
+                    for i in items
+                ],
+            )
+
+    def max_form_number(self) -> int:
+        with self._lock:
+            row = self._conn.execute("SELECT MAX(form_number) FROM items").fetchone()
+        return row[0] or 0
+
+    # ---------- status transitions ----------
+
+    def _set_status(self, form_ids: Iterable[str], status: str, error: Optional[str] = None, attempt: bool = False) -> None:
+        ids = list(form_ids)
+        if not ids:
+            return
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE items SET status = ?, last_error = ?, updated_at = ?, attempts = attempts + ? "
+                "WHERE form_id = ?",
+                [(status, error, now, 1 if attempt else 0, form_id) for form_id in ids],
+            )
+
+    def mark_in_progress(self, form_ids: Iterable[str]) -> None:
+        self._set_status(form_ids, IN_PROGRESS, attempt=True)
+
+    def mark_done(self, form_ids: Iterable[str]) -> None:
+        self._set_status(form_ids, DONE)
+
+    def mark_failed(self, errors: Dict[str, str]) -> None:
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE items SET status = ?, last_error = ?, updated_at = ? WHERE form_id = ?",
+                [(FAILED, error, now, form_id) for form_id, error in errors.items()],
+            )
+
+    # ---------- reading ----------
+
+    def unfinished(self) -> List[WorkItem]:
+        """Pending, failed and interrupted (in_progress) items, in form-number order."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT form_id, form_number, batch_start, industry, layout, status, attempts, last_error, required_types "
+                "FROM items WHERE status != ? ORDER BY form_number",
+                (DONE,),
+            ).fetchall()
+        return [WorkItem(*row[:-1], json.loads(row[-1]) if row[-1] else None) for row in rows]
+
+    def industry_counts(self) -> Dict[str, int]:
+        """How many finished forms were planned for each industry."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT industry, COUNT(*) FROM items WHERE status = ? GROUP BY industry", (DONE,)
+            ).fetchall()
+        return dict(rows)
+
+    def status_counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM items GROUP BY status").fetchall()
+        return dict(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show the form generation work queue.")
+    parser.add_argument("command", choices=["status"])
+    parser.add_argument("--queue", default=DEFAULT_QUEUE_FILE, help=f"queue file (default: {DEFAULT_QUEUE_FILE})")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.queue):
+        print(f"No work queue at {args.queue}")
+        return
+    queue = WorkQueue(args.queue)
+    counts = Counter(queue.status_counts())
+    print(f"Work queue: {args.queue}")
+    for status in (DONE, PENDING, IN_PROGRESS, FAILED):
+        print(f"  {status:12s}: {counts.get(status, 0)}")
+    failed = [item for item in queue.unfinished() if item.status == FAILED]
+    if failed:
+        print("\nFailed items:")
+        for item in failed:
+            print(f"  {item.form_id:>6s}  attempts={item.attempts}  {item.industry} / {item.layout}: {item.last_error}")
+
+
+if __name__ == "__main__":
+    main()